@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { ordersAPI, menuAPI } from '../services/api';
 import './OrdersManagement.css';
 
@@ -8,21 +8,61 @@ const OrdersManagement = () => {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [statusFilter, setStatusFilter] = useState('all');
+  const revisionRef = useRef(null); // Last order revision seen, for incremental polling
 
   useEffect(() => {
     fetchData();
-    const interval = setInterval(fetchData, 5000); // Refresh every 5 seconds
-    return () => clearInterval(interval);
+    // Orders are pushed live; the poll only catches anything the stream missed
+    const events = ordersAPI.subscribe(
+      (order) => setOrders((current) => mergeOrders(current, [order])),
+      handleRefresh
+    );
+    const interval = setInterval(fetchData, 30000);
+    return () => {
+      events.close();
+      clearInterval(interval);
+    };
   }, []);
 
+  // Replace changed orders in place and put new ones first
+  const mergeOrders = (current, changed) => {
+    const byId = new Map(current.map((order) => [order.id, order]));
+    const added = [];
+    changed.forEach((order) => {
+      if (!byId.has(order.id)) added.unshift(order);
+      byId.set(order.id, order);
+    });
+    return [...added, ...current.map((order) => byId.get(order.id))];
+  };
+
+  const fetchOrders = async () => {
+    if (revisionRef.current === null) {
+      // Full load: most recent orders first
+      const { orders: ordersData, revision } = await ordersAPI.getPage({ sort: '-created_at', limit: 500 });
+      setOrders(ordersData);
+      revisionRef.current = revision;
+      return;
+    }
+
+    // Incremental poll: only orders changed since the last one
+    let hasMore = true;
+    while (hasMore) {
+      const changes = await ordersAPI.getChanges(revisionRef.current);
+      if (changes.orders.length > 0) {
+        setOrders((current) => mergeOrders(current, changes.orders));
+      }
+      revisionRef.current = changes.revision;
+      hasMore = changes.hasMore;
+    }
+  };
+
   const fetchData = async () => {
     try {
-      setLoading(true);
-      const [ordersData, menuData] = await Promise.all([
-        ordersAPI.getAll(),
-        menuAPI.getAll(),
+      if (revisionRef.current === null) setLoading(true);
+      const [, menuData] = await Promise.all([
+        fetchOrders(),
+        menuAPI.getAll(), // Revalidated with ETag, unchanged menu is a 304
       ]);
-      setOrders(ordersData);
       setMenuItems(menuData);
       setError(null);
     } catch (err) {
@@ -32,6 +72,11 @@ const OrdersManagement = () => {
     }
   };
 
+  const handleRefresh = () => {
+    revisionRef.current = null;
+    fetchData();
+  };
+
   const handleStatusUpdate = async (orderId, newStatus) => {
     try {
       await ordersAPI.updateStatus(orderId, newStatus);
@@ -89,7 +134,7 @@ const OrdersManagement = () => {
     <div className="orders-management">
       <div className="orders-header">
         <h2>Orders Management</h2>
-        <button className="btn btn-secondary" onClick={fetchData}>
+        <button className="btn btn-secondary" onClick={handleRefresh}>
           Refresh
         </button>
       </div>
@@ -43,12 +43,36 @@ export const menuAPI = {
 
 // Orders API
 export const ordersAPI = {
-  getAll: async () => {
-    const response = await fetch(`${API_BASE_URL}/orders/`);
+  // params: { status, customer, created_from, created_to, sort, limit, cursor }
+  getAll: async (params = {}) => {
+    const query = new URLSearchParams(params).toString();
+    const response = await fetch(`${API_BASE_URL}/orders/${query ? `?${query}` : ''}`);
     if (!response.ok) throw new Error('Failed to fetch orders');
     return response.json();
   },
 
+  // Like getAll, but also returns the X-Revision to pass to getChanges
+  getPage: async (params = {}) => {
+    const query = new URLSearchParams(params).toString();
+    const response = await fetch(`${API_BASE_URL}/orders/${query ? `?${query}` : ''}`);
+    if (!response.ok) throw new Error('Failed to fetch orders');
+    return {
+      orders: await response.json(),
+      revision: Number(response.headers.get('X-Revision')),
+    };
+  },
+
+  // Orders created or changed after a revision
+  getChanges: async (since) => {
+    const response = await fetch(`${API_BASE_URL}/orders/?since=${since}`);
+    if (!response.ok) throw new Error('Failed to fetch order changes');
+    return {
+      orders: await response.json(),
+      revision: Number(response.headers.get('X-Revision')),
+      hasMore: response.headers.get('X-More-Changes') === 'true',
+    };
+  },
+
   updateStatus: async (orderId, status) => {
     const response = await fetch(`${API_BASE_URL}/orders/${orderId}`, {
       method: 'PATCH',
@@ -64,6 +88,16 @@ export const ordersAPI = {
     return response.json();
   },
 
+  // Live order events (Server-Sent Events). Returns the EventSource; call close() to stop.
+  subscribe: (onOrder, onReset) => {
+    const source = new EventSource(`${API_BASE_URL}/orders/events`);
+    ['order.created', 'order.status_changed', 'order.cancelled'].forEach((type) => {
+      source.addEventListener(type, (event) => onOrder(JSON.parse(event.data), type));
+    });
+    source.addEventListener('reset', () => onReset());
+    return source;
+  },
+
   cancel: async (orderId) => {
     const response = await fetch(`${API_BASE_URL}/orders/${orderId}`, {
       method: 'DELETE',
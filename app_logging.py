@@ -0,0 +1,213 @@
+"""
+Structured application logging
+
+Log records are handed to a bounded in-memory queue by the calling thread
+and written to stdout by a single listener thread, so a slow log collector
+never blocks request handling (when the queue is full, records are dropped
+and counted instead). Each record is rendered as one JSON object carrying
+the correlation ID of the inbound message or request it belongs to.
+
+High-volume events can be sampled with LOG_SAMPLE_RATES, e.g.
+"message.received=0.1,message.sent=0.1". Sampling is keyed on the
+correlation ID, so a sampled conversation turn is logged completely;
+warnings and errors are never sampled.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import uuid
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+import metrics
+
+# Logging configuration
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # json or text
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+LOG_SAMPLE_RATES = os.getenv('LOG_SAMPLE_RATES', 'message.received=0.1,message.sent=0.1')
+
+# Correlation ID of the inbound message / request being handled
+correlation_id: ContextVar[Optional[str]] = ContextVar("correlation_id", default=None)
+
+log_records_dropped_total = metrics.registry.register(metrics.Counter(
+    "log_records_dropped_total", "Log records dropped because the log queue was full"
+))
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+def new_correlation_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+def get_correlation_id() -> Optional[str]:
+    return correlation_id.get()
+
+@contextmanager
+def correlation(value: Optional[str]):
+    """Bind a correlation ID to everything logged inside the block"""
+    token = correlation_id.set(value)
+    try:
+        yield value
+    finally:
+        correlation_id.reset(token)
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Parse "event=rate,event=rate" into {event: rate}"""
+    rates = {}
+    for part in spec.split(","):
+        event, _, rate = part.partition("=")
+        if event.strip() and rate.strip():
+            rates[event.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+class CorrelationFilter(logging.Filter):
+    """Stamp records with the caller's correlation ID (before they change threads)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "correlation_id"):
+            record.correlation_id = correlation_id.get()
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of the records of each sampled event"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(getattr(record, "event", None))
+        if rate is None or rate >= 1.0 or record.levelno >= logging.WARNING:
+            return True
+        key = getattr(record, "correlation_id", None)
+        if key:
+            return zlib.crc32(key.encode()) % 10_000 < rate * 10_000
+        return random.random() < rate
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, message, event, correlation_id and extra fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "message": record.getMessage(),
+            "event": getattr(record, "event", None),
+            "correlation_id": getattr(record, "correlation_id", None),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key not in entry:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines for local development"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s [%(correlation_id)s] %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not hasattr(record, "correlation_id"):
+            record.correlation_id = None
+        return super().format(record)
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking on a full queue"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message and traceback in the calling thread, where
+        # the arguments are still valid; the listener only serialises
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records_dropped_total.inc()
+
+REQUEST_ID_HEADER = b"x-request-id"
+
+class CorrelationMiddleware:
+    """
+    Pure ASGI middleware binding a correlation ID to each HTTP request
+
+    The ID comes from the client's X-Request-ID header when present (so a
+    caller can follow its request through our logs) or is generated, and is
+    echoed back in the response. Work queued by the request carries it on.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        value = None
+        for name, header in scope["headers"]:
+            if name == REQUEST_ID_HEADER:
+                value = header.decode("latin-1")[:64]
+                break
+        value = value or new_correlation_id()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", []).append((REQUEST_ID_HEADER, value.encode("latin-1")))
+            await send(message)
+
+        with correlation(value):
+            await self.app(scope, receive, send_wrapper)
+
+_listener: Optional[QueueListener] = None
+_handler: Optional[QueueHandler] = None
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, sample_rates: str = LOG_SAMPLE_RATES):
+    """Route the root logger through the log queue (idempotent)"""
+    global _listener, _handler
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(TextFormatter() if fmt == "text" else JsonFormatter())
+
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _handler = NonBlockingQueueHandler(log_queue)
+    _handler.addFilter(CorrelationFilter())
+    _handler.addFilter(SamplingFilter(parse_sample_rates(sample_rates)))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(_handler)
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging():
+    """Write out queued records and stop the listener thread"""
+    global _listener, _handler
+    if _listener is not None:
+        logging.getLogger().removeHandler(_handler)
+        _listener.stop()
+        _listener = None
+        _handler = None
@@ -0,0 +1,300 @@
+"""
+REST API and data-layer benchmarks at seeded data scales
+
+Seeds a SQLite database with 1k, 100k or 1M orders (two items each, a
+10k-customer pool, a year of created_at timestamps), then times the
+db_handler functions and the main.py endpoints against it. Every case
+reports throughput, per-call latency and SQL statements per call.
+
+Outbound WhatsApp delivery is stubbed out: these numbers are for the API
+and the database; benchmarks/load_webhook.py covers messaging.
+
+    python benchmarks/bench_api.py --scale 100k                    # run and print
+    python benchmarks/bench_api.py --scale 100k --update-baseline  # rewrite the baseline
+    python benchmarks/bench_api.py --scale 100k --compare          # exit 1 on regression
+
+Baselines live in benchmarks/baselines/api-<scale>.json. Throughput is
+machine-dependent, so compare on the machine that recorded the baseline
+(or re-record it); query counts are deterministic and comparable anywhere.
+On a shared or busy host runs drift by 20-40%, so the default throughput
+threshold is loose; pass --threshold 1 to gate on query counts alone.
+Seeded databases are cached in --data-dir (and copied before each run, so
+write cases never drift the seed).
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Tuple
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, ROOT)
+
+BASELINE_DIR = os.path.join(ROOT, "benchmarks", "baselines")
+SCALES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+CUSTOMERS = 10_000
+STATUSES = ["pending", "preparing", "out-for-delivery", "delivered", "cancelled"]
+SEED_CHUNK = 20_000
+
+# Status update cases walk each order from pending one valid transition per call
+STATUS_WALK = ["preparing", "out-for-delivery", "delivered"]
+
+def seed_database(path: str, orders: int, seed: int):
+    """Create a database with `orders` orders using bulk Core inserts"""
+    from sqlalchemy import create_engine, insert
+    from database import Base, OrderDB, OrderItemDB, RevisionCounterDB, MenuItemDB, CHANGE_COUNTER
+
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(seed)
+    started = datetime.now() - timedelta(days=365)
+    step = 365 * 24 * 3600 / orders
+
+    with engine.begin() as conn:
+        conn.execute(insert(MenuItemDB), [
+            {"name": "Margherita Pizza", "description": "Classic cheese pizza", "price": 299.0, "is_available": True, "revision": 1},
+            {"name": "Pepperoni Pizza", "description": "Spicy pepperoni pizza", "price": 349.0, "is_available": True, "revision": 2},
+            {"name": "Coke", "description": "Cold beverage", "price": 50.0, "is_available": True, "revision": 3},
+            {"name": "Garlic Bread", "description": "Crispy garlic bread", "price": 99.0, "is_available": True, "revision": 4},
+        ])
+        for first in range(1, orders + 1, SEED_CHUNK):
+            ids = range(first, min(first + SEED_CHUNK, orders + 1))
+            conn.execute(insert(OrderDB), [{
+                "id": order_id,
+                "customer_whatsapp": f"+91{rng.randrange(CUSTOMERS):010d}",
+                "status": rng.choices(STATUSES, weights=[1, 1, 1, 6, 1])[0],
+                "total_price": 648.0,
+                "created_at": started + timedelta(seconds=order_id * step),
+                "revision": order_id + 4,
+            } for order_id in ids])
+            conn.execute(insert(OrderItemDB), [
+                {"order_id": order_id, "menu_item_id": menu_item_id, "quantity": quantity}
+                for order_id in ids
+                for menu_item_id, quantity in ((1, 1), (rng.randint(2, 4), rng.randint(1, 3)))
+            ])
+        conn.execute(insert(RevisionCounterDB).values(name=CHANGE_COUNTER, value=orders + 4))
+    engine.dispose()
+
+def prepare_database(scale: str, data_dir: str, path: str, seed: int):
+    """Copy the cached seed database for `scale` to `path`, seeding it first if needed"""
+    seed_path = os.path.join(data_dir, f"seed-{scale}-{seed}.db")
+    if not os.path.exists(seed_path):
+        print(f"🌱 Seeding {SCALES[scale]:,} orders into {seed_path} ...")
+        started_at = time.perf_counter()
+        seed_database(f"{seed_path}.tmp", SCALES[scale], seed)
+        os.replace(f"{seed_path}.tmp", seed_path)
+        print(f"🌱 Seeded in {time.perf_counter() - started_at:.1f}s")
+    shutil.copyfile(seed_path, path)
+
+class QueryCounter:
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+def measure(case: Callable[[int], None], iterations: int, warmup: int, repeat: int, queries: QueryCounter) -> dict:
+    """Time `case`; the fastest of `repeat` rounds is kept to damp machine noise"""
+    for i in range(warmup):
+        case(i)
+    best = None
+    call = warmup
+    queries.count = 0
+    for _ in range(repeat):
+        timings: List[float] = []
+        started_at = time.perf_counter()
+        for _ in range(iterations):
+            call_started = time.perf_counter()
+            case(call)
+            timings.append(time.perf_counter() - call_started)
+            call += 1
+        elapsed = time.perf_counter() - started_at
+        if best is None or elapsed < best[0]:
+            best = (elapsed, sorted(timings))
+
+    elapsed, timings = best
+    return {
+        "ops_per_sec": round(iterations / elapsed, 1),
+        "mean_ms": round(elapsed / iterations * 1000, 3),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000, 3),
+        # Averaged over every round: rounds touch different rows
+        "queries_per_op": round(queries.count / (iterations * repeat), 2),
+    }
+
+def build_cases(orders: int, seed: int, calls: int) -> Tuple[Dict[str, Callable[[int], None]], Callable[[], None]]:
+    """Benchmark cases (called with the iteration number, up to `calls`) and a cleanup function"""
+    from fastapi.testclient import TestClient
+    from database import SessionLocal
+    from models import Order, OrderItem
+    import db_handler
+    import main
+
+    rng = random.Random(seed)
+    order_ids = [rng.randint(1, orders) for _ in range(10_000)]
+    customers = [f"+91{rng.randrange(CUSTOMERS):010d}" for _ in range(10_000)]
+    db = SessionLocal()
+    client = TestClient(main.app)
+    client.__enter__()  # Run startup: init_db, menu snapshot, background workers
+
+    def pick(values, i):
+        return values[i % len(values)]
+
+    def new_order(i) -> Order:
+        return Order(id=0, customer_whatsapp=pick(customers, i), status="pending", total_price=0,
+                     created_at="", items=[OrderItem(menu_item_id=1, quantity=2), OrderItem(menu_item_id=3, quantity=1)])
+
+    def checked(response, status: int = 200):
+        if response.status_code != status:
+            raise RuntimeError(f"{response.request.method} {response.request.url} -> {response.status_code}: {response.text}")
+
+    def status_walk() -> Callable[[int], Tuple[int, str]]:
+        """(order id, status) for call i over fresh pending orders, each taking STATUS_WALK in turn"""
+        created = db_handler.add_orders_bulk(db, [new_order(i) for i in range(-(-calls // len(STATUS_WALK)))])
+        db.commit()
+        order_ids = [order.id for order in created]
+        return lambda i: (order_ids[i // len(STATUS_WALK)], STATUS_WALK[i % len(STATUS_WALK)])
+
+    db_walk = status_walk()
+    api_walk = status_walk()
+
+    first_page, cursor = db_handler.list_orders(db, limit=50)
+    cases = {
+        # Data layer
+        "db.get_order": lambda i: db_handler.get_order(db, pick(order_ids, i)),
+        "db.list_orders": lambda i: db_handler.list_orders(db, limit=50),
+        "db.list_orders.status": lambda i: db_handler.list_orders(db, statuses=["pending"], descending=True, limit=50),
+        "db.list_orders.cursor": lambda i: db_handler.list_orders(
+            db, after=db_handler.decode_order_cursor(cursor), limit=50
+        ),
+        "db.get_customer_orders": lambda i: db_handler.get_customer_orders(db, pick(customers, i)),
+        "db.get_orders_changed_since": lambda i: db_handler.get_orders_changed_since(db, orders - 100, 100),
+        "db.add_order": lambda i: db_handler.add_order(db, new_order(i)),
+        "db.update_order_status": lambda i: db_handler.update_order_status(db, *db_walk(i)),
+        "db.read_menu": lambda i: db_handler.read_menu(db),
+        # HTTP API
+        "GET /menu/": lambda i: checked(client.get("/menu/")),
+        "GET /orders/": lambda i: checked(client.get("/orders/", params={"limit": 50})),
+        "GET /orders/?status": lambda i: checked(
+            client.get("/orders/", params={"status": "pending", "sort": "-created_at", "limit": 50})
+        ),
+        "POST /orders/": lambda i: checked(client.post("/orders/", json={
+            "customer_whatsapp": pick(customers, i),
+            "items": [{"menu_item_id": 1, "quantity": 2}, {"menu_item_id": 3, "quantity": 1}],
+        })),
+        "PATCH /orders/{id}": lambda i: checked(
+            client.patch(f"/orders/{api_walk(i)[0]}", json={"status": api_walk(i)[1]})
+        ),
+    }
+
+    def close():
+        db.close()
+        client.__exit__(None, None, None)
+
+    return cases, close
+
+def compare(results: dict, baseline: dict, threshold: float, max_query_increase: float) -> List[str]:
+    """Regressions of `results` against `baseline`"""
+    failures = []
+    for name, before in baseline["cases"].items():
+        after = results["cases"].get(name)
+        if after is None:
+            continue
+        if after["ops_per_sec"] < before["ops_per_sec"] * (1 - threshold):
+            failures.append(
+                f"{name}: {after['ops_per_sec']} ops/s vs baseline {before['ops_per_sec']} "
+                f"({(after['ops_per_sec'] / before['ops_per_sec'] - 1) * 100:+.1f}%)"
+            )
+        if after["queries_per_op"] > before["queries_per_op"] + max_query_increase:
+            failures.append(
+                f"{name}: {after['queries_per_op']} queries/op vs baseline {before['queries_per_op']}"
+            )
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="REST API and db_handler benchmarks")
+    parser.add_argument("--scale", choices=SCALES, default="1k")
+    parser.add_argument("--iterations", type=int, default=200, help="Timed calls per case")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3, help="Timed rounds per case (best is kept)")
+    parser.add_argument("--only", help="Run only cases whose name contains this text")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "aumne-bench"),
+                        help="Where seeded databases are cached")
+    parser.add_argument("--compare", action="store_true", help="Fail (exit 1) on regression against the baseline")
+    parser.add_argument("--threshold", type=float, default=0.30, help="Allowed throughput drop (fraction)")
+    parser.add_argument("--max-query-increase", type=float, default=0.0, help="Allowed extra queries per call")
+    parser.add_argument("--update-baseline", action="store_true", help="Write the results as the new baseline")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "bench.db")
+
+    # Configure the app before it is imported: benchmark database, no real Twilio
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACbenchmark")
+    os.environ.setdefault("TWILIO_AUTH_TOKEN", "benchmark")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")  # Keep request logs out of the results table
+    import whatsapp_service
+    whatsapp_service.send_whatsapp_message = lambda to_number, message_body: True
+    from database import engine
+
+    prepare_database(args.scale, args.data_dir, path, args.seed)
+    queries = QueryCounter(engine)
+    cases, close = build_cases(SCALES[args.scale], args.seed, args.warmup + args.iterations * args.repeat)
+    results = {
+        "scale": args.scale,
+        "orders": SCALES[args.scale],
+        "iterations": args.iterations,
+        "repeat": args.repeat,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "cases": {},
+    }
+    try:
+        print(f"\n{'case':<28} {'ops/s':>10} {'mean ms':>10} {'p95 ms':>10} {'queries':>8}")
+        for name, case in cases.items():
+            if args.only and args.only not in name:
+                continue
+            result = measure(case, args.iterations, args.warmup, args.repeat, queries)
+            results["cases"][name] = result
+            print(f"{name:<28} {result['ops_per_sec']:>10} {result['mean_ms']:>10} "
+                  f"{result['p95_ms']:>10} {result['queries_per_op']:>8}")
+    finally:
+        close()
+        engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline_path = os.path.join(BASELINE_DIR, f"api-{args.scale}.json")
+    if args.update_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(baseline_path, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"\n📝 Baseline written to {baseline_path}")
+
+    if args.compare:
+        try:
+            with open(baseline_path) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            print(f"\n❌ No baseline at {baseline_path} (record one with --update-baseline)")
+            sys.exit(2)
+        failures = compare(results, baseline, args.threshold, args.max_query_increase)
+        if failures:
+            print(f"\n❌ {len(failures)} regression(s) against {baseline_path}:")
+            for failure in failures:
+                print(f"   {failure}")
+            sys.exit(1)
+        print(f"\n✅ No regressions against {baseline_path} "
+              f"(threshold {args.threshold:.0%}, +{args.max_query_increase} queries)")
+
+if __name__ == "__main__":
+    main()
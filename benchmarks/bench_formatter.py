@@ -0,0 +1,71 @@
+"""
+Per-message cost of the WhatsApp message formatters
+
+Loads a menu of --items items into a throwaway SQLite database, then times
+each formatter with timeit. "menu (uncached)" renders the full menu text
+every call; "menu (snapshot)" is the path the bot uses, which renders once
+per menu version.
+
+    python benchmarks/bench_formatter.py --items 50 --number 20000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+def main():
+    parser = argparse.ArgumentParser(description="Message formatter benchmark")
+    parser.add_argument("--items", type=int, default=50, help="Menu items")
+    parser.add_argument("--cart", type=int, default=5, help="Distinct items in the cart / order")
+    parser.add_argument("--number", type=int, default=20000, help="Calls per formatter")
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp.name, 'bench.db')}"
+
+    from database import init_db, SessionLocal
+    from models import MenuItem, Order, OrderItem
+    import db_handler
+    import menu_cache
+    import message_formatter
+
+    init_db()
+    db = SessionLocal()
+    for i in range(args.items):
+        db_handler.add_menu_item(db, MenuItem(
+            id=0, name=f"Item {i}", description=f"Tasty item number {i}",
+            price=99.0 + i, is_available=i % 7 != 0
+        ))
+    db.close()
+
+    snapshot = menu_cache.get_menu_snapshot()
+    cart = [OrderItem(menu_item_id=item.id, quantity=2) for item in snapshot.items[:args.cart]]
+    orders = [
+        Order(id=i, customer_whatsapp="+910000000000", items=cart, status=status,
+              total_price=499.0, created_at="")
+        for i, status in enumerate(["pending", "preparing", "out-for-delivery", "delivered", "cancelled"] * 2)
+    ]
+
+    cases = [
+        ("main menu", lambda: message_formatter.format_main_menu()),
+        ("error message", lambda: message_formatter.format_error_message("invalid_order")),
+        ("menu (uncached)", lambda: message_formatter.format_menu(snapshot.items)),
+        ("menu (snapshot)", lambda: message_formatter.format_menu_snapshot(snapshot)),
+        ("order summary", lambda: message_formatter.format_order_summary(cart)),
+        ("items summary", lambda: message_formatter.format_items_summary(cart)),
+        ("order status", lambda: message_formatter.format_order_status(orders)),
+        ("cancel confirmation", lambda: message_formatter.format_cancel_confirmation(orders[0])),
+    ]
+
+    print(f"{args.items} menu items, {len(cart)} cart lines, {args.number} calls each")
+    for name, case in cases:
+        seconds = min(timeit.repeat(case, number=args.number, repeat=3))
+        print(f"{name:>20}: {seconds / args.number * 1e6:8.2f} µs/message")
+
+    tmp.cleanup()
+
+if __name__ == "__main__":
+    main()
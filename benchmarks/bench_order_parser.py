@@ -0,0 +1,91 @@
+"""
+Per-message cost of order parsing
+
+Loads a menu of --items generated dish names into a throwaway SQLite
+database, then times with timeit the old findall-based parser ("legacy",
+numbered items only) against order_parser.parse_order for numbered, named
+and misspelled messages, plus a full rebuild of the name index (paid once
+per menu version).
+
+    python benchmarks/bench_order_parser.py --items 500 --number 20000
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+ADJECTIVES = ["Spicy", "Classic", "Smoky", "Crispy", "Cheesy", "Tandoori", "Garlic", "Veggie",
+              "Paneer", "Chicken", "Mushroom", "Butter", "Masala", "Peri Peri", "Hawaiian"]
+DISHES = ["Pizza", "Burger", "Wrap", "Pasta", "Fries", "Salad", "Sandwich", "Taco", "Biryani",
+          "Noodles", "Momos", "Soup", "Shake", "Sundae", "Nachos", "Calzone", "Risotto", "Curry",
+          "Lasagna", "Quesadilla", "Kebab", "Roll", "Bowl", "Toastie", "Pie", "Dosa", "Falafel",
+          "Gnocchi", "Ramen", "Paratha", "Sliders", "Frankie", "Bruschetta", "Tikka"]
+
+def legacy_parse(message: str):
+    """The parser this module replaced, kept as the baseline"""
+    from models import OrderItem
+    return [
+        OrderItem(menu_item_id=int(item_id), quantity=int(quantity))
+        for item_id, quantity in re.findall(r'(\d+)x(\d+)', message.strip().lower())
+    ]
+
+def menu_names(count: int):
+    names = [f"{adjective} {dish}" for dish in DISHES for adjective in ADJECTIVES]
+    return [names[i] if i < len(names) else f"{names[i % len(names)]} {i // len(names) + 1}"
+            for i in range(count)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Order parser benchmark")
+    parser.add_argument("--items", type=int, default=500, help="Menu items")
+    parser.add_argument("--number", type=int, default=20000, help="Calls per case")
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp.name, 'bench.db')}"
+
+    from database import init_db, SessionLocal
+    from models import MenuItem
+    import db_handler
+    import menu_cache
+    import order_parser
+
+    init_db()
+    db = SessionLocal()
+    for name in menu_names(args.items):
+        db_handler.add_menu_item(db, MenuItem(
+            id=0, name=name, description="", price=199.0, is_available=True
+        ))
+    db.close()
+
+    snapshot = menu_cache.get_menu_snapshot()
+    names = [item.name for item in snapshot.items]
+    numbered = "1x2, 3x1, 7x4"
+    named = f"2 {names[10]}, 1 {names[200 % len(names)]}, {names[-1]} x3"
+    misspelled = f"2 {names[10].lower().replace('a', 'e', 1)}, 1 {names[-1][:-2]}s"
+
+    for message in (numbered, named, misspelled):
+        print(f"{message!r:>60} -> {order_parser.parse_order(message, snapshot)}")
+    index = order_parser.get_menu_index(snapshot)
+
+    cases = [
+        ("legacy (numbered)", lambda: legacy_parse(numbered), args.number),
+        ("numbered", lambda: order_parser.parse_order(numbered, snapshot), args.number),
+        ("named (3 items)", lambda: order_parser.parse_order(named, snapshot), args.number),
+        ("misspelled (2 items)", lambda: order_parser.parse_order(misspelled, snapshot), args.number),
+        ("fuzzy name lookup", lambda: index.match("chesy piza"), args.number),
+        ("index rebuild", lambda: order_parser.MenuIndex(snapshot), max(1, args.number // 100)),
+    ]
+
+    print(f"{args.items} menu items")
+    for name, case, number in cases:
+        seconds = min(timeit.repeat(case, number=number, repeat=3))
+        print(f"{name:>22}: {seconds / number * 1e6:10.2f} µs/call")
+
+    tmp.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+SQLite write throughput: default settings vs the tuned profile
+
+Runs the same concurrent order workload (insert an order with two items,
+then update its status) against a fresh database file for each profile
+and reports throughput and "database is locked" failures.
+
+    python benchmarks/bench_sqlite.py --threads 8 --orders 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from database import Base, OrderDB, OrderItemDB, SQLITE_PRAGMAS, WriteSerializer, configure_sqlite_engine
+
+def build_session_factory(path: str, tuned: bool):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    serializer = None
+    if tuned:
+        configure_sqlite_engine(engine, SQLITE_PRAGMAS)
+        serializer = WriteSerializer()
+        serializer.install(session_factory)
+    Base.metadata.create_all(bind=engine)
+    return engine, session_factory, serializer
+
+def place_orders(session_factory, worker: int, count: int, results: dict, lock: threading.Lock):
+    ok = locked = 0
+    for i in range(count):
+        db = session_factory()
+        try:
+            order = OrderDB(
+                customer_whatsapp=f"+91{worker:04d}{i:06d}",
+                status="pending",
+                total_price=349.0
+            )
+            db.add(order)
+            db.flush()
+            db.add_all([
+                OrderItemDB(order_id=order.id, menu_item_id=1, quantity=1),
+                OrderItemDB(order_id=order.id, menu_item_id=3, quantity=1),
+            ])
+            db.commit()
+
+            order.status = "preparing"
+            db.commit()
+            ok += 1
+        except OperationalError as e:
+            db.rollback()
+            if "locked" not in str(e):
+                raise
+            locked += 1
+        finally:
+            db.close()
+    with lock:
+        results["ok"] += ok
+        results["locked"] += locked
+
+def run_profile(name: str, tuned: bool, threads: int, orders: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, session_factory, serializer = build_session_factory(os.path.join(tmp, "bench.db"), tuned)
+        results = {"ok": 0, "locked": 0}
+        lock = threading.Lock()
+        workers = [
+            threading.Thread(target=place_orders, args=(session_factory, n, orders, results, lock))
+            for n in range(threads)
+        ]
+        started_at = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started_at
+        engine.dispose()
+
+    total = threads * orders
+    return {
+        "profile": name,
+        "transactions": results["ok"] * 2,
+        "orders_per_second": round(results["ok"] / elapsed, 1),
+        "locked_errors": results["locked"],
+        "failed_pct": round(results["locked"] / total * 100, 1),
+        "seconds": round(elapsed, 2),
+        "write_lock": serializer.stats() if serializer else None,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite profile benchmark")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--orders", type=int, default=200, help="Orders per thread")
+    args = parser.parse_args()
+
+    for name, tuned in (("default", False), ("tuned", True)):
+        result = run_profile(name, tuned, args.threads, args.orders)
+        print(
+            f"{result['profile']:>8}: {result['orders_per_second']:>8} orders/s  "
+            f"{result['locked_errors']} locked ({result['failed_pct']}%)  "
+            f"{result['seconds']}s  write lock: {result['write_lock']}"
+        )
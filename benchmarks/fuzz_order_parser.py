@@ -0,0 +1,127 @@
+"""
+Corpus and fuzz checks for the order message parser
+
+Runs every message in corpus/order_messages.jsonl against the sample menu
+and compares the parsed lines (or error key) with the expected result,
+then parses --cases random mutations of the corpus and checks that the
+parser never raises and only returns well-formed orders: merged lines,
+quantities within ORDER_MAX_QUANTITY, at most ORDER_MAX_LINES lines and
+a known error key otherwise. Exits non-zero on any failure.
+
+    python benchmarks/fuzz_order_parser.py --cases 100000 --seed 1
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+
+CORPUS = os.path.join(BENCH_DIR, "corpus", "order_messages.jsonl")
+
+# Characters mutations draw from: grammar tokens, digits, letters and a few
+# awkward code points (combining marks, RTL digits, emoji, NUL)
+ALPHABET = list("0123456789xX×*#,;+& \n\t-.abcdegiklmnoprtz") + [
+    " and ", "́", "٣", "🍕", "\x00", " ", "99999999999"
+]
+
+def load_corpus(path: str):
+    with open(path, encoding="utf-8") as corpus:
+        return [json.loads(line) for line in corpus if line.strip()]
+
+def result_of(parsed) -> dict:
+    if parsed.error:
+        return {"error": parsed.error}
+    return {"items": [[item.menu_item_id, item.quantity] for item in parsed.items]}
+
+def mutate(rng: random.Random, message: str) -> str:
+    chars = list(message)
+    for _ in range(rng.randint(1, 4)):
+        action = rng.random()
+        position = rng.randint(0, len(chars))
+        if action < 0.4 or not chars:
+            chars.insert(position, rng.choice(ALPHABET))
+        elif action < 0.7:
+            del chars[min(position, len(chars) - 1)]
+        elif action < 0.9:
+            chars[min(position, len(chars) - 1)] = rng.choice(ALPHABET)
+        else:
+            chars.extend(chars[:rng.randint(0, len(chars))])  # Repeat a prefix
+    return "".join(chars)
+
+def check_invariants(parsed) -> str:
+    """Describe what is wrong with a parse result, or return "" if it is well-formed"""
+    import order_parser
+    from message_formatter import ERROR_MESSAGES
+
+    if parsed.error:
+        if parsed.error not in ERROR_MESSAGES:
+            return f"unknown error key {parsed.error!r}"
+        if parsed.items:
+            return "items returned with an error"
+        return ""
+    if not parsed.items:
+        return "no items and no error"
+    ids = [item.menu_item_id for item in parsed.items]
+    if len(ids) != len(set(ids)):
+        return "duplicate lines were not merged"
+    if len(ids) > order_parser.ORDER_MAX_LINES:
+        return "too many lines"
+    for item in parsed.items:
+        if not 1 <= item.quantity <= order_parser.ORDER_MAX_QUANTITY:
+            return f"quantity {item.quantity} out of bounds"
+    return ""
+
+def main():
+    parser = argparse.ArgumentParser(description="Order parser corpus and fuzz checks")
+    parser.add_argument("--cases", type=int, default=20000, help="Random mutations to parse")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp.name, 'fuzz.db')}"
+
+    from database import init_db, initialize_sample_data
+    import menu_cache
+    import order_parser
+
+    init_db()
+    initialize_sample_data()
+    snapshot = menu_cache.get_menu_snapshot()
+
+    failures = 0
+    corpus = load_corpus(CORPUS)
+    for case in corpus:
+        expected = {key: value for key, value in case.items() if key != "message"}
+        actual = result_of(order_parser.parse_order(case["message"], snapshot))
+        if actual != expected:
+            failures += 1
+            print(f"corpus {case['message']!r}: expected {expected}, got {actual}")
+    print(f"corpus: {len(corpus)} messages, {failures} failures")
+
+    rng = random.Random(args.seed)
+    messages = [case["message"] or "1x2" for case in corpus]
+    fuzz_failures = 0
+    started_at = time.perf_counter()
+    for _ in range(args.cases):
+        message = mutate(rng, rng.choice(messages))
+        try:
+            problem = check_invariants(order_parser.parse_order(message, snapshot))
+        except Exception as exc:
+            problem = f"raised {exc!r}"
+        if problem:
+            fuzz_failures += 1
+            if fuzz_failures <= 20:
+                print(f"fuzz {message!r}: {problem}")
+    elapsed = time.perf_counter() - started_at
+    print(f"fuzz: {args.cases} messages in {elapsed:.2f}s, {fuzz_failures} failures")
+
+    tmp.cleanup()
+    sys.exit(1 if failures or fuzz_failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+"""
+Load test: simulated WhatsApp customers against POST /webhook/whatsapp
+
+Each virtual customer walks the conversation state machine by POSTing
+Twilio-shaped form bodies to the webhook and waiting for the bot's reply
+before sending the next message. Replies are captured by an in-process
+fake Twilio (fake_twilio.create_app), so nothing leaves the machine.
+
+Scenarios (weighted, seeded for reproducibility):
+    order   HI → 1 → ORDER → "1x2, 3x1" → CONFIRM
+    cancel  the order flow, then 4 → YES
+    status  HI → 3
+
+By default the API is started in a subprocess against a throwaway SQLite
+database and pointed at the fake Twilio; use --url to target a server you
+started yourself (with TWILIO_API_BASE pointing at --twilio-port).
+
+Reported: webhook ack and end-to-end reply latency (p50/p95/p99/max),
+message and conversation throughput, HTTP / busy / reply-timeout error
+rates, and the server's queue stats. Every run is appended to
+benchmarks/results/load_webhook.jsonl (git-ignored, local history only) and
+compared with the previous run of the same workload.
+
+    python benchmarks/load_webhook.py --customers 2000 --concurrency 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+import aiohttp
+from aiohttp import web
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import fake_twilio
+
+RESULTS_FILE = os.path.join(ROOT, "benchmarks", "results", "load_webhook.jsonl")
+
+ORDER_FLOW = ["HI", "1", "ORDER", "1x2, 3x1", "CONFIRM"]
+SCENARIOS = {
+    "order": ORDER_FLOW,
+    "cancel": ORDER_FLOW + ["4", "YES"],
+    "status": ["HI", "3"],
+}
+DEFAULT_MIX = "order=6,cancel=2,status=2"
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+def summarize(latencies: List[float]) -> dict:
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "max_ms": round(values[-1] * 1000, 2) if values else 0.0,
+    }
+
+class ReplyTracker:
+    """Counts bot replies per customer and wakes whoever waits for them"""
+
+    def __init__(self):
+        self.received: Dict[str, int] = defaultdict(int)
+        self.waiters: Dict[str, asyncio.Event] = {}
+
+    def on_message(self, message: dict):
+        to_number = (message.get("to") or "").replace("whatsapp:", "")
+        self.received[to_number] += 1
+        waiter = self.waiters.get(to_number)
+        if waiter is not None:
+            waiter.set()
+
+    async def wait_for(self, phone_number: str, count: int, timeout: float) -> bool:
+        deadline = time.perf_counter() + timeout
+        event = self.waiters.setdefault(phone_number, asyncio.Event())
+        while self.received[phone_number] < count:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return False
+            event.clear()
+            try:
+                await asyncio.wait_for(event.wait(), remaining)
+            except asyncio.TimeoutError:
+                return self.received[phone_number] >= count
+        return True
+
+class LoadTest:
+    def __init__(self, args, tracker: ReplyTracker):
+        self.args = args
+        self.tracker = tracker
+        self.ack_latencies: List[float] = []
+        self.reply_latencies: List[float] = []
+        self.errors = Counter()
+        self.messages_sent = 0
+        self.conversations = Counter()
+
+    async def post(self, session: aiohttp.ClientSession, phone_number: str, body: str) -> bool:
+        form = {
+            "From": f"whatsapp:{phone_number}",
+            "To": "whatsapp:+14155238886",
+            "Body": body,
+            "MessageSid": f"SM{uuid.uuid4().hex}",
+            "AccountSid": "ACloadtest",
+        }
+        for attempt in range(self.args.busy_retries + 1):
+            started_at = time.perf_counter()
+            try:
+                async with session.post(f"{self.args.url}/webhook/whatsapp", data=form) as response:
+                    await response.read()
+                    status = response.status
+                    retry_after = response.headers.get("Retry-After")
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                self.errors["connection"] += 1
+                return False
+            self.ack_latencies.append(time.perf_counter() - started_at)
+            if status == 200:
+                self.messages_sent += 1
+                return True
+            if status == 503:
+                # Queue full - back off like Twilio would
+                self.errors["busy"] += 1
+                await asyncio.sleep(float(retry_after or 1))
+                continue
+            self.errors[f"http_{status}"] += 1
+            return False
+        return False
+
+    async def customer(self, session: aiohttp.ClientSession, n: int, scenario: str, gate: asyncio.Semaphore):
+        phone_number = f"+1555{self.args.run_tag}{n:07d}"
+        async with gate:
+            expected = self.tracker.received[phone_number]
+            for body in SCENARIOS[scenario]:
+                sent_at = time.perf_counter()
+                if not await self.post(session, phone_number, body):
+                    self.conversations["failed"] += 1
+                    return
+                expected += 1
+                if not await self.tracker.wait_for(phone_number, expected, self.args.reply_timeout):
+                    self.errors["reply_timeout"] += 1
+                    self.conversations["failed"] += 1
+                    return
+                self.reply_latencies.append(time.perf_counter() - sent_at)
+                if self.args.think_ms:
+                    await asyncio.sleep(random.uniform(0, 2 * self.args.think_ms) / 1000)
+            self.conversations["completed"] += 1
+            self.conversations[scenario] += 1
+
+    async def run(self) -> dict:
+        rng = random.Random(self.args.seed)
+        names, weights = zip(*self.args.mix.items())
+        plan = rng.choices(names, weights=weights, k=self.args.customers)
+
+        gate = asyncio.Semaphore(self.args.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.args.concurrency)
+        timeout = aiohttp.ClientTimeout(total=30)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            started_at = time.perf_counter()
+            await asyncio.gather(*(
+                self.customer(session, n, scenario, gate) for n, scenario in enumerate(plan)
+            ))
+            elapsed = time.perf_counter() - started_at
+            server_stats = await fetch_json(session, f"{self.args.url}/webhook/whatsapp/stats")
+
+        total_posts = self.messages_sent + sum(v for k, v in self.errors.items() if k != "reply_timeout")
+        return {
+            "customers": self.args.customers,
+            "concurrency": self.args.concurrency,
+            "mix": self.args.mix,
+            "seconds": round(elapsed, 2),
+            "messages_sent": self.messages_sent,
+            "messages_per_second": round(self.messages_sent / elapsed, 1),
+            "conversations_per_second": round(self.conversations["completed"] / elapsed, 1),
+            "conversations": dict(self.conversations),
+            "ack_latency": summarize(self.ack_latencies),
+            "reply_latency": summarize(self.reply_latencies),
+            "errors": dict(self.errors),
+            "error_rate_pct": round(
+                (sum(self.errors.values()) - self.errors["busy"]) / max(1, total_posts) * 100, 3
+            ),
+            "busy_rate_pct": round(self.errors["busy"] / max(1, total_posts) * 100, 3),
+            "server_queue": server_stats,
+        }
+
+async def fetch_json(session: aiohttp.ClientSession, url: str) -> Optional[dict]:
+    try:
+        async with session.get(url) as response:
+            return await response.json()
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+        return None
+
+async def wait_until_up(url: str, timeout: float = 30.0):
+    deadline = time.perf_counter() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.perf_counter() < deadline:
+            if await fetch_json(session, f"{url}/") is not None:
+                return
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"API at {url} did not come up within {timeout:.0f}s")
+
+def spawn_api(args, workdir: str) -> subprocess.Popen:
+    """Start the API in a subprocess against a fresh database and the fake Twilio"""
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'load.db')}",
+        TWILIO_API_BASE=f"http://127.0.0.1:{args.twilio_port}",
+        TWILIO_ACCOUNT_SID="ACloadtest",
+        TWILIO_AUTH_TOKEN="loadtest",
+        TWILIO_WHATSAPP_NUMBER="whatsapp:+14155238886",
+    )
+    port = args.url.rsplit(":", 1)[-1].rstrip("/")
+    log = open(os.path.join(workdir, "api.log"), "w")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", port, "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_previous(results_file: str, result: dict) -> Optional[dict]:
+    """Most recent earlier run with the same workload"""
+    try:
+        with open(results_file) as f:
+            runs = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return None
+    workload = ("customers", "concurrency", "mix", "think_ms", "twilio_latency_ms")
+    for run in reversed(runs):
+        if all(run.get(key) == result.get(key) for key in workload):
+            return run
+    return None
+
+def print_report(result: dict, previous: Optional[dict]):
+    print(f"\n{result['customers']} customers, {result['concurrency']} concurrent, {result['seconds']}s")
+    print(f"  messages:      {result['messages_sent']} ({result['messages_per_second']}/s)")
+    print(f"  conversations: {result['conversations']} ({result['conversations_per_second']}/s)")
+    for name in ("ack_latency", "reply_latency"):
+        latency = result[name]
+        line = f"  {name:<14} p50 {latency['p50_ms']:>8} ms  p95 {latency['p95_ms']:>8} ms  " \
+               f"p99 {latency['p99_ms']:>8} ms  max {latency['max_ms']:>8} ms"
+        if previous and name in previous:
+            before = previous[name]["p95_ms"]
+            if before:
+                line += f"  (p95 {(latency['p95_ms'] - before) / before * 100:+.1f}% vs {previous.get('git')})"
+        print(line)
+    print(f"  errors:        {result['errors']} (error rate {result['error_rate_pct']}%, busy {result['busy_rate_pct']}%)")
+    if previous:
+        before = previous.get("messages_per_second") or 0
+        if before:
+            change = (result["messages_per_second"] - before) / before * 100
+            print(f"  throughput:    {change:+.1f}% vs previous run ({previous.get('git')}, {previous.get('timestamp')})")
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r} (choose from {', '.join(SCENARIOS)})")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+async def main(args):
+    tracker = ReplyTracker()
+    twilio_app = fake_twilio.create_app(
+        latency_ms=args.twilio_latency_ms, jitter_ms=args.twilio_latency_ms / 2,
+        error_rate=args.twilio_error_rate, on_message=tracker.on_message
+    )
+    runner = web.AppRunner(twilio_app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.twilio_port).start()
+
+    workdir = tempfile.TemporaryDirectory()
+    api = spawn_api(args, workdir.name) if args.spawn else None
+    try:
+        await wait_until_up(args.url)
+        result = await LoadTest(args, tracker).run()
+    finally:
+        if api is not None:
+            api.terminate()
+            api.wait()
+        await runner.cleanup()
+        workdir.cleanup()
+
+    result.update(
+        timestamp=datetime.now().isoformat(timespec="seconds"),
+        git=git_revision(),
+        seed=args.seed,
+        think_ms=args.think_ms,
+        twilio_latency_ms=args.twilio_latency_ms,
+        twilio_fake_stats=dict(twilio_app["stats"]),
+    )
+    previous = load_previous(args.results, result) if args.results else None
+    print_report(result, previous)
+
+    if args.results:
+        os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+        with open(args.results, "a") as f:
+            f.write(json.dumps(result) + "\n")
+        print(f"\n📝 Results appended to {args.results}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="WhatsApp webhook load test")
+    parser.add_argument("--customers", type=int, default=1000, help="Virtual customers in total")
+    parser.add_argument("--concurrency", type=int, default=200, help="Customers active at once")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"Scenario weights (default {DEFAULT_MIX})")
+    parser.add_argument("--think-ms", type=float, default=0, help="Mean pause between a reply and the next message")
+    parser.add_argument("--reply-timeout", type=float, default=30, help="Seconds to wait for each bot reply")
+    parser.add_argument("--busy-retries", type=int, default=3, help="Retries after a 503 from the webhook")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--url", default="http://127.0.0.1:8765", help="API base URL")
+    parser.add_argument("--no-spawn", dest="spawn", action="store_false",
+                        help="Use an API already running at --url instead of starting one")
+    parser.add_argument("--twilio-port", type=int, default=8081, help="Port for the fake Twilio API")
+    parser.add_argument("--twilio-latency-ms", type=float, default=50)
+    parser.add_argument("--twilio-error-rate", type=float, default=0.0)
+    parser.add_argument("--results", default=RESULTS_FILE, help="JSONL file to append results to ('' to skip)")
+    args = parser.parse_args()
+    # Distinct phone numbers per run, so reruns against one server don't collide
+    args.run_tag = f"{int(time.time()) % 1000:03d}"
+    asyncio.run(main(args))
@@ -1,362 +1,370 @@
-import re
-from typing import List
+import logging
+from typing import Callable, List, Mapping, Optional
+from sqlalchemy.orm import Session
 import db_handler
 import whatsapp_service
 import message_formatter
-from models import OrderItem, Order
+import menu_cache
+import order_parser
+import tracing
+from event_hub import publish_order_event
+from message_dedup import message_dedup
+from session_store import session_store
+from menu_cache import MenuSnapshot
+from models import MenuItem, OrderItem, Order
 
-def parse_order_message(message: str) -> List[OrderItem]:
+logger = logging.getLogger(__name__)
+
+@tracing.traced("order.parse")
+def parse_order_message(message: str, snapshot: Optional[MenuSnapshot] = None) -> order_parser.ParsedOrder:
     """
-    Parse order message in format: 1x2, 3x1
-    Returns list of OrderItem objects
+    Parse order message like: 1x2, 3x1 or 2 margherita, 1 coke
+    Returns the merged OrderItem lines, or an error message key
     """
-    items = []
-    
-    # Remove extra spaces and make lowercase
-    message = message.strip().lower()
-    
-    # Pattern: number x number (e.g., 1x2, 3x1)
-    pattern = r'(\d+)x(\d+)'
-    matches = re.findall(pattern, message)
-    
-    for match in matches:
-        item_id = int(match[0])
-        quantity = int(match[1])
-        items.append(OrderItem(menu_item_id=item_id, quantity=quantity))
-    
-    return items
+    return order_parser.parse_order(message, snapshot)
 
-def validate_order_items(items: List[OrderItem]) -> tuple[bool, str]:
+@tracing.traced("order.validate")
+def validate_order_items(items: List[OrderItem], menu: Optional[Mapping[int, MenuItem]] = None) -> tuple[bool, str]:
     """
-    Validate that all items exist and are available
+    Validate that all items exist and are available, in quantities of 1 to
+    ORDER_MAX_QUANTITY
     Returns (is_valid, error_message)
     """
     if not items:
         return False, "No valid items found"
     
-    db = db_handler.get_db_session()
-    try:
-        menu = db_handler.read_menu(db)
-        menu_dict = {item.id: item for item in menu}
+    menu_dict = menu if menu is not None else menu_cache.get_menu_snapshot().by_id
+    
+    for order_item in items:
+        menu_item = menu_dict.get(order_item.menu_item_id)
         
-        for order_item in items:
-            menu_item = menu_dict.get(order_item.menu_item_id)
-            
-            if not menu_item:
-                return False, f"Item #{order_item.menu_item_id} does not exist"
-            
-            if not menu_item.is_available:
-                return False, f"{menu_item.name} is currently unavailable"
+        if not menu_item:
+            return False, f"Item #{order_item.menu_item_id} does not exist"
+        
+        if not menu_item.is_available:
+            return False, f"{menu_item.name} is currently unavailable"
         
-        return True, ""
-    finally:
-        db.close()
+        if not 1 <= order_item.quantity <= order_parser.ORDER_MAX_QUANTITY:
+            return False, f"Quantity of {menu_item.name} must be between 1 and {order_parser.ORDER_MAX_QUANTITY}"
+    
+    return True, ""
 
-def calculate_order_total(items: List[OrderItem]) -> float:
+@tracing.traced("order.total")
+def calculate_order_total(items: List[OrderItem], menu: Optional[Mapping[int, MenuItem]] = None) -> float:
     """Calculate total price for order items"""
-    db = db_handler.get_db_session()
-    try:
-        menu = db_handler.read_menu(db)
-        menu_dict = {item.id: item for item in menu}
-        
-        total = 0.0
-        for order_item in items:
-            menu_item = menu_dict.get(order_item.menu_item_id)
-            if menu_item:
-                total += menu_item.price * order_item.quantity
+    menu_dict = menu if menu is not None else menu_cache.get_menu_snapshot().by_id
+    
+    total = 0.0
+    for order_item in items:
+        menu_item = menu_dict.get(order_item.menu_item_id)
+        if menu_item:
+            total += menu_item.price * order_item.quantity
+    
+    return total
+
+class ConversationTurn:
+    """
+    Unit of work for one inbound message
+    
+    The customer session is loaded once (from the session store) and mutated
+    in memory by the state handlers. All DB writes of the turn - any order
+    created or cancelled, plus the session when it must be durable - are
+    committed together in a single transaction, along with the inbound
+    message's MessageSid so a retried message is never handled twice.
+    Replies and order events are held back until that commit succeeds, so
+    a failed turn never tells anyone about something that didn't happen.
+    """
+    
+    def __init__(self, db: Session, phone_number: str, message_sid: Optional[str] = None):
+        self.db = db
+        self.phone_number = phone_number
+        self.message_sid = message_sid
+        self.session = session_store.load(db, phone_number)
+        self._after_commit: List[Callable[[], None]] = []
+        self._snapshot: Optional[MenuSnapshot] = None
+    
+    @property
+    def snapshot(self) -> MenuSnapshot:
+        """Menu snapshot, pinned for the whole turn"""
+        if self._snapshot is None:
+            self._snapshot = menu_cache.get_menu_snapshot()
+        return self._snapshot
+    
+    @property
+    def menu(self) -> Mapping[int, MenuItem]:
+        """Id-indexed menu of the turn's snapshot"""
+        return self.snapshot.by_id
+    
+    def reply(self, message: str):
+        """Send a message to the customer once the turn commits"""
+        self.after_commit(lambda: whatsapp_service.send_whatsapp_message(self.phone_number, message))
+    
+    def after_commit(self, callback: Callable[[], None]):
+        """Run a side effect (outbound message, event) once the turn commits"""
+        self._after_commit.append(callback)
+    
+    def commit(self):
+        """Save the session and commit everything in one transaction"""
+        # Turns that wrote orders persist the session with them; plain
+        # navigation turns leave it to the store's write-behind
+        db = self.db
+        durable = "revision" in db.info or bool(db.new or db.dirty or db.deleted)
+        with tracing.span("db.commit", durable=durable):
+            session_store.save(db, self.phone_number, self.session, durable=durable)
+            if self.message_sid:
+                db_handler.record_processed_message(db, self.message_sid)
+            db.commit()
         
-        return total
-    finally:
-        db.close()
+        callbacks, self._after_commit = self._after_commit, []
+        for callback in callbacks:
+            callback()
 
-def handle_incoming_message(phone_number: str, message_body: str):
+def handle_incoming_message(phone_number: str, message_body: str, message_sid: Optional[str] = None):
     """
     Main conversation handler - processes incoming WhatsApp messages
+    
+    A message whose MessageSid is already in processed_messages (a Twilio
+    retry handled before a restart or by another worker) is skipped before
+    the session is loaded.
     """
     # Normalize phone number
     if not phone_number.startswith('+'):
         phone_number = f'+{phone_number}'
     
     db = db_handler.get_db_session()
-    try:
-        # Get or create customer session
-        session = db_handler.get_customer_session(db, phone_number)
-        
-        # Normalize message
-        message = message_body.strip()
-        message_upper = message.upper()
-        
-        # Handle HI/HELLO/START - Always go to main menu
-        if message_upper in ['HI', 'HELLO', 'START', 'MENU']:
-            session.state = "main_menu"
-            db_handler.update_customer_session(db, phone_number, session)
-            whatsapp_service.send_whatsapp_message(
-                phone_number,
-                message_formatter.format_main_menu()
-            )
-            return
-        
-        # Handle BACK - Always go to main menu
-        if message_upper == 'BACK':
-            session.state = "main_menu"
-            db_handler.update_customer_session(db, phone_number, session)
-            whatsapp_service.send_whatsapp_message(
-                phone_number,
-                message_formatter.format_main_menu()
-            )
-            return
-        
-        # State machine logic
-        if session.state == "main_menu":
-            handle_main_menu(db, phone_number, message, session)
-        
-        elif session.state == "viewing_menu":
-            handle_viewing_menu(db, phone_number, message_upper, session)
-        
-        elif session.state == "placing_order":
-            handle_placing_order(db, phone_number, message, session)
-        
-        elif session.state == "confirming_order":
-            handle_confirming_order(db, phone_number, message_upper, session)
-        
-        elif session.state == "canceling_order":
-            handle_canceling_order(db, phone_number, message_upper, session)
+    with tracing.trace("conversation.turn"):
+        try:
+            if message_sid and db_handler.is_message_processed(db, message_sid):
+                _skip_duplicate(phone_number, message_sid)
+                return
+            
+            # Load (or create) the customer session once for the whole turn
+            with tracing.span("session.load"):
+                turn = ConversationTurn(db, phone_number, message_sid)
+            dispatch_message(turn, message_body)
+            tracing.set_attributes(next_state=turn.session.state)
+            turn.commit()
         
-        else:
-            # Unknown state - reset to main menu
-            session.state = "main_menu"
-            db_handler.update_customer_session(db, phone_number, session)
+        except Exception:
+            db.rollback()
+            session_store.invalidate(phone_number)
+            if message_sid and db_handler.is_message_processed(db, message_sid):
+                # Another worker handled the same message concurrently and committed first
+                _skip_duplicate(phone_number, message_sid)
+                return
+            logger.exception("Error handling message", extra={"event": "conversation.failed", "from_number": phone_number})
             whatsapp_service.send_whatsapp_message(
                 phone_number,
-                message_formatter.format_main_menu()
+                message_formatter.format_error_message("general")
             )
-    finally:
-        db.close()
+        finally:
+            db.close()
+
+def _skip_duplicate(phone_number: str, message_sid: str):
+    message_dedup.record_persisted_duplicate()
+    logger.info("Duplicate message skipped", extra={
+        "event": "message.duplicate", "from_number": phone_number, "message_sid": message_sid
+    })
+
+def dispatch_message(turn: ConversationTurn, message_body: str):
+    """Route a message to the handler for the customer's current state"""
+    session = turn.session
+    
+    # Normalize message
+    message = message_body.strip()
+    message_upper = message.upper()
+    
+    # Traced turns are reported per state (keyword restarts on their own)
+    restart = message_upper in ['HI', 'HELLO', 'START', 'MENU', 'BACK']
+    tracing.set_attributes(state="restart" if restart else session.state)
+    
+    # Handle HI/HELLO/START - Always go to main menu
+    if message_upper in ['HI', 'HELLO', 'START', 'MENU']:
+        session.state = "main_menu"
+        turn.reply(message_formatter.format_main_menu())
+        return
+    
+    # Handle BACK - Always go to main menu
+    if message_upper == 'BACK':
+        session.state = "main_menu"
+        turn.reply(message_formatter.format_main_menu())
+        return
+    
+    # State machine logic
+    if session.state == "main_menu":
+        handle_main_menu(turn, message)
+    
+    elif session.state == "viewing_menu":
+        handle_viewing_menu(turn, message_upper)
+    
+    elif session.state == "placing_order":
+        handle_placing_order(turn, message)
+    
+    elif session.state == "confirming_order":
+        handle_confirming_order(turn, message_upper)
+    
+    elif session.state == "canceling_order":
+        handle_canceling_order(turn, message_upper)
+    
+    else:
+        # Unknown state - reset to main menu
+        session.state = "main_menu"
+        turn.reply(message_formatter.format_main_menu())
 
-def handle_main_menu(db, phone_number: str, message: str, session):
+def handle_main_menu(turn: ConversationTurn, message: str):
     """Handle main menu selection"""
+    session = turn.session
     
     if message == "1":
         # View Menu
-        menu = db_handler.read_menu(db)
         session.state = "viewing_menu"
-        db_handler.update_customer_session(db, phone_number, session)
-        whatsapp_service.send_whatsapp_message(
-            phone_number,
-            message_formatter.format_menu(menu)
-        )
+        turn.reply(message_formatter.format_menu_snapshot())
     
     elif message == "2":
         # Place Order - Go directly to order instructions
         session.state = "placing_order"
-        db_handler.update_customer_session(db, phone_number, session)
         
         # First show menu
-        menu = db_handler.read_menu(db)
-        whatsapp_service.send_whatsapp_message(
-            phone_number,
-            message_formatter.format_menu(menu)
-        )
+        turn.reply(message_formatter.format_menu_snapshot())
         
         # Then show order instructions
-        whatsapp_service.send_whatsapp_message(
-            phone_number,
-            message_formatter.format_order_instructions()
-        )
+        turn.reply(message_formatter.format_order_instructions())
     
     elif message == "3":
         # Check Order Status
-        orders = db_handler.get_customer_orders(db, phone_number)
-        whatsapp_service.send_whatsapp_message(
-            phone_number,
-            message_formatter.format_order_status(orders)
-        )
+        orders = db_handler.get_customer_orders(turn.db, turn.phone_number)
+        turn.reply(message_formatter.format_order_status(orders))
         # Stay in main menu state
     
     elif message == "4":
         # Cancel Order
-        active_orders = db_handler.get_customer_active_orders(db, phone_number)
+        active_orders = db_handler.get_customer_active_orders(turn.db, turn.phone_number)
         
         if not active_orders:
-            whatsapp_service.send_whatsapp_message(
-                phone_number,
-                message_formatter.format_cancel_confirmation(None)
-            )
+            turn.reply(message_formatter.format_cancel_confirmation(None))
         else:
             # Get most recent active order
             most_recent = active_orders[-1]
             session.state = "canceling_order"
             session.cart = [OrderItem(menu_item_id=most_recent.id, quantity=1)]  # Store order ID temporarily
-            db_handler.update_customer_session(db, phone_number, session)
-            
-            whatsapp_service.send_whatsapp_message(
-                phone_number,
-                message_formatter.format_cancel_confirmation(most_recent)
-            )
+            turn.reply(message_formatter.format_cancel_confirmation(most_recent, turn.menu))
     
     else:
         # Invalid option
-        whatsapp_service.send_whatsapp_message(
-            phone_number,
-            message_formatter.format_error_message("invalid_option")
-        )
+        turn.reply(message_formatter.format_error_message("invalid_option"))
 
-def handle_viewing_menu(db, phone_number: str, message: str, session):
+def handle_viewing_menu(turn: ConversationTurn, message: str):
     """Handle viewing menu state"""
     
     if message == "ORDER":
-        session.state = "placing_order"
-        db_handler.update_customer_session(db, phone_number, session)
-        whatsapp_service.send_whatsapp_message(
-            phone_number,
-            message_formatter.format_order_instructions()
-        )
+        turn.session.state = "placing_order"
+        turn.reply(message_formatter.format_order_instructions())
     
     else:
         # Invalid input while viewing menu
-        whatsapp_service.send_whatsapp_message(
-            phone_number,
-            message_formatter.format_error_message("invalid_option")
-        )
+        turn.reply(message_formatter.format_error_message("invalid_option"))
 
-def handle_placing_order(db, phone_number: str, message: str, session):
+def handle_placing_order(turn: ConversationTurn, message: str):
     """Handle order placement"""
     
     # Parse order message
-    items = parse_order_message(message)
+    parsed = parse_order_message(message, turn.snapshot)
     
-    if not items:
-        whatsapp_service.send_whatsapp_message(
-            phone_number,
-            message_formatter.format_error_message("invalid_order")
-        )
+    if parsed.error:
+        turn.reply(message_formatter.format_error_message(parsed.error))
         return
+    items = parsed.items
     
     # Validate items
-    is_valid, error_msg = validate_order_items(items)
+    is_valid, error_msg = validate_order_items(items, turn.menu)
     
     if not is_valid:
-        whatsapp_service.send_whatsapp_message(
-            phone_number,
-            message_formatter.format_error_message("item_unavailable")
-        )
+        turn.reply(message_formatter.format_error_message("item_unavailable"))
         return
     
     # Add to cart and show summary
-    db_handler.add_to_cart(db, phone_number, items)
-    session.state = "confirming_order"
-    db_handler.update_customer_session(db, phone_number, session)
-    
-    whatsapp_service.send_whatsapp_message(
-        phone_number,
-        message_formatter.format_order_summary(items)
-    )
+    turn.session.cart = items
+    turn.session.state = "confirming_order"
+    turn.reply(message_formatter.format_order_summary(items, turn.menu))
 
-def handle_confirming_order(db, phone_number: str, message: str, session):
+def handle_confirming_order(turn: ConversationTurn, message: str):
     """Handle order confirmation"""
+    session = turn.session
     
     if message == "CONFIRM":
-        try:
-            # Get fresh session data
-            session = db_handler.get_customer_session(db, phone_number)
-            
-            if not session.cart:
-                whatsapp_service.send_whatsapp_message(
-                    phone_number,
-                    "❌ Your cart is empty! Reply *HI* to start over."
-                )
-                return
-            
-            # Calculate total
-            total = calculate_order_total(session.cart)
-            
-            # Create order
-            order = Order(
-                id=0,  # Will be set by add_order
-                customer_whatsapp=phone_number,
-                items=session.cart,
-                status="pending",
-                total_price=total,
-                created_at=""  # Will be set by add_order
-            )
-            
-            created_order = db_handler.add_order(db, order)
-            
-            # Send confirmation
-            items_summary = message_formatter.format_items_summary(session.cart)
-            whatsapp_service.send_order_confirmation(
-                phone_number,
-                created_order.id,
-                items_summary,
-                created_order.total_price
-            )
-            
-            # Clear cart and reset state
-            db_handler.clear_customer_cart(db, phone_number)
-            session.state = "main_menu"
-            db_handler.update_customer_session(db, phone_number, session)
-            
-        except Exception as e:
-            print(f"❌ Error confirming order: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            whatsapp_service.send_whatsapp_message(
-                phone_number,
-                message_formatter.format_error_message("general")
-            )
+        if not session.cart:
+            turn.reply("❌ Your cart is empty! Reply *HI* to start over.")
             return
+        
+        # Calculate total
+        total = calculate_order_total(session.cart, turn.menu)
+        
+        # Create order
+        order = Order(
+            id=0,  # Will be set by add_order
+            customer_whatsapp=turn.phone_number,
+            items=session.cart,
+            status="pending",
+            total_price=total,
+            created_at=""  # Will be set by add_order
+        )
+        
+        created_order = db_handler.add_order(turn.db, order, commit=False)
+        turn.after_commit(lambda: publish_order_event("order.created", created_order))
+        
+        # Send confirmation
+        items_summary = message_formatter.format_items_summary(session.cart, turn.menu)
+        turn.after_commit(lambda: whatsapp_service.send_order_confirmation(
+            turn.phone_number,
+            created_order.id,
+            items_summary,
+            created_order.total_price
+        ))
+        
+        # Clear cart and reset state
+        session.cart = []
+        session.state = "main_menu"
     
     elif message == "CANCEL":
         # Cancel order creation
-        db_handler.clear_customer_cart(db, phone_number)
+        session.cart = []
         session.state = "main_menu"
-        db_handler.update_customer_session(db, phone_number, session)
-        
-        whatsapp_service.send_whatsapp_message(
-            phone_number,
-            message_formatter.format_main_menu()
-        )
+        turn.reply(message_formatter.format_main_menu())
     
     else:
         # Invalid input
-        whatsapp_service.send_whatsapp_message(
-            phone_number,
-            message_formatter.format_error_message("invalid_option")
-        )
+        turn.reply(message_formatter.format_error_message("invalid_option"))
 
-def handle_canceling_order(db, phone_number: str, message: str, session):
+def handle_canceling_order(turn: ConversationTurn, message: str):
     """Handle order cancellation"""
+    session = turn.session
     
     if message == "YES":
         # Get order ID from cart (we stored it there temporarily)
         if session.cart and len(session.cart) > 0:
             order_id = session.cart[0].menu_item_id  # We stored order_id here
             
-            # Cancel the order
-            cancelled_order = db_handler.cancel_order(db, order_id)
+            # Cancel the order (it may have moved on since we asked)
+            try:
+                cancelled_order = db_handler.cancel_order(turn.db, order_id, commit=False)
+            except db_handler.InvalidTransitionError:
+                cancelled_order = None
+                turn.reply(message_formatter.format_error_message("order_not_cancellable"))
             
             if cancelled_order:
-                whatsapp_service.send_order_cancellation(phone_number, order_id)
+                turn.after_commit(lambda: publish_order_event("order.cancelled", cancelled_order))
+                turn.after_commit(lambda: whatsapp_service.send_order_cancellation(turn.phone_number, order_id))
         
         # Reset state
         session.cart = []
         session.state = "main_menu"
-        db_handler.update_customer_session(db, phone_number, session)
     
     elif message == "NO":
         # Don't cancel - go back to main menu
         session.cart = []
         session.state = "main_menu"
-        db_handler.update_customer_session(db, phone_number, session)
-        
-        whatsapp_service.send_whatsapp_message(
-            phone_number,
-            message_formatter.format_main_menu()
-        )
+        turn.reply(message_formatter.format_main_menu())
     
     else:
         # Invalid input
-        whatsapp_service.send_whatsapp_message(
-            phone_number,
-            message_formatter.format_error_message("invalid_option")
-        )
\ No newline at end of file
+        turn.reply(message_formatter.format_error_message("invalid_option"))
\ No newline at end of file
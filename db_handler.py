@@ -1,9 +1,34 @@
+import base64
 import json
-from typing import List, Optional
-from sqlalchemy.orm import Session
+from typing import List, Optional, Tuple
+from sqlalchemy import delete, func, insert, select, tuple_, update
+from sqlalchemy.orm import Session, selectinload
 from datetime import datetime
-from database import MenuItemDB, OrderDB, OrderItemDB, CustomerSessionDB, SessionLocal
+from database import (
+    MenuItemDB, OrderDB, OrderItemDB, CustomerSessionDB, ArchivedSessionDB, ProcessedMessageDB,
+    SessionLocal, next_revision
+)
 from models import MenuItem, Order, OrderItem, CustomerSession
+import menu_cache
+
+# Order lifecycle: the statuses an order may move to from each status
+ORDER_TRANSITIONS = {
+    "pending": ("preparing", "cancelled"),
+    "preparing": ("out-for-delivery", "cancelled"),
+    "out-for-delivery": ("delivered", "cancelled"),
+    "delivered": (),
+    "cancelled": (),
+}
+ORDER_STATUSES = list(ORDER_TRANSITIONS)
+
+# Attempts at a compare-and-swap status update before giving up
+CAS_RETRIES = 3
+
+class InvalidTransitionError(ValueError):
+    """Raised when ORDER_TRANSITIONS doesn't allow a status change"""
+
+class ConcurrentUpdateError(Exception):
+    """Raised when an order changed between reading and updating it"""
 
 # ==================== MENU OPERATIONS ====================
 
@@ -40,16 +65,19 @@ def add_menu_item(db: Session, item: MenuItem) -> MenuItem:
         is_available=item.is_available
     )
     db.add(db_item)
-    db.commit()
-    db.refresh(db_item)
-    
-    return MenuItem(
-        id=db_item.id,
-        name=db_item.name,
-        description=db_item.description,
-        price=db_item.price,
-        is_available=db_item.is_available
-    )
+    with menu_cache.publish_lock:
+        db.commit()
+        db.refresh(db_item)
+        
+        created_item = MenuItem(
+            id=db_item.id,
+            name=db_item.name,
+            description=db_item.description,
+            price=db_item.price,
+            is_available=db_item.is_available
+        )
+        menu_cache.publish_item(created_item, db_item.revision)
+    return created_item
 
 def update_menu_item(db: Session, item_id: int, updates: dict) -> Optional[MenuItem]:
     """Update a menu item"""
@@ -61,24 +89,119 @@ def update_menu_item(db: Session, item_id: int, updates: dict) -> Optional[MenuI
         if value is not None:
             setattr(db_item, key, value)
     
-    db.commit()
-    db.refresh(db_item)
-    
-    return MenuItem(
-        id=db_item.id,
-        name=db_item.name,
-        description=db_item.description,
-        price=db_item.price,
-        is_available=db_item.is_available
-    )
+    with menu_cache.publish_lock:
+        db.commit()
+        db.refresh(db_item)
+        
+        updated_item = MenuItem(
+            id=db_item.id,
+            name=db_item.name,
+            description=db_item.description,
+            price=db_item.price,
+            is_available=db_item.is_available
+        )
+        menu_cache.publish_item(updated_item, db_item.revision)
+    return updated_item
 
 # ==================== ORDER OPERATIONS ====================
 
 def read_orders(db: Session) -> List[Order]:
     """Read all orders"""
-    orders = db.query(OrderDB).all()
+    orders = db.query(OrderDB).options(selectinload(OrderDB.items)).all()
     return [_convert_order_db_to_model(order) for order in orders]
 
+def encode_order_cursor(order: Order) -> str:
+    """Encode an order's (created_at, id) position as an opaque cursor"""
+    raw = f"{order.created_at}|{order.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_order_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode a cursor from encode_order_cursor (raises ValueError if invalid)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, order_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(order_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def _as_naive(value: datetime) -> datetime:
+    """created_at is stored as naive local time"""
+    if value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+def list_orders(
+    db: Session,
+    statuses: Optional[List[str]] = None,
+    customer_whatsapp: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    descending: bool = False,
+    after: Optional[Tuple[datetime, int]] = None,
+    limit: int = 100
+) -> Tuple[List[Order], Optional[str]]:
+    """
+    Read one page of orders using keyset pagination
+    
+    Orders are sorted by (created_at, id). `after` is the position decoded
+    from the previous page's cursor. Returns the page and the cursor for the
+    next page (None on the last page).
+    """
+    query = db.query(OrderDB).options(selectinload(OrderDB.items))
+    
+    if statuses:
+        query = query.filter(OrderDB.status.in_(statuses))
+    if customer_whatsapp:
+        query = query.filter(OrderDB.customer_whatsapp == customer_whatsapp)
+    if created_from:
+        query = query.filter(OrderDB.created_at >= _as_naive(created_from))
+    if created_to:
+        query = query.filter(OrderDB.created_at < _as_naive(created_to))
+    
+    position = tuple_(OrderDB.created_at, OrderDB.id)
+    if after:
+        query = query.filter(position < after if descending else position > after)
+    
+    if descending:
+        query = query.order_by(OrderDB.created_at.desc(), OrderDB.id.desc())
+    else:
+        query = query.order_by(OrderDB.created_at, OrderDB.id)
+    
+    # Fetch one extra row to know whether there is a next page
+    rows = query.limit(limit + 1).all()
+    orders = [_convert_order_db_to_model(order) for order in rows[:limit]]
+    
+    next_cursor = encode_order_cursor(orders[-1]) if len(rows) > limit else None
+    return orders, next_cursor
+
+def get_orders_revision(db: Session) -> int:
+    """Get the latest change revision of any order"""
+    return db.query(func.max(OrderDB.revision)).scalar() or 0
+
+def get_orders_changed_since(db: Session, since: int, limit: int = 100) -> Tuple[List[Order], int, bool]:
+    """
+    Read orders changed after revision `since`
+    
+    Returns the changed orders (oldest change first), the revision to pass
+    as `since` next time, and whether more changes are pending. Changes are
+    paged by whole revisions so a multi-row change is never split.
+    """
+    revisions = [row[0] for row in db.query(OrderDB.revision).filter(
+        OrderDB.revision > since
+    ).distinct().order_by(OrderDB.revision).limit(limit + 1).all()]
+    
+    if not revisions:
+        return [], since, False
+    
+    has_more = len(revisions) > limit
+    upto = revisions[:limit][-1]
+    orders = db.query(OrderDB).options(selectinload(OrderDB.items)).filter(
+        OrderDB.revision > since,
+        OrderDB.revision <= upto
+    ).order_by(OrderDB.revision, OrderDB.id).all()
+    
+    return [_convert_order_db_to_model(order) for order in orders], upto, has_more
+
 def get_order(db: Session, order_id: int) -> Optional[Order]:
     """Get a specific order by ID"""
     order = db.query(OrderDB).filter(OrderDB.id == order_id).first()
@@ -86,56 +209,217 @@ def get_order(db: Session, order_id: int) -> Optional[Order]:
         return _convert_order_db_to_model(order)
     return None
 
-def add_order(db: Session, order: Order) -> Order:
-    """Add a new order"""
+def add_order(db: Session, order: Order, commit: bool = True) -> Order:
+    """
+    Add a new order
+    
+    With commit=False the order is only flushed (to get its ID) and the
+    caller commits it as part of a larger transaction.
+    """
     db_order = OrderDB(
         customer_name=order.customer_name,
         customer_whatsapp=order.customer_whatsapp,
         status=order.status,
         total_price=order.total_price,
-        created_at=datetime.now()
+        created_at=datetime.now(),
+        items=[
+            OrderItemDB(menu_item_id=item.menu_item_id, quantity=item.quantity)
+            for item in order.items
+        ]
     )
     db.add(db_order)
-    db.flush()  # Get order ID before adding items
-    
-    # Add order items
-    for item in order.items:
-        db_order_item = OrderItemDB(
-            order_id=db_order.id,
-            menu_item_id=item.menu_item_id,
-            quantity=item.quantity
-        )
-        db.add(db_order_item)
     
-    db.commit()
-    db.refresh(db_order)
+    if commit:
+        db.commit()
+        db.refresh(db_order)
+    else:
+        db.flush()  # Get order ID
     
     return _convert_order_db_to_model(db_order)
 
-def update_order_status(db: Session, order_id: int, status: str) -> Optional[Order]:
-    """Update order status"""
-    db_order = db.query(OrderDB).filter(OrderDB.id == order_id).first()
-    if not db_order:
-        return None
+def add_orders_bulk(db: Session, orders: List[Order]) -> List[Order]:
+    """
+    Insert many orders and their items in the current transaction
     
-    db_order.status = status
-    db.commit()
-    db.refresh(db_order)
+    Orders and items each go in as one multi-row INSERT (orders with
+    RETURNING, in input order, for their IDs). Bulk inserts skip the ORM
+    flush that normally stamps revisions, so the transaction's revision is
+    set explicitly. The caller commits.
+    """
+    if not orders:
+        return []
     
-    return _convert_order_db_to_model(db_order)
+    revision = next_revision(db)
+    created_at = datetime.now()
+    order_ids = db.scalars(
+        insert(OrderDB).returning(OrderDB.id, sort_by_parameter_order=True),
+        [
+            {
+                "customer_name": order.customer_name,
+                "customer_whatsapp": order.customer_whatsapp,
+                "status": order.status,
+                "total_price": order.total_price,
+                "created_at": created_at,
+                "revision": revision,
+            }
+            for order in orders
+        ]
+    ).all()
+    
+    item_rows = [
+        {"order_id": order_id, "menu_item_id": item.menu_item_id, "quantity": item.quantity}
+        for order_id, order in zip(order_ids, orders)
+        for item in order.items
+    ]
+    if item_rows:
+        db.execute(insert(OrderItemDB), item_rows)
+    
+    return [
+        order.model_copy(update={"id": order_id, "created_at": created_at.isoformat()})
+        for order_id, order in zip(order_ids, orders)
+    ]
 
-def cancel_order(db: Session, order_id: int) -> Optional[Order]:
+def check_transition(current: str, status: str):
+    """Raise InvalidTransitionError unless ORDER_TRANSITIONS allows current -> status"""
+    if status not in ORDER_TRANSITIONS:
+        raise InvalidTransitionError(f"Invalid status. Allowed: {', '.join(ORDER_STATUSES)}")
+    if status not in ORDER_TRANSITIONS.get(current, ()):
+        raise InvalidTransitionError(f"Cannot change order from {current} to {status}")
+
+def _sources_for(status: str) -> List[str]:
+    """Statuses an order may move to `status` from"""
+    return [source for source, targets in ORDER_TRANSITIONS.items() if status in targets]
+
+_ORDER_COLUMNS = (
+    OrderDB.id, OrderDB.customer_name, OrderDB.customer_whatsapp,
+    OrderDB.status, OrderDB.total_price, OrderDB.created_at, OrderDB.version
+)
+
+def _orders_from_rows(db: Session, rows) -> List[Order]:
+    """Build orders from RETURNING rows, reading all their items in one query"""
+    items: dict = {}
+    for item in db.query(OrderItemDB).filter(OrderItemDB.order_id.in_([row.id for row in rows])):
+        items.setdefault(item.order_id, []).append(
+            OrderItem(menu_item_id=item.menu_item_id, quantity=item.quantity)
+        )
+    
+    return [
+        Order(
+            id=row.id,
+            customer_name=row.customer_name,
+            customer_whatsapp=row.customer_whatsapp,
+            items=items.get(row.id, []),
+            status=row.status,
+            total_price=row.total_price,
+            created_at=row.created_at.isoformat(),
+            version=row.version
+        )
+        for row in rows
+    ]
+
+def update_order_status(
+    db: Session,
+    order_id: int,
+    status: str,
+    commit: bool = True,
+    expected_version: Optional[int] = None
+) -> Optional[Order]:
+    """
+    Move an order to `status` with a compare-and-swap on its version
+    
+    The transition is checked against ORDER_TRANSITIONS for the order's
+    current status, then applied with UPDATE ... WHERE id = ? AND
+    version = ?, so a concurrent change can never be overwritten. When
+    another writer wins the race the order is re-read and the transition
+    re-checked (up to CAS_RETRIES times). With `expected_version` (the
+    version the caller last saw) there is no retry: any intervening change
+    raises ConcurrentUpdateError.
+    
+    Returns None if the order doesn't exist. With commit=False the caller
+    commits as part of a larger transaction.
+    """
+    for _ in range(CAS_RETRIES):
+        current = db.query(OrderDB.status, OrderDB.version).filter(OrderDB.id == order_id).first()
+        if current is None:
+            return None
+        if expected_version is not None and current.version != expected_version:
+            raise ConcurrentUpdateError(
+                f"Order #{order_id} was changed (version {current.version}, expected {expected_version})"
+            )
+        check_transition(current.status, status)
+        
+        row = db.execute(
+            update(OrderDB)
+            .where(OrderDB.id == order_id, OrderDB.version == current.version)
+            .values(status=status, version=OrderDB.version + 1, revision=next_revision(db))
+            .returning(*_ORDER_COLUMNS),
+            execution_options={"synchronize_session": False}
+        ).first()
+        if row is None:
+            # Lost the race: re-check against whatever the winner wrote
+            if expected_version is not None:
+                raise ConcurrentUpdateError(f"Order #{order_id} was changed concurrently")
+            continue
+        
+        order = _orders_from_rows(db, [row])[0]
+        if commit:
+            db.commit()
+        return order
+    
+    raise ConcurrentUpdateError(f"Order #{order_id} kept changing, giving up after {CAS_RETRIES} attempts")
+
+def update_orders_status(
+    db: Session,
+    order_ids: List[int],
+    status: str,
+    from_statuses: Optional[List[str]] = None
+) -> List[Order]:
+    """
+    Move many orders to `status` with a single UPDATE ... WHERE id IN
+    
+    Only orders whose current status may move to `status` (per
+    ORDER_TRANSITIONS, narrowed to `from_statuses` when given) are changed;
+    the status condition is part of the UPDATE, so it is checked and applied
+    atomically and every changed row gets its version bumped. Changed rows
+    come back through RETURNING and their items are read in one query.
+    Bulk updates skip the ORM flush that normally stamps revisions, so the
+    transaction's revision is set explicitly. The caller commits.
+    """
+    if status not in ORDER_TRANSITIONS:
+        raise InvalidTransitionError(f"Invalid status. Allowed: {', '.join(ORDER_STATUSES)}")
+    sources = _sources_for(status)
+    if from_statuses:
+        sources = [source for source in sources if source in from_statuses]
+    if not order_ids or not sources:
+        return []
+    
+    rows = db.execute(
+        update(OrderDB)
+        .where(OrderDB.id.in_(order_ids), OrderDB.status.in_(sources))
+        .values(status=status, version=OrderDB.version + 1, revision=next_revision(db))
+        .returning(*_ORDER_COLUMNS),
+        execution_options={"synchronize_session": False}
+    ).all()
+    return _orders_from_rows(db, rows) if rows else []
+
+def get_order_statuses(db: Session, order_ids: List[int]) -> dict:
+    """Current status of each existing order in `order_ids`, by ID"""
+    return dict(db.query(OrderDB.id, OrderDB.status).filter(OrderDB.id.in_(order_ids)).all())
+
+def cancel_order(db: Session, order_id: int, commit: bool = True) -> Optional[Order]:
     """Cancel an order"""
-    return update_order_status(db, order_id, "cancelled")
+    return update_order_status(db, order_id, "cancelled", commit=commit)
 
 def get_customer_orders(db: Session, whatsapp_number: str) -> List[Order]:
     """Get all orders for a customer"""
-    orders = db.query(OrderDB).filter(OrderDB.customer_whatsapp == whatsapp_number).all()
+    orders = db.query(OrderDB).options(selectinload(OrderDB.items)).filter(
+        OrderDB.customer_whatsapp == whatsapp_number
+    ).all()
     return [_convert_order_db_to_model(order) for order in orders]
 
 def get_customer_active_orders(db: Session, whatsapp_number: str) -> List[Order]:
     """Get active orders for a customer (not delivered or cancelled)"""
-    orders = db.query(OrderDB).filter(
+    orders = db.query(OrderDB).options(selectinload(OrderDB.items)).filter(
         OrderDB.customer_whatsapp == whatsapp_number,
         OrderDB.status.notin_(["delivered", "cancelled"])
     ).all()
@@ -153,18 +437,26 @@ def _convert_order_db_to_model(db_order: OrderDB) -> Order:
         ],
         status=db_order.status,
         total_price=db_order.total_price,
-        created_at=db_order.created_at.isoformat()
+        created_at=db_order.created_at.isoformat(),
+        version=db_order.version
     )
 
 # ==================== CUSTOMER SESSION OPERATIONS ====================
 
-def get_customer_session(db: Session, whatsapp_number: str) -> CustomerSession:
-    """Get or create customer session"""
+def get_customer_session(db: Session, whatsapp_number: str, commit: bool = True) -> CustomerSession:
+    """
+    Get or create customer session
+    
+    With commit=False a new customer's session is not written here; the
+    caller's update_customer_session inserts it with the rest of its changes.
+    """
     db_session = db.query(CustomerSessionDB).filter(
         CustomerSessionDB.whatsapp_number == whatsapp_number
     ).first()
     
     if not db_session:
+        if not commit:
+            return CustomerSession(last_interaction=datetime.now().isoformat())
         db_session = CustomerSessionDB(
             whatsapp_number=whatsapp_number,
             state="main_menu",
@@ -184,23 +476,124 @@ def get_customer_session(db: Session, whatsapp_number: str) -> CustomerSession:
         order_history=json.loads(db_session.order_history)
     )
 
-def update_customer_session(db: Session, whatsapp_number: str, session: CustomerSession):
-    """Update customer session"""
-    db_session = db.query(CustomerSessionDB).filter(
+def update_customer_session(db: Session, whatsapp_number: str, session: CustomerSession, commit: bool = True):
+    """Update (or insert) customer session"""
+    values = {
+        "state": session.state,
+        "cart": json.dumps([item.model_dump() for item in session.cart]),
+        "last_interaction": datetime.now(),
+        "customer_name": session.customer_name,
+        "order_history": json.dumps(session.order_history),
+    }
+    
+    # Single UPDATE statement - no need to load the row first
+    updated = db.query(CustomerSessionDB).filter(
         CustomerSessionDB.whatsapp_number == whatsapp_number
-    ).first()
+    ).update(values, synchronize_session=False)
     
-    if not db_session:
-        db_session = CustomerSessionDB(whatsapp_number=whatsapp_number)
-        db.add(db_session)
+    if not updated:
+        db.add(CustomerSessionDB(whatsapp_number=whatsapp_number, **values))
+    
+    if commit:
+        db.commit()
+
+def archive_stale_sessions(db: Session, idle_before: datetime, limit: int) -> Tuple[int, int]:
+    """
+    Expire up to `limit` sessions idle since before `idle_before`
     
-    db_session.state = session.state
-    db_session.cart = json.dumps([item.model_dump() for item in session.cart])
-    db_session.last_interaction = datetime.now()
-    db_session.customer_name = session.customer_name
-    db_session.order_history = json.dumps(session.order_history)
+    Sessions with an order history are folded into archived_sessions (one
+    row per customer, histories merged); the rest are simply deleted.
+    Everything happens in one short transaction. Returns the numbers of
+    sessions actually deleted and archived: a session touched since it was
+    selected is left alone and not counted.
+    """
+    stale = db.query(CustomerSessionDB).filter(
+        CustomerSessionDB.last_interaction < idle_before
+    ).order_by(CustomerSessionDB.last_interaction).limit(limit).all()
+    if not stale:
+        return 0, 0
     
+    # Re-check the idle condition so a session touched meanwhile survives
+    still_idle = (
+        CustomerSessionDB.id.in_([row.id for row in stale]),
+        CustomerSessionDB.last_interaction < idle_before
+    )
+    if db.connection().dialect.delete_returning:
+        deleted = set(db.scalars(
+            delete(CustomerSessionDB).where(*still_idle).returning(CustomerSessionDB.id),
+            execution_options={"synchronize_session": False}
+        ))
+    else:
+        deleted = set(db.scalars(select(CustomerSessionDB.id).where(*still_idle)))
+        db.query(CustomerSessionDB).filter(
+            CustomerSessionDB.id.in_(deleted)
+        ).delete(synchronize_session=False)
+    
+    with_history = [
+        row for row in stale
+        if row.id in deleted and json.loads(row.order_history or "[]")
+    ]
+    archives = {
+        archive.whatsapp_number: archive
+        for archive in db.query(ArchivedSessionDB).filter(
+            ArchivedSessionDB.whatsapp_number.in_([row.whatsapp_number for row in with_history])
+        )
+    } if with_history else {}
+    
+    for row in with_history:
+        archive = archives.get(row.whatsapp_number)
+        if archive is None:
+            archive = ArchivedSessionDB(whatsapp_number=row.whatsapp_number, order_history="[]")
+            db.add(archive)
+        history = json.loads(archive.order_history or "[]")
+        history.extend(order_id for order_id in json.loads(row.order_history) if order_id not in history)
+        archive.order_history = json.dumps(history, separators=(",", ":"))
+        archive.customer_name = row.customer_name or archive.customer_name
+        archive.last_interaction = row.last_interaction
+        archive.archived_at = datetime.now()
+    
+    db.commit()
+    return len(deleted), len(with_history)
+
+def get_session_counts(db: Session, idle_before: datetime) -> dict:
+    """Live, expired-but-not-yet-swept and archived session counts"""
+    return {
+        "live": db.query(func.count(CustomerSessionDB.id)).filter(
+            CustomerSessionDB.last_interaction >= idle_before
+        ).scalar(),
+        "expired": db.query(func.count(CustomerSessionDB.id)).filter(
+            CustomerSessionDB.last_interaction < idle_before
+        ).scalar(),
+        "archived": db.query(func.count(ArchivedSessionDB.whatsapp_number)).scalar(),
+    }
+
+# ==================== PROCESSED MESSAGES ====================
+
+def is_message_processed(db: Session, message_sid: str) -> bool:
+    """Whether an inbound message was already handled (primary key lookup)"""
+    return db.get(ProcessedMessageDB, message_sid) is not None
+
+def record_processed_message(db: Session, message_sid: str):
+    """
+    Mark an inbound message as handled, in the caller's transaction
+    
+    A plain INSERT: if another worker recorded the same message first, the
+    primary key makes this fail and the caller's transaction rolls back.
+    """
+    db.execute(insert(ProcessedMessageDB).values(message_sid=message_sid, processed_at=datetime.now()))
+
+def prune_processed_messages(db: Session, processed_before: datetime, limit: int) -> int:
+    """Delete up to `limit` processed message IDs older than `processed_before`"""
+    sids = [row[0] for row in db.query(ProcessedMessageDB.message_sid).filter(
+        ProcessedMessageDB.processed_at < processed_before
+    ).limit(limit)]
+    if not sids:
+        return 0
+    db.query(ProcessedMessageDB).filter(
+        ProcessedMessageDB.message_sid.in_(sids)
+    ).delete(synchronize_session=False)
     db.commit()
+    return len(sids)
 
 def clear_customer_cart(db: Session, whatsapp_number: str):
     """Clear customer's cart"""
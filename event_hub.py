@@ -0,0 +1,135 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from typing import Deque, Optional, Set, Tuple
+from models import Order
+
+# Event hub configuration
+EVENT_HISTORY_SIZE = int(os.getenv('EVENT_HISTORY_SIZE', '1000'))
+EVENT_BUFFER_SIZE = int(os.getenv('EVENT_BUFFER_SIZE', '100'))
+
+# (id, event type, JSON data)
+Event = Tuple[int, str, str]
+
+class Subscriber:
+    """One connected client with its own bounded event buffer"""
+
+    def __init__(self, buffer_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self.closed = False
+
+class EventHub:
+    """
+    In-process fan-out of order events to connected clients
+
+    Each subscriber has a bounded buffer. A subscriber that falls so far
+    behind that its buffer fills up is evicted; it reconnects with
+    Last-Event-ID and catches up from the replay history, or gets a
+    "reset" event telling it to reload if it fell out of the history too.
+
+    `publish` is thread-safe, so sync endpoints and the conversation
+    workers can call it directly.
+    """
+
+    def __init__(self, history_size: int = EVENT_HISTORY_SIZE, buffer_size: int = EVENT_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self._history: Deque[Event] = deque(maxlen=history_size)
+        self._subscribers: Set[Subscriber] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Millisecond-based ids keep increasing across restarts, so a client
+        # resuming with an id from a previous process gets a reset
+        self._next_id = int(time.time() * 1000)
+
+        # Metrics
+        self.published = 0
+        self.evicted = 0
+
+    def start(self):
+        """Bind the hub to the running event loop"""
+        self._loop = asyncio.get_running_loop()
+
+    def close(self):
+        """Disconnect all subscribers"""
+        for subscriber in list(self._subscribers):
+            self._close(subscriber)
+        self._loop = None
+
+    def publish(self, event_type: str, data: dict):
+        """Broadcast an event to every subscriber (thread-safe)"""
+        if self._loop is None:
+            return
+        payload = json.dumps(data)
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is self._loop:
+            self._dispatch(event_type, payload)
+        else:
+            self._loop.call_soon_threadsafe(self._dispatch, event_type, payload)
+
+    def _dispatch(self, event_type: str, payload: str):
+        event = (self._next_id, event_type, payload)
+        self._next_id += 1
+        self._history.append(event)
+        self.published += 1
+
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow consumer - drop it rather than buffer without limit
+                self.evicted += 1
+                self._close(subscriber)
+
+    def _close(self, subscriber: Subscriber):
+        subscriber.closed = True
+        self._subscribers.discard(subscriber)
+        try:
+            subscriber.queue.put_nowait(None)  # Wake the stream so it ends
+        except asyncio.QueueFull:
+            pass  # The stream is awake anyway and checks `closed`
+
+    def subscribe(self, last_event_id: Optional[int] = None) -> Subscriber:
+        """Register a subscriber, replaying events after last_event_id"""
+        subscriber = Subscriber(self.buffer_size)
+
+        if last_event_id is not None:
+            missed = [event for event in self._history if event[0] > last_event_id]
+            oldest_id = self._history[0][0] if self._history else self._next_id
+            if last_event_id < oldest_id - 1 or len(missed) >= self.buffer_size:
+                # Too far behind to replay - the client must reload
+                subscriber.queue.put_nowait((self._next_id - 1, "reset", "{}"))
+            else:
+                for event in missed:
+                    subscriber.queue.put_nowait(event)
+
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+
+    def stats(self) -> dict:
+        """Fan-out counters"""
+        return {
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "evicted": self.evicted,
+            "last_event_id": self._next_id - 1,
+        }
+
+def format_sse(event: Event) -> str:
+    """Format an event as a Server-Sent Events message"""
+    event_id, event_type, payload = event
+    return f"id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n"
+
+# Order event hub shared by the REST API and the WhatsApp conversation flow
+order_events = EventHub()
+
+def publish_order_event(event_type: str, order: Order):
+    """Broadcast an order event (order.created, order.status_changed, order.cancelled)"""
+    order_events.publish(event_type, order.model_dump())
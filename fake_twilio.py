@@ -0,0 +1,98 @@
+"""
+Local fake of the Twilio Messages API for offline and load testing
+
+Run it and point the backend at it:
+
+    python fake_twilio.py --port 8081 --latency-ms 80 --error-rate 0.02
+    TWILIO_API_BASE=http://localhost:8081 python -m uvicorn main:app
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from collections import Counter, deque
+from typing import Callable, Optional
+from aiohttp import web
+
+def create_app(latency_ms: float = 50.0, jitter_ms: float = 20.0, error_rate: float = 0.0,
+               throttle_rate: float = 0.0, keep_messages: int = 1000,
+               on_message: Optional[Callable[[dict], None]] = None) -> web.Application:
+    """
+    Build the fake Twilio application
+
+    `on_message` is called with every accepted message, so an in-process
+    load generator can observe replies without polling /messages.
+    """
+    app = web.Application()
+    app["stats"] = Counter()
+    app["messages"] = deque(maxlen=keep_messages)
+    app["started_at"] = time.time()
+
+    async def create_message(request: web.Request) -> web.Response:
+        form = await request.post()
+        stats = app["stats"]
+        stats["requests"] += 1
+
+        delay = max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+
+        roll = random.random()
+        if roll < throttle_rate:
+            stats["throttled"] += 1
+            return web.json_response(
+                {"code": 20429, "message": "Too Many Requests"},
+                status=429,
+                headers={"Retry-After": "1"}
+            )
+        if roll < throttle_rate + error_rate:
+            stats["errors"] += 1
+            return web.json_response({"code": 20500, "message": "Internal Server Error"}, status=503)
+
+        sid = f"SM{uuid.uuid4().hex}"
+        message = {
+            "sid": sid,
+            "account_sid": request.match_info["account_sid"],
+            "from": form.get("From"),
+            "to": form.get("To"),
+            "body": form.get("Body"),
+            "status": "queued",
+        }
+        app["messages"].append(message)
+        stats["accepted"] += 1
+        if on_message is not None:
+            on_message(message)
+        return web.json_response(message, status=201)
+
+    async def get_stats(request: web.Request) -> web.Response:
+        elapsed = time.time() - app["started_at"]
+        stats = dict(app["stats"])
+        stats["uptime_seconds"] = round(elapsed, 1)
+        stats["accepted_per_second"] = round(stats.get("accepted", 0) / elapsed, 2) if elapsed else 0.0
+        return web.json_response(stats)
+
+    async def list_messages(request: web.Request) -> web.Response:
+        to_number = request.query.get("to")
+        messages = [m for m in app["messages"] if not to_number or m["to"] == to_number]
+        return web.json_response(messages)
+
+    app.router.add_post("/2010-04-01/Accounts/{account_sid}/Messages.json", create_message)
+    app.router.add_get("/stats", get_stats)
+    app.router.add_get("/messages", list_messages)
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Twilio Messages API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Mean response latency")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="Latency jitter (+/-)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 503 responses")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of 429 responses")
+    args = parser.parse_args()
+
+    web.run_app(
+        create_app(args.latency_ms, args.jitter_ms, args.error_rate, args.throttle_rate),
+        host=args.host,
+        port=args.port
+    )
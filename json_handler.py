@@ -1,115 +1,387 @@
 import json
 import os
-from typing import List, Dict, Any, Optional
+import threading
+from typing import List, Dict, Any, Optional, Callable, Iterator
 from models import MenuItem, Order, CustomerSession, OrderItem
 from datetime import datetime
 
-# File paths
-MENU_FILE = "menu.json"
-ORDERS_FILE = "orders.json"
-SESSIONS_FILE = "customer_sessions.json"
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# File paths, under JSON_DATA_DIR (created on first use). The .json files
+# are the compacted snapshots; changes made since the last compaction are
+# appended to the matching .jsonl log.
+JSON_DATA_DIR = os.getenv('JSON_DATA_DIR', '.')
+MENU_FILE = os.path.join(JSON_DATA_DIR, "menu.json")
+ORDERS_FILE = os.path.join(JSON_DATA_DIR, "orders.json")
+SESSIONS_FILE = os.path.join(JSON_DATA_DIR, "customer_sessions.json")
+MENU_LOG = os.path.join(JSON_DATA_DIR, "menu.jsonl")
+ORDERS_LOG = os.path.join(JSON_DATA_DIR, "orders.jsonl")
+SESSIONS_LOG = os.path.join(JSON_DATA_DIR, "customer_sessions.jsonl")
+
+# Store configuration
+JSON_STORE_FSYNC = os.getenv('JSON_STORE_FSYNC', 'on').lower() != 'off'
+JSON_COMPACT_MIN_RECORDS = int(os.getenv('JSON_COMPACT_MIN_RECORDS', '1000'))
+
+def _lock(f, shared: bool = False):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+    else:
+        # msvcrt has no shared locks; lock the first byte exclusively
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+def _unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _fsync_dir(path: str):
+    """Make a rename durable (not supported on Windows)"""
+    if fcntl is None:
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _write_atomic(path: str, data: Any):
+    """Write a JSON file via fsync + rename so readers never see it half-written"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(path)
+
+class LogStore:
+    """
+    Keyed JSON records kept in memory, persisted as snapshot + append-only log
+
+    Every write appends one `{"key": ..., "value": ...}` line to the log, so
+    writes cost O(record) instead of rewriting the whole file. Once the log
+    holds as many records as the store (and at least `compact_min`), it is
+    compacted: the snapshot is rewritten atomically and the log truncated,
+    which keeps writes O(1) amortized. Replaying a log over a snapshot is
+    idempotent, so a crash at any point loses at most a torn last line.
+
+    A lock file serializes writers across processes (threads within a
+    process share a lock); each store catches up on records other
+    processes appended before reading or writing.
+
+    `key_field` names the key inside each record when the snapshot is a
+    list (orders, menu); without it the snapshot is a dict of key -> record
+    (sessions). `index_field` keeps a secondary index of keys by that field.
+    """
+
+    def __init__(self, snapshot_path: str, log_path: str, key_field: Optional[str] = None,
+                 index_field: Optional[str] = None, fsync: bool = JSON_STORE_FSYNC,
+                 compact_min: int = JSON_COMPACT_MIN_RECORDS):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        self.key_field = key_field
+        self.index_field = index_field
+        self.fsync = fsync
+        self.compact_min = compact_min
+
+        self._records: Dict[Any, dict] = {}
+        self._index: Dict[Any, Dict[Any, None]] = {}
+        self._log_records = 0
+        self._log_offset = 0
+        self._snapshot_stat = None
+        self._loaded = False
+        self._thread_lock = threading.RLock()
+        self._lock_file = None
+        self._lock_pid = None
+        self._lock_depth = 0
+
+    # ---------- locking ----------
+
+    def _locked(self, shared: bool = False) -> "_StoreLock":
+        return _StoreLock(self, shared)
+
+    def _open_lock_file(self):
+        # A forked child shares the parent's open file (and so its flock);
+        # it needs its own to actually exclude the parent
+        if self._lock_file is None or self._lock_pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+            self._lock_file = open(f"{self.log_path}.lock", 'a+')
+            self._lock_pid = os.getpid()
+        return self._lock_file
+
+    # ---------- loading ----------
+
+    def _stat(self, path: str):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _reload(self):
+        """Load the snapshot and replay the whole log"""
+        self._records = {}
+        self._index = {}
+        self._snapshot_stat = self._stat(self.snapshot_path)
+        if self._snapshot_stat is not None:
+            with open(self.snapshot_path, 'r') as f:
+                data = json.load(f)
+            items = data if self.key_field else data.items()
+            for item in items:
+                if self.key_field:
+                    self._apply(item[self.key_field], item)
+                else:
+                    self._apply(*item)
+        self._log_offset = 0
+        self._log_records = 0
+        self._loaded = True
+        self._catch_up()
+
+    def _catch_up(self):
+        """Replay log records appended since we last looked (by any process)"""
+        if not self._loaded or self._stat(self.snapshot_path) != self._snapshot_stat:
+            self._reload()
+            return
+        log_stat = self._stat(self.log_path)
+        size = log_stat[2] if log_stat else 0
+        if size < self._log_offset:
+            # Compacted by another process
+            self._reload()
+            return
+        if size == self._log_offset:
+            return
+        with open(self.log_path, 'rb') as f:
+            f.seek(self._log_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Torn or in-progress write; picked up next time
+                self._log_offset += len(line)
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                self._apply(record["key"], record["value"])
+                self._log_records += 1
+
+    def _apply(self, key, value: dict):
+        if self.index_field:
+            previous = self._records.get(key)
+            if previous is not None:
+                self._index.get(previous.get(self.index_field), {}).pop(key, None)
+            self._index.setdefault(value.get(self.index_field), {})[key] = None
+        self._records[key] = value
+
+    # ---------- reads ----------
+
+    def get(self, key) -> Optional[dict]:
+        with self._locked(shared=True):
+            return self._records.get(key)
+
+    def values(self) -> List[dict]:
+        with self._locked(shared=True):
+            return list(self._records.values())
+
+    def items(self) -> List[tuple]:
+        with self._locked(shared=True):
+            return list(self._records.items())
+
+    def find(self, index_value) -> List[dict]:
+        """Records whose `index_field` equals index_value, in insertion order"""
+        with self._locked(shared=True):
+            return [self._records[key] for key in self._index.get(index_value, ())]
+
+    # ---------- writes ----------
+
+    def put(self, key, value: dict):
+        with self._locked():
+            self._append(key, value)
+
+    def update(self, mutate: Callable[[Dict[Any, dict]], Iterator[tuple]]):
+        """
+        Read-modify-write under the store lock
+
+        `mutate` receives the current records (read-only) and yields
+        (key, value) pairs to write.
+        """
+        with self._locked():
+            for key, value in list(mutate(self._records)):
+                self._append(key, value)
+
+    def replace_all(self, records: Dict[Any, dict]):
+        """Replace every record (a full rewrite, like the old write_* functions)"""
+        with self._locked():
+            self._records = {}
+            self._index = {}
+            for key, value in records.items():
+                self._apply(key, value)
+            self._compact()
+
+    def _append(self, key, value: dict):
+        line = json.dumps({"key": key, "value": value}, separators=(",", ":")) + "\n"
+        with open(self.log_path, 'ab') as f:
+            if f.tell() > self._log_offset:
+                # A torn line left by a crashed writer - drop it
+                f.truncate(self._log_offset)
+            f.write(line.encode())
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+            self._log_offset = f.tell()
+        self._log_records += 1
+        self._apply(key, value)
+        if self._log_records >= max(self.compact_min, len(self._records)):
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the snapshot atomically, then truncate the log"""
+        _write_atomic(
+            self.snapshot_path,
+            list(self._records.values()) if self.key_field else self._records
+        )
+        # A crash before the truncate only leaves records the snapshot
+        # already contains; replaying them is harmless
+        with open(self.log_path, 'wb') as f:
+            if self.fsync:
+                os.fsync(f.fileno())
+        self._snapshot_stat = self._stat(self.snapshot_path)
+        self._log_offset = 0
+        self._log_records = 0
+
+    def compact(self):
+        """Force a compaction"""
+        with self._locked():
+            self._compact()
+
+    def ensure(self, default_records: Dict[Any, dict]):
+        """Create the snapshot with default records if the store is empty"""
+        with self._locked():
+            if self._snapshot_stat is None and not self._records:
+                self.replace_all(default_records)
+
+class _StoreLock:
+    """Thread lock + inter-process file lock, then catch up with the log"""
+
+    def __init__(self, store: LogStore, shared: bool):
+        self.store = store
+        self.shared = shared
+
+    def __enter__(self):
+        store = self.store
+        store._thread_lock.acquire()
+        try:
+            if store._lock_depth == 0:
+                _lock(store._open_lock_file(), self.shared)
+                try:
+                    store._catch_up()
+                except BaseException:
+                    _unlock(store._lock_file)
+                    raise
+            store._lock_depth += 1
+        except BaseException:
+            store._thread_lock.release()
+            raise
+        return store
+
+    def __exit__(self, *exc):
+        store = self.store
+        store._lock_depth -= 1
+        if store._lock_depth == 0:
+            _unlock(store._lock_file)
+        store._thread_lock.release()
+        return False
+
+DEFAULT_MENU = [
+    {"id": 1, "name": "Margherita Pizza", "description": "Classic cheese pizza", "price": 299.0, "is_available": True},
+    {"id": 2, "name": "Pepperoni Pizza", "description": "Spicy pepperoni pizza", "price": 349.0, "is_available": True},
+    {"id": 3, "name": "Coke", "description": "Cold beverage", "price": 50.0, "is_available": True},
+    {"id": 4, "name": "Garlic Bread", "description": "Crispy garlic bread", "price": 99.0, "is_available": True}
+]
+
+menu_store = LogStore(MENU_FILE, MENU_LOG, key_field="id")
+orders_store = LogStore(ORDERS_FILE, ORDERS_LOG, key_field="id", index_field="customer_whatsapp")
+sessions_store = LogStore(SESSIONS_FILE, SESSIONS_LOG)
 
 # Initialize JSON files if they don't exist
 def initialize_files():
     """Create JSON files with default data if they don't exist"""
-    if not os.path.exists(MENU_FILE):
-        default_menu = [
-            {"id": 1, "name": "Margherita Pizza", "description": "Classic cheese pizza", "price": 299.0, "is_available": True},
-            {"id": 2, "name": "Pepperoni Pizza", "description": "Spicy pepperoni pizza", "price": 349.0, "is_available": True},
-            {"id": 3, "name": "Coke", "description": "Cold beverage", "price": 50.0, "is_available": True},
-            {"id": 4, "name": "Garlic Bread", "description": "Crispy garlic bread", "price": 99.0, "is_available": True}
-        ]
-        with open(MENU_FILE, 'w') as f:
-            json.dump(default_menu, f, indent=2)
-    
-    if not os.path.exists(ORDERS_FILE):
-        with open(ORDERS_FILE, 'w') as f:
-            json.dump([], f, indent=2)
-    
-    if not os.path.exists(SESSIONS_FILE):
-        with open(SESSIONS_FILE, 'w') as f:
-            json.dump({}, f, indent=2)
+    menu_store.ensure({item["id"]: item for item in DEFAULT_MENU})
+    orders_store.ensure({})
+    sessions_store.ensure({})
 
 # Menu operations
 def read_menu() -> List[MenuItem]:
     """Read all menu items"""
-    with open(MENU_FILE, 'r') as f:
-        data = json.load(f)
-    return [MenuItem(**item) for item in data]
+    return [MenuItem(**item) for item in menu_store.values()]
 
 def write_menu(menu_items: List[MenuItem]):
     """Write menu items to file"""
-    with open(MENU_FILE, 'w') as f:
-        json.dump([item.model_dump() for item in menu_items], f, indent=2)
+    menu_store.replace_all({item.id: item.model_dump() for item in menu_items})
 
 def get_menu_item(item_id: int) -> Optional[MenuItem]:
     """Get a specific menu item by ID"""
-    menu = read_menu()
-    for item in menu:
-        if item.id == item_id:
-            return item
-    return None
+    item = menu_store.get(item_id)
+    return MenuItem(**item) if item else None
 
 def add_menu_item(item: MenuItem) -> MenuItem:
     """Add a new menu item"""
-    menu = read_menu()
-    # Generate new ID
-    item.id = max([m.id for m in menu], default=0) + 1
-    menu.append(item)
-    write_menu(menu)
+    def mutate(menu):
+        # Generate new ID
+        item.id = max(menu, default=0) + 1
+        yield item.id, item.model_dump()
+    menu_store.update(mutate)
     return item
 
 def update_menu_item(item_id: int, updates: Dict[str, Any]) -> Optional[MenuItem]:
     """Update a menu item"""
-    menu = read_menu()
-    for i, item in enumerate(menu):
-        if item.id == item_id:
-            updated_data = item.model_dump()
+    updated = []
+    def mutate(menu):
+        if item_id in menu:
+            updated_data = dict(menu[item_id])
             updated_data.update({k: v for k, v in updates.items() if v is not None})
-            menu[i] = MenuItem(**updated_data)
-            write_menu(menu)
-            return menu[i]
-    return None
+            updated.append(MenuItem(**updated_data))
+            yield item_id, updated[0].model_dump()
+    menu_store.update(mutate)
+    return updated[0] if updated else None
 
 # Order operations
 def read_orders() -> List[Order]:
     """Read all orders"""
-    with open(ORDERS_FILE, 'r') as f:
-        data = json.load(f)
-    return [Order(**order) for order in data]
+    return [Order(**order) for order in orders_store.values()]
 
 def write_orders(orders: List[Order]):
     """Write orders to file"""
-    with open(ORDERS_FILE, 'w') as f:
-        json.dump([order.model_dump() for order in orders], f, indent=2)
+    orders_store.replace_all({order.id: order.model_dump() for order in orders})
 
 def get_order(order_id: int) -> Optional[Order]:
     """Get a specific order by ID"""
-    orders = read_orders()
-    for order in orders:
-        if order.id == order_id:
-            return order
-    return None
+    order = orders_store.get(order_id)
+    return Order(**order) if order else None
 
 def add_order(order: Order) -> Order:
     """Add a new order"""
-    orders = read_orders()
-    # Generate new ID
-    order.id = max([o.id for o in orders], default=0) + 1
-    order.created_at = datetime.now().isoformat()
-    orders.append(order)
-    write_orders(orders)
+    def mutate(orders):
+        # Generate new ID
+        order.id = max(orders, default=0) + 1
+        order.created_at = datetime.now().isoformat()
+        yield order.id, order.model_dump()
+    orders_store.update(mutate)
     return order
 
 def update_order_status(order_id: int, status: str) -> Optional[Order]:
     """Update order status"""
-    orders = read_orders()
-    for i, order in enumerate(orders):
-        if order.id == order_id:
-            orders[i].status = status
-            write_orders(orders)
-            return orders[i]
-    return None
+    updated = []
+    def mutate(orders):
+        if order_id in orders:
+            updated.append(Order(**{**orders[order_id], "status": status}))
+            yield order_id, updated[0].model_dump()
+    orders_store.update(mutate)
+    return updated[0] if updated else None
 
 def cancel_order(order_id: int) -> Optional[Order]:
     """Cancel an order"""
@@ -117,8 +389,7 @@ def cancel_order(order_id: int) -> Optional[Order]:
 
 def get_customer_orders(whatsapp_number: str) -> List[Order]:
     """Get all orders for a customer"""
-    orders = read_orders()
-    return [order for order in orders if order.customer_whatsapp == whatsapp_number]
+    return [Order(**order) for order in orders_store.find(whatsapp_number)]
 
 def get_customer_active_orders(whatsapp_number: str) -> List[Order]:
     """Get active orders for a customer (not delivered or cancelled)"""
@@ -128,31 +399,26 @@ def get_customer_active_orders(whatsapp_number: str) -> List[Order]:
 # Customer session operations
 def read_sessions() -> Dict[str, CustomerSession]:
     """Read all customer sessions"""
-    with open(SESSIONS_FILE, 'r') as f:
-        data = json.load(f)
-    return {phone: CustomerSession(**session) for phone, session in data.items()}
+    return {phone: CustomerSession(**session) for phone, session in sessions_store.items()}
 
 def write_sessions(sessions: Dict[str, CustomerSession]):
     """Write sessions to file"""
-    with open(SESSIONS_FILE, 'w') as f:
-        json.dump({phone: session.model_dump() for phone, session in sessions.items()}, f, indent=2)
+    sessions_store.replace_all({phone: session.model_dump() for phone, session in sessions.items()})
 
 def get_customer_session(whatsapp_number: str) -> CustomerSession:
     """Get or create customer session"""
-    sessions = read_sessions()
-    if whatsapp_number not in sessions:
-        sessions[whatsapp_number] = CustomerSession(
-            last_interaction=datetime.now().isoformat()
-        )
-        write_sessions(sessions)
-    return sessions[whatsapp_number]
+    created = []
+    def mutate(sessions):
+        if whatsapp_number not in sessions:
+            created.append(CustomerSession(last_interaction=datetime.now().isoformat()))
+            yield whatsapp_number, created[0].model_dump()
+    sessions_store.update(mutate)
+    return created[0] if created else CustomerSession(**sessions_store.get(whatsapp_number))
 
 def update_customer_session(whatsapp_number: str, session: CustomerSession):
     """Update customer session"""
-    sessions = read_sessions()
     session.last_interaction = datetime.now().isoformat()
-    sessions[whatsapp_number] = session
-    write_sessions(sessions)
+    sessions_store.put(whatsapp_number, session.model_dump())
 
 def clear_customer_cart(whatsapp_number: str):
     """Clear customer's cart"""
@@ -1,24 +1,64 @@
-from fastapi import FastAPI, HTTPException, Request, Depends
-from fastapi.responses import JSONResponse
+import asyncio
+import json
+import logging
+import os
+import zlib
+from datetime import datetime
+from fastapi import FastAPI, HTTPException, Request, Response, Depends, Query
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from typing import AsyncIterator, List, Mapping, Optional, Tuple
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 import db_handler
 import whatsapp_service
 import conversation_handler
 import message_formatter
-from database import init_db, initialize_sample_data, get_db
+import menu_cache
+import metrics
+import app_logging
+import tracing
+from event_hub import order_events, publish_order_event, format_sse
+from message_queue import InboundQueue
+from message_dedup import message_dedup
+from session_store import session_store
+from session_sweeper import session_sweeper
+from database import init_db, initialize_sample_data, get_db, engine, SessionLocal
 from models import (
     MenuItem, MenuItemCreate, MenuItemUpdate,
-    Order, OrderCreate, OrderStatusUpdate
+    Order, OrderCreate, OrderStatusUpdate, OrderBulkStatusUpdate
 )
 
+# Structured JSON logs, written by a background thread
+app_logging.setup_logging()
+logger = logging.getLogger(__name__)
+
+# Order listing page sizes
+ORDERS_PAGE_SIZE = int(os.getenv('ORDERS_PAGE_SIZE', '100'))
+ORDERS_MAX_PAGE_SIZE = int(os.getenv('ORDERS_MAX_PAGE_SIZE', '500'))
+
+# Bulk order ingest: rows per transaction and per request
+ORDERS_BULK_CHUNK_SIZE = int(os.getenv('ORDERS_BULK_CHUNK_SIZE', '500'))
+ORDERS_BULK_MAX_ROWS = int(os.getenv('ORDERS_BULK_MAX_ROWS', '10000'))
+ORDERS_BULK_STATUS_MAX_IDS = int(os.getenv('ORDERS_BULK_STATUS_MAX_IDS', '1000'))
+
 app = FastAPI(
     title="Food Ordering System API",
-    description="Backend for WhatsApp-based food ordering system with SQLite database",
+    description="Backend for WhatsApp-based food ordering system with SQLite or PostgreSQL database",
     version="2.0.0"
 )
 
+# Inbound WhatsApp messages are processed off the request path
+inbound_queue = InboundQueue(conversation_handler.handle_incoming_message)
+
+# Request latency / in-flight / DB query metrics, served on /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(engine)
+
+# Correlation ID per request, carried into queued messages and outbound sends
+app.add_middleware(app_logging.CorrelationMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -26,8 +66,34 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods (GET, POST, PUT, DELETE, etc.)
     allow_headers=["*"],  # Allows all headers
+    expose_headers=["X-Next-Cursor", "Link", "ETag", "X-Revision", "X-More-Changes"],  # Paging/change-feed headers for the dashboard
 )
 
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Check the request's If-None-Match header against an ETag (weak comparison)"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+def _set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"  # Always revalidate, never serve stale
+
+def _not_modified(etag: str) -> Response:
+    response = Response(status_code=304)
+    _set_etag(response, etag)
+    return response
+
+@app.exception_handler(db_handler.InvalidTransitionError)
+async def invalid_transition_handler(request: Request, exc: db_handler.InvalidTransitionError):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+@app.exception_handler(db_handler.ConcurrentUpdateError)
+async def concurrent_update_handler(request: Request, exc: db_handler.ConcurrentUpdateError):
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
+
 # ==================== MENU ENDPOINTS ====================
 
 @app.post("/menu/", response_model=MenuItem, tags=["Menu"])
@@ -45,18 +111,25 @@ def create_menu_item(item: MenuItemCreate, db: Session = Depends(get_db)):
     return created_item
 
 @app.get("/menu/", response_model=List[MenuItem], tags=["Menu"])
-def get_all_menu_items(db: Session = Depends(get_db)):
+def get_all_menu_items(request: Request, response: Response):
     """
     Retrieve all menu items
+    
+    Supports **If-None-Match**: an unchanged menu returns 304 with no body.
     """
-    return db_handler.read_menu(db)
+    snapshot = menu_cache.get_menu_snapshot()
+    etag = f'W/"menu-{snapshot.version}"'
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+    _set_etag(response, etag)
+    return list(snapshot.items)
 
 @app.get("/menu/{item_id}", response_model=MenuItem, tags=["Menu"])
-def get_menu_item(item_id: int, db: Session = Depends(get_db)):
+def get_menu_item(item_id: int):
     """
     Retrieve a specific menu item by ID
     """
-    item = db_handler.get_menu_item(db, item_id)
+    item = menu_cache.get_menu_snapshot().by_id.get(item_id)
     if not item:
         raise HTTPException(status_code=404, detail="Menu item not found")
     return item
@@ -88,13 +161,14 @@ def create_order(order: OrderCreate, db: Session = Depends(get_db)):
     - **customer_whatsapp**: Customer's WhatsApp number (with country code)
     - **items**: List of items with quantities
     """
-    # Validate items
-    is_valid, error_msg = conversation_handler.validate_order_items(order.items)
+    # Validate and price against one menu snapshot
+    menu = menu_cache.get_menu_snapshot().by_id
+    is_valid, error_msg = conversation_handler.validate_order_items(order.items, menu)
     if not is_valid:
         raise HTTPException(status_code=400, detail=error_msg)
     
     # Calculate total
-    total = conversation_handler.calculate_order_total(order.items)
+    total = conversation_handler.calculate_order_total(order.items, menu)
     
     # Create order
     new_order = Order(
@@ -108,9 +182,10 @@ def create_order(order: OrderCreate, db: Session = Depends(get_db)):
     )
     
     created_order = db_handler.add_order(db, new_order)
+    publish_order_event("order.created", created_order)
     
     # Send WhatsApp confirmation
-    items_summary = message_formatter.format_items_summary(order.items)
+    items_summary = message_formatter.format_items_summary(order.items, menu)
     whatsapp_service.send_order_confirmation(
         order.customer_whatsapp,
         created_order.id,
@@ -120,12 +195,301 @@ def create_order(order: OrderCreate, db: Session = Depends(get_db)):
     
     return created_order
 
+async def _bulk_order_rows(request: Request) -> AsyncIterator[Tuple[int, object]]:
+    """Yield (index, row) from a JSON array body or, streamed, from NDJSON lines"""
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        index = 0
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield index, line
+                    index += 1
+        if buffer.strip():
+            yield index, buffer
+        return
+    
+    try:
+        rows = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON array of orders or NDJSON")
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array of orders or NDJSON")
+    if len(rows) > ORDERS_BULK_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"More than {ORDERS_BULK_MAX_ROWS} orders in one request")
+    for index, row in enumerate(rows):
+        yield index, row
+
+def _validate_bulk_order(row: object, menu: Mapping[int, MenuItem]) -> Order:
+    """Parse and price one bulk row; raises ValueError with the reason it was rejected"""
+    try:
+        if isinstance(row, (bytes, str)):
+            order = OrderCreate.model_validate_json(row)
+        else:
+            order = OrderCreate.model_validate(row)
+    except ValidationError as e:
+        raise ValueError("; ".join(
+            f"{'.'.join(str(part) for part in error['loc']) or 'body'}: {error['msg']}" for error in e.errors()
+        ))
+    
+    is_valid, error_msg = conversation_handler.validate_order_items(order.items, menu)
+    if not is_valid:
+        raise ValueError(error_msg)
+    
+    return Order(
+        id=0,
+        customer_whatsapp=order.customer_whatsapp,
+        customer_name=order.customer_name,
+        items=order.items,
+        status="pending",
+        total_price=conversation_handler.calculate_order_total(order.items, menu),
+        created_at=""
+    )
+
+def _insert_bulk_orders(chunk: List[Tuple[int, Order]], menu: Mapping[int, MenuItem]) -> List[dict]:
+    """Insert one chunk of validated orders in its own transaction, then queue confirmations"""
+    db = SessionLocal()
+    try:
+        created = db_handler.add_orders_bulk(db, [order for _, order in chunk])
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Bulk order chunk failed", extra={"event": "orders.bulk_chunk_failed", "rows": len(chunk)})
+        return [{"index": index, "status": "failed", "error": "Could not save order"} for index, _ in chunk]
+    finally:
+        db.close()
+    
+    for order in created:
+        publish_order_event("order.created", order)
+        whatsapp_service.send_order_confirmation(
+            order.customer_whatsapp,
+            order.id,
+            message_formatter.format_items_summary(order.items, menu),
+            order.total_price
+        )
+    return [{"index": index, "status": "created", "order_id": order.id} for (index, _), order in zip(chunk, created)]
+
+@app.post("/orders/bulk", tags=["Orders"])
+async def create_orders_bulk(request: Request):
+    """
+    Create many orders in one request (partner aggregators, in-store POS)
+    
+    The body is a JSON array of orders (same fields as **POST /orders/**)
+    or, with `Content-Type: application/x-ndjson`, one order per line,
+    processed as it streams in. Every row is validated and priced against
+    one menu snapshot; valid rows are inserted in chunks of
+    ORDERS_BULK_CHUNK_SIZE, each chunk in its own transaction, and
+    confirmations are queued for asynchronous delivery.
+    
+    The response reports every row by its position in the input:
+    `created` with its `order_id`, or `failed` with an `error`. A failed
+    row never blocks the others.
+    
+    At most ORDERS_BULK_MAX_ROWS orders are accepted per request: a larger
+    JSON array is rejected with 413; an NDJSON stream stops being read at
+    the limit and the response is marked `truncated`.
+    """
+    menu = menu_cache.get_menu_snapshot().by_id
+    results: List[dict] = []
+    pending: List[Tuple[int, Order]] = []
+    received = 0
+    truncated = False
+    
+    async for index, row in _bulk_order_rows(request):
+        if index >= ORDERS_BULK_MAX_ROWS:
+            truncated = True
+            break
+        received += 1
+        try:
+            pending.append((index, _validate_bulk_order(row, menu)))
+        except ValueError as e:
+            results.append({"index": index, "status": "failed", "error": str(e)})
+            continue
+        if len(pending) >= ORDERS_BULK_CHUNK_SIZE:
+            results.extend(await run_in_threadpool(_insert_bulk_orders, pending, menu))
+            pending = []
+    
+    if pending:
+        results.extend(await run_in_threadpool(_insert_bulk_orders, pending, menu))
+    
+    results.sort(key=lambda result: result["index"])
+    created = sum(1 for result in results if result["status"] == "created")
+    logger.info("Bulk orders processed", extra={
+        "event": "orders.bulk_created", "received": received, "orders_created": created, "truncated": truncated
+    })
+    return {
+        "received": received,
+        "created": created,
+        "failed": received - created,
+        "truncated": truncated,
+        "results": results
+    }
+
 @app.get("/orders/", response_model=List[Order], tags=["Orders"])
-def get_all_orders(db: Session = Depends(get_db)):
+def get_all_orders(
+    request: Request,
+    response: Response,
+    status: Optional[List[str]] = Query(None, description="Filter by status (repeatable)"),
+    customer: Optional[str] = Query(None, description="Filter by customer WhatsApp number"),
+    created_from: Optional[datetime] = Query(None, description="Orders created at or after this time"),
+    created_to: Optional[datetime] = Query(None, description="Orders created before this time"),
+    sort: str = Query("created_at", pattern="^-?created_at$", description="created_at or -created_at"),
+    limit: int = Query(ORDERS_PAGE_SIZE, ge=1, le=ORDERS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="Cursor from the previous page's X-Next-Cursor"),
+    since: Optional[int] = Query(None, ge=0, description="Only orders changed after this revision (X-Revision)"),
+    db: Session = Depends(get_db)
+):
+    """
+    Retrieve orders, one page at a time
+    
+    Pages are keyset-paginated on (created_at, id). When more orders are
+    available the response carries an **X-Next-Cursor** header (and a
+    `Link: rel="next"` header); pass it back as `cursor` with the same
+    filters to fetch the next page.
+    
+    Every response carries an **X-Revision** header. Pass it back as `since`
+    to get only the orders created or changed after it (other filters are
+    ignored); **X-More-Changes** is set when another call is needed to
+    catch up. Supports **If-None-Match**: when no order changed the
+    response is a 304 with no body.
+    """
+    # Read the revision before any rows so a concurrent change is never skipped
+    revision = db_handler.get_orders_revision(db)
+    etag = f'W/"orders-{revision}-{zlib.crc32(str(request.query_params).encode()):x}"'
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+    _set_etag(response, etag)
+    
+    if since is not None:
+        orders, revision, has_more = db_handler.get_orders_changed_since(db, since, limit)
+        response.headers["X-Revision"] = str(revision)
+        if has_more:
+            response.headers["X-More-Changes"] = "true"
+        return orders
+    
+    response.headers["X-Revision"] = str(revision)
+    
+    try:
+        after = db_handler.decode_order_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    orders, next_cursor = db_handler.list_orders(
+        db,
+        statuses=status,
+        customer_whatsapp=customer,
+        created_from=created_from,
+        created_to=created_to,
+        descending=sort.startswith("-"),
+        after=after,
+        limit=limit
+    )
+    
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+        next_url = request.url.include_query_params(cursor=next_cursor)
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    
+    return orders
+
+@app.get("/orders/events", tags=["Orders"])
+async def order_event_stream(request: Request):
+    """
+    Live order updates as Server-Sent Events
+    
+    Events: **order.created**, **order.status_changed**, **order.cancelled**
+    (data is the order JSON). Reconnecting clients send **Last-Event-ID**
+    to resume; a **reset** event means the client missed too much and
+    should reload the order list.
+    """
+    last_event_id = request.headers.get("last-event-id") or request.query_params.get("last_event_id")
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    
+    subscriber = order_events.subscribe(last_event_id)
+    
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not subscriber.closed:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None or subscriber.closed:
+                    break
+                yield format_sse(event)
+        finally:
+            order_events.unsubscribe(subscriber)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Declared before /orders/{order_id}, which would otherwise match "bulk"
+@app.patch("/orders/bulk", tags=["Orders"])
+def update_orders_status_bulk(update: OrderBulkStatusUpdate, db: Session = Depends(get_db)):
     """
-    Retrieve all orders
+    Move many orders to one status and queue WhatsApp notifications
+    
+    - **order_ids**: Orders to update (up to ORDERS_BULK_STATUS_MAX_IDS)
+    - **status**: New status
+    - **from_status**: Optional - only move orders currently in one of these statuses
+    
+    All orders change in one UPDATE and one commit; notifications go to the
+    async outbound sender, so the call never waits on Twilio. Each ID is
+    reported as `updated`, `not_found`, or `skipped` (with its
+    `current_status`) when its status can't move to `status` or
+    `from_status` excluded it.
     """
-    return db_handler.read_orders(db)
+    for status in [update.status, *(update.from_status or [])]:
+        if status not in db_handler.ORDER_STATUSES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid status. Allowed: {', '.join(db_handler.ORDER_STATUSES)}"
+            )
+    
+    order_ids = list(dict.fromkeys(update.order_ids))
+    if len(order_ids) > ORDERS_BULK_STATUS_MAX_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {ORDERS_BULK_STATUS_MAX_IDS} orders per request"
+        )
+    
+    updated_orders = db_handler.update_orders_status(db, order_ids, update.status, update.from_status)
+    db.commit()
+    
+    for order in updated_orders:
+        publish_order_event("order.status_changed", order)
+        whatsapp_service.send_order_status_update(order.customer_whatsapp, order.id, order.status)
+    
+    updated = {order.id for order in updated_orders}
+    missed = [order_id for order_id in order_ids if order_id not in updated]
+    current = db_handler.get_order_statuses(db, missed) if missed else {}
+    
+    results = []
+    for order_id in order_ids:
+        if order_id in updated:
+            results.append({"order_id": order_id, "status": "updated"})
+        elif order_id in current:
+            results.append({"order_id": order_id, "status": "skipped", "current_status": current[order_id]})
+        else:
+            results.append({"order_id": order_id, "status": "not_found"})
+    
+    return {
+        "updated": len(updated),
+        "skipped": len(current),
+        "not_found": len(order_ids) - len(updated) - len(current),
+        "results": results
+    }
 
 @app.get("/orders/{order_id}", response_model=Order, tags=["Orders"])
 def get_order(order_id: int, db: Session = Depends(get_db)):
@@ -142,32 +506,25 @@ def update_order_status(order_id: int, status_update: OrderStatusUpdate, db: Ses
     """
     Update order status and send WhatsApp notification
     
-    Allowed statuses:
-    - pending
-    - preparing
-    - out-for-delivery
-    - delivered
-    - cancelled
-    """
-    allowed_statuses = ["pending", "preparing", "out-for-delivery", "delivered", "cancelled"]
-    
-    if status_update.status not in allowed_statuses:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid status. Allowed: {', '.join(allowed_statuses)}"
-        )
+    Allowed transitions:
+    - pending → preparing, cancelled
+    - preparing → out-for-delivery, cancelled
+    - out-for-delivery → delivered, cancelled
     
-    # Get order first
-    order = db_handler.get_order(db, order_id)
-    if not order:
+    Any other change is a 400. Pass the order's **version** to make the
+    update conditional: if the order changed since that version the
+    response is a 409 and nothing is updated.
+    """
+    updated_order = db_handler.update_order_status(
+        db, order_id, status_update.status, expected_version=status_update.version
+    )
+    if not updated_order:
         raise HTTPException(status_code=404, detail="Order not found")
-    
-    # Update status
-    updated_order = db_handler.update_order_status(db, order_id, status_update.status)
+    publish_order_event("order.status_changed", updated_order)
     
     # Send WhatsApp notification
     whatsapp_service.send_order_status_update(
-        order.customer_whatsapp,
+        updated_order.customer_whatsapp,
         order_id,
         status_update.status
     )
@@ -178,22 +535,16 @@ def update_order_status(order_id: int, status_update: OrderStatusUpdate, db: Ses
 def cancel_order(order_id: int, db: Session = Depends(get_db)):
     """
     Cancel an order and send WhatsApp notification
-    """
-    order = db_handler.get_order(db, order_id)
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    if order.status in ["delivered", "cancelled"]:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Cannot cancel order with status: {order.status}"
-        )
     
-    # Cancel order
+    Delivered or already cancelled orders can't be cancelled (400).
+    """
     cancelled_order = db_handler.cancel_order(db, order_id)
+    if not cancelled_order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    publish_order_event("order.cancelled", cancelled_order)
     
     # Send WhatsApp notification
-    whatsapp_service.send_order_cancellation(order.customer_whatsapp, order_id)
+    whatsapp_service.send_order_cancellation(cancelled_order.customer_whatsapp, order_id)
     
     return {"message": f"Order #{order_id} cancelled successfully"}
 
@@ -204,7 +555,9 @@ async def whatsapp_webhook(request: Request):
     """
     Webhook endpoint for receiving WhatsApp messages from Twilio
     
-    Twilio will POST to this endpoint when a customer sends a message
+    Twilio will POST to this endpoint when a customer sends a message.
+    The message is queued for a background worker and acknowledged
+    immediately so Twilio never waits on DB or outbound message I/O.
     """
     try:
         # Parse form data from Twilio
@@ -213,11 +566,37 @@ async def whatsapp_webhook(request: Request):
         # Extract relevant fields
         from_number = form_data.get("From", "").replace("whatsapp:", "")
         message_body = form_data.get("Body", "")
+        message_sid = form_data.get("MessageSid")
+        
+        # Twilio retries a webhook it thinks failed; acknowledge repeats
+        # of an accepted message without queueing them again
+        if not message_dedup.claim(message_sid):
+            logger.info("Duplicate message acknowledged", extra={
+                "event": "message.duplicate",
+                "from_number": from_number,
+                "message_sid": message_sid
+            })
+            return JSONResponse(content={"status": "duplicate"}, status_code=200)
         
-        print(f"📨 Received message from {from_number}: {message_body}")
+        logger.info("Message received", extra={
+            "event": "message.received",
+            "from_number": from_number,
+            "message_sid": message_sid,
+            "body": message_body
+        })
         
-        # Process the message through conversation handler
-        conversation_handler.handle_incoming_message(from_number, message_body)
+        # Queue the message for the conversation handler workers
+        if not inbound_queue.enqueue(from_number, message_body, message_sid):
+            message_dedup.release(message_sid)
+            logger.warning("Inbound queue full, rejecting message", extra={
+                "event": "message.rejected",
+                "from_number": from_number
+            })
+            return JSONResponse(
+                content={"status": "busy"},
+                status_code=503,
+                headers={"Retry-After": "1"}
+            )
         
         # Twilio expects a 200 OK response
         return JSONResponse(
@@ -226,14 +605,59 @@ async def whatsapp_webhook(request: Request):
         )
     
     except Exception as e:
-        print(f"❌ Error processing webhook: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error processing webhook", extra={"event": "webhook.error"})
         return JSONResponse(
             content={"status": "error", "message": str(e)},
             status_code=500
         )
 
+@app.get("/webhook/whatsapp/stats", tags=["WhatsApp"])
+def whatsapp_queue_stats():
+    """
+    Inbound message queue depth and throughput counters, and MessageSid dedup counters
+    """
+    return {**inbound_queue.stats(), "dedup": message_dedup.stats()}
+
+@app.get("/webhook/whatsapp/outbound", tags=["WhatsApp"])
+async def whatsapp_outbound_stats():
+    """
+    Outbound message sender counters
+    """
+    return whatsapp_service.sender.stats()
+
+@app.get("/webhook/whatsapp/sessions", tags=["WhatsApp"])
+def whatsapp_session_stats():
+    """
+    Live / expired / archived session counts, sweeper and cache counters
+    """
+    return {**session_sweeper.stats(), "cache": session_store.stats()}
+
+@app.get("/webhook/whatsapp/traces", tags=["WhatsApp"])
+def whatsapp_trace_report():
+    """
+    Conversation tracing counters and per-state latency of recent turns (TRACING=on)
+    """
+    return tracing.tracer.stats()
+
+# ==================== METRICS ====================
+
+for name, documentation, function in (
+    ("whatsapp_inbound_queue_depth", "Inbound messages waiting for a worker", inbound_queue.depth),
+    ("whatsapp_outbound_pending", "Outbound messages waiting to be sent", whatsapp_service.sender.pending),
+    ("whatsapp_outbound_in_flight", "Twilio API calls in progress", lambda: whatsapp_service.sender.in_flight),
+    ("session_cache_entries", "Customer sessions held in memory", lambda: session_store.stats()["entries"]),
+    ("session_cache_dirty", "Customer sessions waiting to be written back", session_store.dirty_count),
+    ("order_event_subscribers", "Connected order event streams", lambda: order_events.stats()["subscribers"]),
+):
+    metrics.registry.register(metrics.Gauge(name, documentation, function=function))
+
+@app.get("/metrics", tags=["Health"], response_class=PlainTextResponse)
+def prometheus_metrics():
+    """
+    Metrics in Prometheus text format
+    """
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 # ==================== HEALTH CHECK ====================
 
 @app.get("/", tags=["Health"])
@@ -245,7 +669,7 @@ def root():
         "status": "online",
         "service": "Food Ordering System API",
         "version": "2.0.0",
-        "database": "SQLite"
+        "database": engine.dialect.name
     }
 
 # ==================== STARTUP EVENT ====================
@@ -255,10 +679,33 @@ def startup_event():
     """Initialize database on startup"""
     init_db()
     initialize_sample_data()
-    print("✅ Food Ordering System API started successfully!")
-    print("📝 Access API docs at: http://localhost:8000/docs")
-    print("📋 OpenAPI spec at: http://localhost:8000/openapi.json")
-    print("💾 Database: SQLite (food_ordering.db)")
+    menu_cache.refresh_menu()
+    logger.info("Food Ordering System API started", extra={
+        "event": "app.started",
+        "docs": "http://localhost:8000/docs",
+        "openapi": "http://localhost:8000/openapi.json",
+        "database": engine.url.render_as_string(hide_password=True)
+    })
+
+@app.on_event("startup")
+async def start_background_workers():
+    """Start the event hub, the trace exporter, the session writer and sweeper, the outbound sender and the inbound message workers"""
+    order_events.start()
+    tracing.tracer.start()
+    session_store.start()
+    session_sweeper.start()
+    await whatsapp_service.sender.start()
+    await inbound_queue.start()
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    """Drain queued inbound messages, flush sessions, outbound messages and traces, disconnect event streams"""
+    await inbound_queue.stop()
+    session_store.stop()
+    session_sweeper.stop()
+    await whatsapp_service.sender.stop()
+    tracing.tracer.stop()
+    order_events.close()
 
 if __name__ == "__main__":
     import uvicorn
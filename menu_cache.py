@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from database import SINGLE_PROCESS, MenuItemDB, SessionLocal
+from models import MenuItem
+
+class MenuSnapshot(NamedTuple):
+    """
+    Immutable, versioned view of the menu
+
+    A snapshot is never modified after it is built; menu writes publish a new
+    snapshot instead. Callers must treat the MenuItem objects as read-only.
+    `version` is the highest change revision of any menu item, so it is
+    stable across restarts and comparable between processes.
+    """
+    version: int
+    items: Tuple[MenuItem, ...]
+    by_id: Mapping[int, MenuItem]
+
+# How often (seconds) to check the database for menu changes made by other
+# worker processes. 0 disables the check, the default only when this process
+# is the database's single user.
+MENU_REFRESH_INTERVAL = float(os.getenv('MENU_REFRESH_INTERVAL', '0' if SINGLE_PROCESS else '2'))
+
+_snapshot: Optional[MenuSnapshot] = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+# Held by menu writers from commit through publish_item, so this process
+# publishes menu changes in revision order
+publish_lock = threading.Lock()
+
+def _build_snapshot(version: int, items) -> MenuSnapshot:
+    items = tuple(sorted(items, key=lambda item: item.id))
+    return MenuSnapshot(
+        version=version,
+        items=items,
+        by_id=MappingProxyType({item.id: item for item in items})
+    )
+
+def _load_items(db: Session):
+    rows = db.query(MenuItemDB).all()
+    items = [MenuItem(
+        id=item.id,
+        name=item.name,
+        description=item.description,
+        price=item.price,
+        is_available=item.is_available
+    ) for item in rows]
+    return items, max((item.revision for item in rows), default=0)
+
+def get_menu_snapshot() -> MenuSnapshot:
+    """Get the current menu snapshot, loading it on first use"""
+    snapshot = _snapshot
+    if snapshot is None:
+        return refresh_menu()
+    if MENU_REFRESH_INTERVAL > 0 and time.monotonic() - _checked_at > MENU_REFRESH_INTERVAL:
+        return _check_for_changes(snapshot)
+    return snapshot
+
+def _check_for_changes(snapshot: MenuSnapshot) -> MenuSnapshot:
+    """Reload if another process committed a newer menu revision"""
+    global _checked_at
+    _checked_at = time.monotonic()
+    db = SessionLocal()
+    try:
+        revision = db.query(func.max(MenuItemDB.revision)).scalar() or 0
+    finally:
+        db.close()
+    if revision != snapshot.version:
+        return refresh_menu()
+    return snapshot
+
+def refresh_menu(db: Optional[Session] = None) -> MenuSnapshot:
+    """Reload the menu from the database and swap in a new snapshot"""
+    global _snapshot, _checked_at
+    with _lock:
+        own_session = db is None
+        if own_session:
+            db = SessionLocal()
+        try:
+            items, version = _load_items(db)
+        finally:
+            if own_session:
+                db.close()
+        _snapshot = _build_snapshot(version, items)
+        _checked_at = time.monotonic()
+        return _snapshot
+
+def publish_item(item: MenuItem, revision: int) -> MenuSnapshot:
+    """
+    Write-through update after a menu item is committed
+
+    Builds a new snapshot with the item added or replaced, without querying
+    the database again. A revision older than the snapshot's is skipped:
+    the snapshot was loaded after that commit and already includes it.
+    """
+    global _snapshot
+    if _snapshot is None:
+        # Nothing cached yet - the first load will include the committed item
+        return get_menu_snapshot()
+    with _lock:
+        if revision < _snapshot.version:
+            return _snapshot
+        items = dict(_snapshot.by_id)
+        items[item.id] = item
+        _snapshot = _build_snapshot(max(_snapshot.version, revision), items.values())
+        return _snapshot
@@ -0,0 +1,87 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# Dedup configuration. Twilio retries a webhook within minutes; IDs are
+# remembered for much longer to also cover late manual replays.
+MESSAGE_DEDUP_TTL = float(os.getenv('MESSAGE_DEDUP_TTL', str(24 * 3600)))  # Seconds
+MESSAGE_DEDUP_MAX_ENTRIES = int(os.getenv('MESSAGE_DEDUP_MAX_ENTRIES', '100000'))
+
+class MessageDeduplicator:
+    """
+    Bounded in-memory set of recently accepted Twilio MessageSids
+
+    The webhook claims each MessageSid before queueing the message, so a
+    Twilio retry of a message we already accepted is acknowledged in O(1)
+    without being queued again. IDs are kept in arrival order and dropped
+    once older than `ttl` or when more than `max_entries` are held.
+
+    The set is per process and lost on restart; the worker backs it with
+    the processed_messages table (db_handler.is_message_processed /
+    record_processed_message), which the session sweeper prunes.
+    """
+
+    def __init__(self, ttl: float = MESSAGE_DEDUP_TTL, max_entries: int = MESSAGE_DEDUP_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.claimed = 0
+        self.duplicates = 0
+        self.duplicates_persisted = 0
+
+    def _expire(self, now: float):
+        cutoff = now - self.ttl
+        seen = self._seen
+        while seen and (len(seen) > self.max_entries or next(iter(seen.values())) < cutoff):
+            seen.popitem(last=False)
+
+    def claim(self, message_sid: Optional[str]) -> bool:
+        """
+        Claim a message for processing
+
+        Returns False if the same MessageSid was claimed recently (a
+        retry). Messages without a MessageSid are always accepted.
+        """
+        if not message_sid:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            if message_sid in self._seen:
+                self.duplicates += 1
+                return False
+            self._seen[message_sid] = now
+            self.claimed += 1
+            self._expire(now)
+        return True
+
+    def release(self, message_sid: Optional[str]):
+        """Forget a claim (the message was not accepted, so a retry must be)"""
+        if not message_sid:
+            return
+        with self._lock:
+            if self._seen.pop(message_sid, None) is not None:
+                self.claimed -= 1
+
+    def record_persisted_duplicate(self):
+        """Count a retry caught by the processed_messages table rather than the set"""
+        with self._lock:
+            self.duplicates_persisted += 1
+
+    def stats(self) -> dict:
+        """Claim and duplicate counters"""
+        return {
+            "entries": len(self._seen),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "claimed": self.claimed,
+            "duplicates": self.duplicates,
+            "duplicates_persisted": self.duplicates_persisted,
+        }
+
+# MessageSids seen by this process's webhook
+message_dedup = MessageDeduplicator()
@@ -1,10 +1,15 @@
-from typing import List
+from typing import Callable, List, Mapping, Optional, Tuple
 from models import MenuItem, Order, OrderItem
-import db_handler
+import menu_cache
+import order_parser
+from menu_cache import MenuSnapshot
 
-def format_main_menu() -> str:
-    """Format the main menu message"""
-    return """🍕 *Welcome to Food Paradise!*
+# ==================== TEMPLATES ====================
+# Static messages are built once at import time; per-line templates are
+# bound `str.format` methods, so each render is a single format call and
+# messages are assembled with one join instead of repeated concatenation.
+
+MAIN_MENU = """🍕 *Welcome to Food Paradise!*
 
 Please choose an option:
 1️⃣ View Menu
@@ -14,27 +19,7 @@ Please choose an option:
 
 Reply with *1*, *2*, *3*, or *4*"""
 
-def format_menu(menu_items: List[MenuItem]) -> str:
-    """Format the menu display message"""
-    message = "📋 *Our Menu:*\n\n"
-    
-    for item in menu_items:
-        if item.is_available:
-            status = "✅"
-        else:
-            status = "❌ Sold Out"
-        
-        message += f"{item.id}. *{item.name}* - ₹{item.price} {status}\n"
-        message += f"   _{item.description}_\n\n"
-    
-    message += "\nReply *ORDER* to place an order"
-    message += "\nReply *BACK* for main menu"
-    
-    return message
-
-def format_order_instructions() -> str:
-    """Format order placement instructions"""
-    return """🛒 *Ready to Order!*
+ORDER_INSTRUCTIONS = """🛒 *Ready to Order!*
 
 Send me item numbers and quantities like this:
 *1x2, 3x1*
@@ -44,139 +29,242 @@ Example formats:
 • 1x2 (2 of item 1)
 • 1x1, 3x2 (1 of item 1, 2 of item 3)
 • 2x1, 4x1, 3x2 (multiple items)
+• 2 Margherita, 1 Coke (item names work too)
 
 Reply *BACK* to return to menu"""
 
-def format_order_summary(cart_items: List[OrderItem]) -> str:
-    """Format order summary for confirmation"""
-    message = "🛒 *Order Summary:*\n\n"
-    total = 0.0
-    
-    menu = json_handler.read_menu()
-    menu_dict = {item.id: item for item in menu}
-    
-    for cart_item in cart_items:
-        menu_item = menu_dict.get(cart_item.menu_item_id)
-        if menu_item:
-            item_total = menu_item.price * cart_item.quantity
-            total += item_total
-            message += f"• {cart_item.quantity}x *{menu_item.name}* - ₹{item_total}\n"
-    
-    message += f"\n💰 *Total: ₹{total}*\n"
-    message += "\nReply *CONFIRM* to place order"
-    message += "\nReply *CANCEL* to start over"
-    
-    return message
-
-def format_order_status(orders: List[Order]) -> str:
-    """Format order status message"""
-    if not orders:
-        return """📦 *Your Orders*
+NO_ORDERS = """📦 *Your Orders*
 
 You have no orders yet.
 
 Reply *2* to place a new order!"""
-    
-    active_orders = [o for o in orders if o.status not in ["delivered", "cancelled"]]
-    past_orders = [o for o in orders if o.status in ["delivered", "cancelled"]]
-    
-    message = "📦 *Your Orders*\n\n"
-    
-    if active_orders:
-        message += "🟢 *Active Orders:*\n"
-        for order in active_orders[-5:]:  # Show last 5 active orders
-            status_emoji = {
-                "pending": "⏳",
-                "preparing": "👨‍🍳",
-                "out-for-delivery": "🚚"
-            }.get(order.status, "📦")
-            
-            message += f"{status_emoji} #{order.id} - {order.status.replace('-', ' ').title()} - ₹{order.total_price}\n"
-        message += "\n"
-    
-    if past_orders:
-        message += "📜 *Past Orders:*\n"
-        for order in past_orders[-3:]:  # Show last 3 past orders
-            status_emoji = "✅" if order.status == "delivered" else "❌"
-            message += f"{status_emoji} #{order.id} - {order.status.title()} - ₹{order.total_price}\n"
-    
-    message += "\nReply *BACK* for main menu"
-    
-    return message
-
-def format_cancel_confirmation(order: Order) -> str:
-    """Format order cancellation confirmation request"""
-    if not order:
-        return """❌ *No Active Orders*
+
+NO_ACTIVE_ORDERS = """❌ *No Active Orders*
 
 You have no active orders to cancel.
 
 Reply *BACK* for main menu"""
-    
-    message = f"""⚠️ *Cancel Order?*
-
-Order ID: #{order.id}
-Status: {order.status.replace('-', ' ').title()}
-Total: ₹{order.total_price}
 
-Items:
-"""
-    
-    menu = json_handler.read_menu()
-    menu_dict = {item.id: item for item in menu}
-    
-    for order_item in order.items:
-        menu_item = menu_dict.get(order_item.menu_item_id)
-        if menu_item:
-            message += f"• {order_item.quantity}x {menu_item.name}\n"
-    
-    message += "\nReply *YES* to cancel this order"
-    message += "\nReply *NO* to keep it"
-    
-    return message
-
-def format_error_message(error_type: str = "general") -> str:
-    """Format error messages"""
-    errors = {
-        "invalid_option": """❌ *Invalid Option*
+ERROR_MESSAGES = {
+    "invalid_option": """❌ *Invalid Option*
 
 Please reply with *1*, *2*, *3*, or *4*
 
 Or reply *HI* to see the main menu""",
-        
-        "invalid_order": """❌ *Invalid Order Format*
+
+    "invalid_order": """❌ *Invalid Order Format*
 
 Please send items like: *1x2, 3x1*
 
-Example: 1x2 (2 of item 1)
+Example: 1x2 (2 of item 1) or 2 Margherita
 
 Reply *BACK* to return""",
-        
-        "item_unavailable": """❌ *Item Unavailable*
+
+    "invalid_quantity": f"""❌ *Invalid Quantity*
+
+Quantities must be between 1 and {order_parser.ORDER_MAX_QUANTITY} per item.
+
+Reply *BACK* to return""",
+
+    "item_not_found": """❌ *Item Not Found*
+
+Some item names didn't match the menu.
+Use names or numbers from the menu, like: *2 Margherita, 1x3*
+
+Reply *BACK* to return""",
+
+    "order_not_cancellable": """❌ *Can't Cancel Order*
+
+This order can no longer be cancelled.
+
+Reply *HI* for main menu""",
+
+    "item_unavailable": """❌ *Item Unavailable*
 
 Some items you selected are not available.
 Please check the menu and try again.
 
 Reply *1* to view menu""",
-        
-        "general": """❌ *Oops!*
+
+    "general": """❌ *Oops!*
 
 Something went wrong. Please try again.
 
 Reply *HI* for main menu"""
-    }
-    
-    return errors.get(error_type, errors["general"])
+}
 
-def format_items_summary(items: List[OrderItem]) -> str:
-    """Format items for order confirmation"""
-    menu = json_handler.read_menu()
-    menu_dict = {item.id: item for item in menu}
-    
-    summary = ""
-    for order_item in items:
+_MENU_HEADER = "📋 *Our Menu:*\n\n"
+_MENU_LINE = "{id}. *{name}* - ₹{price} {status}\n   _{description}_\n\n".format
+_MENU_FOOTER = "\nReply *ORDER* to place an order\nReply *BACK* for main menu"
+
+_SUMMARY_HEADER = "🛒 *Order Summary:*\n\n"
+_SUMMARY_LINE = "• {quantity}x *{name}* - ₹{total}\n".format
+_SUMMARY_FOOTER = "\n💰 *Total: ₹{total}*\n\nReply *CONFIRM* to place order\nReply *CANCEL* to start over".format
+
+_ITEM_LINE = "• {quantity}x {name}\n".format
+
+_STATUS_HEADER = "📦 *Your Orders*\n\n"
+_ACTIVE_LINE = "{emoji} #{id} - {status} - ₹{total}\n".format
+_STATUS_FOOTER = "\nReply *BACK* for main menu"
+_ACTIVE_EMOJI = {
+    "pending": "⏳",
+    "preparing": "👨‍🍳",
+    "out-for-delivery": "🚚"
+}
+
+_CANCEL_HEADER = """⚠️ *Cancel Order?*
+
+Order ID: #{id}
+Status: {status}
+Total: ₹{total}
+
+Items:
+""".format
+_CANCEL_FOOTER = "\nReply *YES* to cancel this order\nReply *NO* to keep it"
+
+# Rendered menu text for the last snapshot version seen: (version, text)
+_menu_text: Optional[Tuple[int, str]] = None
+
+# ==================== MENU LOOKUP ====================
+
+# Menu items indexed by id
+MenuLookup = Mapping[int, MenuItem]
+
+def _snapshot_lookup() -> MenuLookup:
+    return menu_cache.get_menu_snapshot().by_id
+
+# Supplies the menu lookup to formatters whose caller does not pass one
+_menu_resolver: Callable[[], MenuLookup] = _snapshot_lookup
+
+def set_menu_resolver(resolver: Optional[Callable[[], MenuLookup]] = None):
+    """Inject the menu lookup used by default (None restores the shared snapshot)"""
+    global _menu_resolver
+    _menu_resolver = resolver or _snapshot_lookup
+
+def _resolve_menu(menu: Optional[MenuLookup]) -> MenuLookup:
+    return menu if menu is not None else _menu_resolver()
+
+# ==================== FORMATTERS ====================
+
+def format_main_menu() -> str:
+    """Format the main menu message"""
+    return MAIN_MENU
+
+def format_menu(menu_items: List[MenuItem]) -> str:
+    """Format the menu display message"""
+    lines = [
+        _MENU_LINE(
+            id=item.id,
+            name=item.name,
+            price=item.price,
+            status="✅" if item.is_available else "❌ Sold Out",
+            description=item.description
+        )
+        for item in menu_items
+    ]
+    return "".join((_MENU_HEADER, *lines, _MENU_FOOTER))
+
+def format_menu_snapshot(snapshot: Optional[MenuSnapshot] = None) -> str:
+    """
+    Format the menu display message for a menu snapshot
+
+    The text is rendered once per snapshot version; a menu write publishes a
+    new version, which invalidates the cached text.
+    """
+    global _menu_text
+    if snapshot is None:
+        snapshot = menu_cache.get_menu_snapshot()
+    cached = _menu_text
+    if cached is not None and cached[0] == snapshot.version:
+        return cached[1]
+    text = format_menu(snapshot.items)
+    _menu_text = (snapshot.version, text)
+    return text
+
+def format_order_instructions() -> str:
+    """Format order placement instructions"""
+    return ORDER_INSTRUCTIONS
+
+def format_order_summary(cart_items: List[OrderItem], menu: Optional[MenuLookup] = None) -> str:
+    """Format order summary for confirmation"""
+    menu_dict = _resolve_menu(menu)
+
+    parts = [_SUMMARY_HEADER]
+    total = 0.0
+    for cart_item in cart_items:
+        menu_item = menu_dict.get(cart_item.menu_item_id)
+        if menu_item:
+            item_total = menu_item.price * cart_item.quantity
+            total += item_total
+            parts.append(_SUMMARY_LINE(quantity=cart_item.quantity, name=menu_item.name, total=item_total))
+    parts.append(_SUMMARY_FOOTER(total=total))
+
+    return "".join(parts)
+
+def format_order_status(orders: List[Order]) -> str:
+    """Format order status message"""
+    if not orders:
+        return NO_ORDERS
+
+    active_orders = [o for o in orders if o.status not in ["delivered", "cancelled"]]
+    past_orders = [o for o in orders if o.status in ["delivered", "cancelled"]]
+
+    parts = [_STATUS_HEADER]
+
+    if active_orders:
+        parts.append("🟢 *Active Orders:*\n")
+        for order in active_orders[-5:]:  # Show last 5 active orders
+            parts.append(_ACTIVE_LINE(
+                emoji=_ACTIVE_EMOJI.get(order.status, "📦"),
+                id=order.id,
+                status=order.status.replace('-', ' ').title(),
+                total=order.total_price
+            ))
+        parts.append("\n")
+
+    if past_orders:
+        parts.append("📜 *Past Orders:*\n")
+        for order in past_orders[-3:]:  # Show last 3 past orders
+            parts.append(_ACTIVE_LINE(
+                emoji="✅" if order.status == "delivered" else "❌",
+                id=order.id,
+                status=order.status.title(),
+                total=order.total_price
+            ))
+
+    parts.append(_STATUS_FOOTER)
+    return "".join(parts)
+
+def format_cancel_confirmation(order: Order, menu: Optional[MenuLookup] = None) -> str:
+    """Format order cancellation confirmation request"""
+    if not order:
+        return NO_ACTIVE_ORDERS
+
+    menu_dict = _resolve_menu(menu)
+
+    parts = [_CANCEL_HEADER(
+        id=order.id,
+        status=order.status.replace('-', ' ').title(),
+        total=order.total_price
+    )]
+    for order_item in order.items:
         menu_item = menu_dict.get(order_item.menu_item_id)
         if menu_item:
-            summary += f"• {order_item.quantity}x {menu_item.name}\n"
-    
-    return summary.strip()
\ No newline at end of file
+            parts.append(_ITEM_LINE(quantity=order_item.quantity, name=menu_item.name))
+    parts.append(_CANCEL_FOOTER)
+
+    return "".join(parts)
+
+def format_error_message(error_type: str = "general") -> str:
+    """Format error messages"""
+    return ERROR_MESSAGES.get(error_type, ERROR_MESSAGES["general"])
+
+def format_items_summary(items: List[OrderItem], menu: Optional[MenuLookup] = None) -> str:
+    """Format items for order confirmation"""
+    menu_dict = _resolve_menu(menu)
+
+    return "".join(
+        _ITEM_LINE(quantity=order_item.quantity, name=menu_item.name)
+        for order_item in items
+        if (menu_item := menu_dict.get(order_item.menu_item_id))
+    ).strip()
\ No newline at end of file
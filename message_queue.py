@@ -0,0 +1,162 @@
+import asyncio
+import contextvars
+import logging
+import os
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+import app_logging
+
+# Queue configuration
+INBOUND_WORKERS = int(os.getenv('INBOUND_WORKERS', '8'))
+INBOUND_QUEUE_SIZE = int(os.getenv('INBOUND_QUEUE_SIZE', '1000'))
+
+logger = logging.getLogger(__name__)
+
+class InboundQueue:
+    """
+    Bounded inbound message queue drained by a fixed pool of workers
+
+    Messages are sharded by phone number so that every message from the same
+    customer is handled by the same worker, in arrival order. Each shard has
+    its own bounded queue; when a shard is full new messages are rejected so
+    the webhook can push back on Twilio instead of buffering without limit.
+
+    Each message carries its Twilio MessageSid (passed to the handler for
+    deduplication) and the correlation ID it was queued under, and the
+    handler runs with that ID bound.
+    """
+
+    def __init__(self, handler: Callable[[str, str, Optional[str]], None], workers: int = INBOUND_WORKERS,
+                 max_size: int = INBOUND_QUEUE_SIZE):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_size = max(self.workers, max_size)
+        shard_size = -(-self.max_size // self.workers)  # ceil division
+        self._shards: List[asyncio.Queue] = [
+            asyncio.Queue(maxsize=shard_size) for _ in range(self.workers)
+        ]
+        self._tasks: List[asyncio.Task] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        # Metrics
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.max_depth = 0
+        self.total_wait = 0.0
+        self.total_processing = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def _shard_for(self, phone_number: str) -> asyncio.Queue:
+        return self._shards[zlib.crc32(phone_number.encode()) % self.workers]
+
+    def depth(self) -> int:
+        """Total number of messages waiting across all shards"""
+        return sum(shard.qsize() for shard in self._shards)
+
+    def enqueue(self, phone_number: str, message_body: str, message_sid: Optional[str] = None) -> bool:
+        """
+        Queue a message for background processing
+
+        Returns False if the customer's shard is full (backpressure)
+        """
+        try:
+            self._shard_for(phone_number).put_nowait(
+                (phone_number, message_body, message_sid, app_logging.get_correlation_id(), time.perf_counter())
+            )
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self.depth())
+        return True
+
+    async def start(self):
+        """Start the worker pool on the running event loop"""
+        if self.running:
+            return
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix="inbound-worker"
+        )
+        self._tasks = [
+            asyncio.create_task(self._worker(shard), name=f"inbound-worker-{i}")
+            for i, shard in enumerate(self._shards)
+        ]
+        logger.info("Inbound queue started", extra={
+            "event": "inbound_queue.started", "workers": self.workers, "capacity": self.max_size
+        })
+
+    async def stop(self, timeout: float = 10.0):
+        """Drain queued messages (up to timeout) and stop the workers"""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(shard.join() for shard in self._shards)),
+                timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Inbound queue stopped with messages still queued", extra={
+                "event": "inbound_queue.abandoned", "depth": self.depth()
+            })
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    async def _worker(self, shard: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            phone_number, message_body, message_sid, correlation_id, enqueued_at = await shard.get()
+            started_at = time.perf_counter()
+            self.total_wait += started_at - enqueued_at
+            self.in_flight += 1
+            token = app_logging.correlation_id.set(correlation_id)
+            try:
+                # The conversation handler does blocking DB and HTTP I/O,
+                # so it runs on the worker thread pool, not the event loop
+                context = contextvars.copy_context()
+                await loop.run_in_executor(
+                    self._executor, context.run, self.handler, phone_number, message_body, message_sid
+                )
+                self.processed += 1
+            except Exception:
+                self.failed += 1
+                logger.exception("Error handling message", extra={
+                    "event": "message.failed", "from_number": phone_number
+                })
+            finally:
+                app_logging.correlation_id.reset(token)
+                self.in_flight -= 1
+                self.total_processing += time.perf_counter() - started_at
+                shard.task_done()
+
+    def stats(self) -> dict:
+        """Queue depth and throughput counters"""
+        completed = self.processed + self.failed
+        return {
+            "workers": self.workers,
+            "capacity": self.max_size,
+            "depth": self.depth(),
+            "max_shard_depth": max(shard.qsize() for shard in self._shards),
+            "max_depth": self.max_depth,
+            "in_flight": self.in_flight,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.total_wait / completed * 1000, 2) if completed else 0.0,
+            "avg_processing_ms": round(self.total_processing / completed * 1000, 2) if completed else 0.0,
+        }
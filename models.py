@@ -35,6 +35,7 @@ class Order(BaseModel):
     status: str = "pending"  # pending, preparing, out-for-delivery, delivered, cancelled
     total_price: float
     created_at: str
+    version: int = 1  # Pass back in OrderStatusUpdate to reject stale updates
 
 class OrderCreate(BaseModel):
     customer_name: Optional[str] = None
@@ -43,6 +44,12 @@ class OrderCreate(BaseModel):
 
 class OrderStatusUpdate(BaseModel):
     status: str
+    version: Optional[int] = None  # Order version the change is based on (optional)
+
+class OrderBulkStatusUpdate(BaseModel):
+    order_ids: List[int] = Field(min_length=1)
+    status: str
+    from_status: Optional[List[str]] = None  # Only move orders currently in one of these statuses
 
 # Customer Session Models
 class CustomerSession(BaseModel):
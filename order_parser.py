@@ -0,0 +1,200 @@
+"""
+Order message parser
+
+Customers can order by item number or by name, separated by commas,
+semicolons, new lines, "+" or "and":
+
+    1x2, 3x1            item 1 (qty 2) and item 3 (qty 1)
+    1 × 2; 3*1          the same, with "×" or "*"
+    2 margherita, coke  2 of the item named like "margherita", 1 coke
+    margherita x2       quantity after the name
+
+Repeated items are merged into one line. Item names are matched against a
+trigram index of the menu (tolerant of typos, plurals and partial names),
+which is built once per menu snapshot version.
+"""
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import menu_cache
+from menu_cache import MenuSnapshot
+from models import OrderItem
+
+# Parser configuration
+ORDER_MAX_QUANTITY = int(os.getenv('ORDER_MAX_QUANTITY', '50'))  # Per item, after merging
+ORDER_MAX_LINES = int(os.getenv('ORDER_MAX_LINES', '20'))  # Distinct items per order
+ORDER_MAX_MESSAGE_LENGTH = int(os.getenv('ORDER_MAX_MESSAGE_LENGTH', '500'))
+ORDER_MATCH_THRESHOLD = float(os.getenv('ORDER_MATCH_THRESHOLD', '0.5'))  # Min trigram similarity
+
+# Item separators; "and" / "&" only split before a quantity, so names like
+# "Mac and Cheese" stay whole
+_SEPARATOR = re.compile(r"\s*(?:[,;\n+]|(?:\band\b|&)(?=\s*\d))\s*", re.IGNORECASE)
+
+# Item number and quantity: 1x2, 1 × 2, #1*2. A chunk of numbered items
+# holds nothing else but whitespace between them ("1x2 3x1").
+_NUMBERED_ITEM = re.compile(r"(?<!\w)#?(\d+)\s*[x×*]\s*(\d+)(?!\w)", re.IGNORECASE)
+_NUMBERED_CHUNK = re.compile(
+    r"#?\d+\s*[x×*]\s*\d+(?:\s+#?\d+\s*[x×*]\s*\d+)*", re.IGNORECASE
+)
+
+# Item name with an optional quantity before or after it: 2 margherita,
+# 2x coke, margherita x2, coke
+_NAMED_ITEM = re.compile(
+    r"(?:(?P<quantity>\d+)\s*(?:[x×*]\s*)?)?(?P<name>.+?)(?:\s*[x×*]\s*(?P<quantity_after>\d+))?",
+    re.IGNORECASE
+)
+
+_NON_ALNUM = re.compile(r"[\W_]+")
+
+class ParsedOrder(NamedTuple):
+    """Parsed order lines, or the ERROR_MESSAGES key explaining why parsing failed"""
+    items: List[OrderItem]
+    error: Optional[str] = None
+
+def normalize_name(name: str) -> str:
+    """Lowercase, strip accents and punctuation, collapse whitespace"""
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    return _NON_ALNUM.sub(" ", name.casefold()).strip()
+
+def _number(text: str) -> int:
+    # Anything longer is out of range anyway; avoids int() on huge digit runs
+    return int(text) if len(text) <= 9 else 10 ** 9
+
+def _trigrams(text: str) -> frozenset:
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+class MenuIndex:
+    """
+    Fuzzy item-name lookup for one menu snapshot
+
+    Every item is indexed under its full name and each word of three or more
+    letters. Exact matches are a dict lookup; otherwise candidates come from
+    a trigram inverted index and are scored by Dice similarity, so a lookup
+    only touches items sharing a trigram with the query. A name matching two
+    items equally well (e.g. "pizza") is ambiguous and not matched.
+    """
+
+    def __init__(self, snapshot: MenuSnapshot, threshold: float = ORDER_MATCH_THRESHOLD):
+        self.version = snapshot.version
+        self.threshold = threshold
+        self._exact: Dict[str, Optional[int]] = {}
+        self._aliases: List[Tuple[int, int]] = []  # (menu item id, trigram count)
+        self._postings: Dict[str, List[int]] = {}
+
+        for item in snapshot.items:
+            name = normalize_name(item.name)
+            if not name:
+                continue
+            words = {word for word in name.split() if len(word) >= 3 and not word.isdigit()}
+            for alias in {name} | words:
+                self._add_alias(alias, item.id)
+
+    def _add_alias(self, alias: str, item_id: int):
+        if alias in self._exact:
+            if self._exact[alias] != item_id:
+                self._exact[alias] = None  # Shared by several items
+            return
+        self._exact[alias] = item_id
+        grams = _trigrams(alias)
+        position = len(self._aliases)
+        self._aliases.append((item_id, len(grams)))
+        for gram in grams:
+            self._postings.setdefault(gram, []).append(position)
+
+    def match(self, name: str) -> Optional[int]:
+        """Menu item id best matching `name`, or None if no item is close enough"""
+        key = normalize_name(name)
+        if not key:
+            return None
+        if key in self._exact:
+            return self._exact[key]
+
+        grams = _trigrams(key)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._postings.get(gram, ()))
+
+        scores: Dict[int, float] = {}
+        for position, common in shared.items():
+            item_id, size = self._aliases[position]
+            score = 2 * common / (len(grams) + size)
+            if score > scores.get(item_id, 0.0):
+                scores[item_id] = score
+        if not scores:
+            return None
+
+        ranked = sorted(scores.items(), key=lambda entry: entry[1], reverse=True)
+        best_id, best = ranked[0]
+        if best < self.threshold or (len(ranked) > 1 and ranked[1][1] == best):
+            return None
+        return best_id
+
+_index: Optional[MenuIndex] = None
+
+def get_menu_index(snapshot: Optional[MenuSnapshot] = None) -> MenuIndex:
+    """Name index for a menu snapshot, rebuilt only when the snapshot version changes"""
+    global _index
+    if snapshot is None:
+        snapshot = menu_cache.get_menu_snapshot()
+    index = _index
+    if index is None or index.version != snapshot.version:
+        index = MenuIndex(snapshot)
+        _index = index
+    return index
+
+def parse_order(message: str, snapshot: Optional[MenuSnapshot] = None) -> ParsedOrder:
+    """
+    Parse an order message into merged order lines
+
+    Item numbers are not checked against the menu here (see
+    conversation_handler.validate_order_items); names that match no menu
+    item fail with "item_not_found".
+    """
+    message = message.strip()
+    if not message or len(message) > ORDER_MAX_MESSAGE_LENGTH:
+        return ParsedOrder([], "invalid_order")
+
+    quantities: Dict[int, int] = {}  # Insertion ordered, so lines keep the customer's order
+    index: Optional[MenuIndex] = None
+
+    for chunk in _SEPARATOR.split(message):
+        if not chunk:
+            continue
+
+        if _NUMBERED_CHUNK.fullmatch(chunk):
+            lines = [(_number(item_id), _number(quantity)) for item_id, quantity in _NUMBERED_ITEM.findall(chunk)]
+        elif _NUMBERED_ITEM.search(chunk):
+            # Item numbers mixed with other text ("margherita 1x2", "1x2 pizza")
+            return ParsedOrder([], "invalid_order")
+        else:
+            named = _NAMED_ITEM.fullmatch(chunk)
+            if named is None or not any(char.isalpha() for char in named.group("name")):
+                return ParsedOrder([], "invalid_order")
+            if named.group("quantity") and named.group("quantity_after"):
+                return ParsedOrder([], "invalid_order")
+            if index is None:
+                index = get_menu_index(snapshot)
+            item_id = index.match(named.group("name"))
+            if item_id is None:
+                return ParsedOrder([], "item_not_found")
+            quantity = named.group("quantity") or named.group("quantity_after") or "1"
+            lines = [(item_id, _number(quantity))]
+
+        for item_id, quantity in lines:
+            if quantity < 1:
+                return ParsedOrder([], "invalid_quantity")
+            quantities[item_id] = quantities.get(item_id, 0) + quantity
+
+    if not quantities or len(quantities) > ORDER_MAX_LINES:
+        return ParsedOrder([], "invalid_order")
+    if any(quantity > ORDER_MAX_QUANTITY for quantity in quantities.values()):
+        return ParsedOrder([], "invalid_quantity")
+
+    return ParsedOrder([
+        OrderItem(menu_item_id=item_id, quantity=quantity)
+        for item_id, quantity in quantities.items()
+    ])
@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Deque, Dict, List, Optional, Tuple
+import aiohttp
+import app_logging
+import metrics
+
+# Outbound configuration
+TWILIO_API_BASE = os.getenv('TWILIO_API_BASE', 'https://api.twilio.com')
+OUTBOUND_CONCURRENCY = int(os.getenv('OUTBOUND_CONCURRENCY', '20'))
+OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', '4'))
+OUTBOUND_TIMEOUT = float(os.getenv('OUTBOUND_TIMEOUT', '15'))
+
+# Twilio rejects message bodies longer than this
+MAX_BODY_LENGTH = 1600
+
+# Separator used when consecutive messages to one recipient are batched
+BATCH_SEPARATOR = "\n\n"
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+class DeliveryError(Exception):
+    """Raised on a delivery future when Twilio does not accept a message"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+class OutboundSender:
+    """
+    Asynchronous WhatsApp message sender for the Twilio REST API
+
+    - One pooled keep-alive HTTP session shared by all sends
+    - At most `concurrency` requests in flight at once
+    - Messages to the same recipient are sent strictly in submission order;
+      consecutive queued messages for a recipient are batched into a single
+      Twilio message when they fit in MAX_BODY_LENGTH
+    - 429 and 5xx responses are retried with jittered exponential backoff
+
+    `submit` is thread-safe and returns a concurrent.futures.Future that
+    resolves to the Twilio message SID, so callers can fire and forget or
+    wait for the result. Sends are logged under the correlation ID that was
+    current when the message was submitted.
+    """
+
+    def __init__(self, account_sid: Optional[str], auth_token: Optional[str], from_number: Optional[str],
+                 api_base: str = TWILIO_API_BASE, concurrency: int = OUTBOUND_CONCURRENCY,
+                 max_retries: int = OUTBOUND_MAX_RETRIES, timeout: float = OUTBOUND_TIMEOUT):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_number = from_number
+        self.api_base = api_base.rstrip('/')
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.backoff_base = 0.5
+        self.backoff_cap = 8.0
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lanes: Dict[str, Deque[Tuple[str, Future, Optional[str]]]] = {}
+        self._lane_tasks: Dict[str, asyncio.Task] = {}
+
+        # Metrics
+        self.submitted = 0
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.batched = 0
+        self.in_flight = 0
+
+    @property
+    def running(self) -> bool:
+        return self._session is not None
+
+    @property
+    def messages_url(self) -> str:
+        return f"{self.api_base}/2010-04-01/Accounts/{self.account_sid}/Messages.json"
+
+    async def start(self):
+        """Open the HTTP session on the running event loop"""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60),
+            auth=aiohttp.BasicAuth(self.account_sid or "", self.auth_token or ""),
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        logger.info("Outbound sender started", extra={
+            "event": "outbound_sender.started", "concurrency": self.concurrency, "api_base": self.api_base
+        })
+
+    async def stop(self, timeout: float = 10.0):
+        """Wait for queued messages (up to timeout) and close the HTTP session"""
+        if not self.running:
+            return
+        tasks = list(self._lane_tasks.values())
+        if tasks:
+            done, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.warning("Outbound sender stopped with messages unsent", extra={
+                    "event": "outbound_sender.abandoned", "pending": self.pending()
+                })
+        await self._session.close()
+        self._session = None
+
+    def pending(self) -> int:
+        """Number of messages waiting to be sent"""
+        return sum(len(lane) for lane in self._lanes.values())
+
+    def submit(self, to_number: str, message_body: str) -> Future:
+        """
+        Queue a message for delivery (thread-safe)
+
+        Returns a Future resolving to the Twilio message SID, or raising
+        DeliveryError if the message could not be sent.
+        """
+        if not self.running:
+            raise RuntimeError("Outbound sender is not running")
+
+        future: Future = Future()
+        correlation_id = app_logging.get_correlation_id()
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is self._loop:
+            self._enqueue(to_number, message_body, future, correlation_id)
+        else:
+            self._loop.call_soon_threadsafe(self._enqueue, to_number, message_body, future, correlation_id)
+        return future
+
+    def _enqueue(self, to_number: str, message_body: str, future: Future, correlation_id: Optional[str]):
+        self.submitted += 1
+        lane = self._lanes.setdefault(to_number, deque())
+        lane.append((message_body, future, correlation_id))
+        if to_number not in self._lane_tasks:
+            self._lane_tasks[to_number] = self._loop.create_task(self._drain_lane(to_number))
+
+    def _next_batch(self, lane: Deque[Tuple[str, Future, Optional[str]]]) -> Tuple[str, List[Future], List[Optional[str]]]:
+        """Pop the next message, batching following ones while they fit"""
+        body, future, correlation_id = lane.popleft()
+        parts = [body]
+        futures = [future]
+        correlation_ids = [correlation_id]
+        length = len(body)
+        while lane and length + len(BATCH_SEPARATOR) + len(lane[0][0]) <= MAX_BODY_LENGTH:
+            body, future, correlation_id = lane.popleft()
+            parts.append(body)
+            futures.append(future)
+            correlation_ids.append(correlation_id)
+            length += len(BATCH_SEPARATOR) + len(body)
+        self.batched += len(parts) - 1
+        return BATCH_SEPARATOR.join(parts), futures, correlation_ids
+
+    async def _drain_lane(self, to_number: str):
+        lane = self._lanes[to_number]
+        try:
+            while lane:
+                body, futures, correlation_ids = self._next_batch(lane)
+                # A batch is logged under its first message's correlation ID
+                # and lists all of them when it merged several turns
+                fields = {"to_number": to_number, "messages": len(futures)}
+                if len(set(correlation_ids)) > 1:
+                    fields["correlation_ids"] = correlation_ids
+                token = app_logging.correlation_id.set(correlation_ids[0])
+                started_at = time.perf_counter()
+                try:
+                    async with self._semaphore:
+                        sid = await self._send_with_retry(to_number, body)
+                except Exception as e:
+                    metrics.whatsapp_send_duration_seconds.observe(time.perf_counter() - started_at, "async", "failed")
+                    self.failed += len(futures)
+                    logger.error("Error sending message", extra={"event": "message.send_failed", "error": str(e), **fields})
+                    for future in futures:
+                        future.set_exception(e if isinstance(e, DeliveryError) else DeliveryError(str(e)))
+                else:
+                    metrics.whatsapp_send_duration_seconds.observe(time.perf_counter() - started_at, "async", "sent")
+                    self.sent += len(futures)
+                    logger.info("Message sent", extra={"event": "message.sent", "sid": sid, **fields})
+                    for future in futures:
+                        future.set_result(sid)
+                finally:
+                    app_logging.correlation_id.reset(token)
+        finally:
+            del self._lane_tasks[to_number]
+            del self._lanes[to_number]
+
+    def _backoff(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_cap)
+            except ValueError:
+                pass
+        # Full jitter: spread retries so throttled senders don't stampede
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    async def _send_with_retry(self, to_number: str, message_body: str) -> str:
+        data = {"From": self.from_number or "", "To": to_number, "Body": message_body}
+        attempt = 0
+        while True:
+            self.in_flight += 1
+            try:
+                async with self._session.post(self.messages_url, data=data) as response:
+                    metrics.whatsapp_send_attempts_total.inc(str(response.status))
+                    if response.status in (200, 201):
+                        payload = await response.json(content_type=None)
+                        return payload.get("sid", "")
+                    error = DeliveryError(
+                        f"Twilio responded {response.status}: {await response.text()}",
+                        status=response.status
+                    )
+                    retry_after = response.headers.get("Retry-After")
+                    if response.status not in RETRYABLE_STATUSES:
+                        raise error
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                metrics.whatsapp_send_attempts_total.inc("error")
+                error = DeliveryError(f"Connection error: {e!r}")
+                retry_after = None
+            finally:
+                self.in_flight -= 1
+
+            if attempt >= self.max_retries:
+                raise error
+            self.retries += 1
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+            attempt += 1
+
+    def stats(self) -> dict:
+        """Outbound delivery counters"""
+        return {
+            "running": self.running,
+            "concurrency": self.concurrency,
+            "pending": self.pending(),
+            "recipients": len(self._lanes),
+            "in_flight": self.in_flight,
+            "submitted": self.submitted,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "batched": self.batched,
+        }
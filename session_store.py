@@ -0,0 +1,306 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+import db_handler
+from database import SINGLE_PROCESS, SessionLocal
+from models import CustomerSession
+
+# Session cache configuration. The cache is per process, so it is only on by
+# default when this process is the database's single user; with several
+# workers enable it only if each customer is always routed to the same one.
+SESSION_CACHE = os.getenv('SESSION_CACHE', 'on' if SINGLE_PROCESS else 'off').lower() != 'off'
+SESSION_CACHE_MAX_ENTRIES = int(os.getenv('SESSION_CACHE_MAX_ENTRIES', '10000'))
+SESSION_CACHE_MAX_BYTES = int(os.getenv('SESSION_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+SESSION_IDLE_TTL = float(os.getenv('SESSION_IDLE_TTL', '1800'))  # Seconds since last_interaction
+SESSION_FLUSH_INTERVAL = float(os.getenv('SESSION_FLUSH_INTERVAL', '1.0'))
+SESSION_FLUSH_BATCH = int(os.getenv('SESSION_FLUSH_BATCH', '500'))
+
+logger = logging.getLogger(__name__)
+
+# Key in Session.info for saves waiting on the transaction to commit
+_STAGED = "staged_sessions"
+
+class _Entry:
+    __slots__ = ("session", "size", "dirty", "version")
+
+    def __init__(self, session: CustomerSession, size: int, dirty: bool, version: int):
+        self.session = session
+        self.size = size
+        self.dirty = dirty
+        self.version = version
+
+class SessionStore:
+    """
+    Write-behind customer session store with an in-memory LRU front
+
+    Reads are served from memory after the first load. Saved sessions are
+    marked dirty and written back by a background thread in coalesced
+    batches (one transaction per batch, one write per customer no matter
+    how many turns happened in between). Entries are evicted by count,
+    total size and idle time since last_interaction; dirty entries are
+    always written before they leave memory.
+
+    A save reaches the cache only once the caller's transaction commits, so
+    a failed turn leaves the previous (possibly still dirty) copy in place.
+
+    Until `start` is called (or when the cache is disabled) every save is
+    written through, so scripts never lose a session. The cache is private
+    to the process: it is off by default unless database.SINGLE_PROCESS.
+    """
+
+    def __init__(self, enabled: bool = SESSION_CACHE, max_entries: int = SESSION_CACHE_MAX_ENTRIES,
+                 max_bytes: int = SESSION_CACHE_MAX_BYTES, idle_ttl: float = SESSION_IDLE_TTL,
+                 flush_interval: float = SESSION_FLUSH_INTERVAL, flush_batch: int = SESSION_FLUSH_BATCH):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._evicted_dirty: Dict[str, _Entry] = {}
+        self._bytes = 0
+        self._version = 0
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.flushed = 0
+        self.flush_batches = 0
+        self.flush_errors = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    @property
+    def write_behind(self) -> bool:
+        return self.enabled and self.running
+
+    # ---------- lifecycle ----------
+
+    def start(self):
+        """Start the background write-back thread"""
+        if not self.enabled or self.running:
+            return
+        if not SINGLE_PROCESS:
+            logger.warning(
+                "Session cache is on with a shared database; other workers will read stale sessions "
+                "unless each customer is routed to one worker (set SESSION_CACHE=off otherwise)",
+                extra={"event": "session_store.shared_database"}
+            )
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="session-writer", daemon=True)
+        self._thread.start()
+        logger.info("Session store started", extra={
+            "event": "session_store.started", "max_entries": self.max_entries, "flush_interval": self.flush_interval
+        })
+
+    def stop(self):
+        """Stop the write-back thread and durably flush every dirty session"""
+        if not self.running:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+        self.flush()
+
+    # ---------- reads and writes ----------
+
+    def load(self, db: Session, whatsapp_number: str) -> CustomerSession:
+        """Get a customer's session (a private copy the caller may modify)"""
+        if self.enabled:
+            with self._lock:
+                entry = self._entries.get(whatsapp_number)
+                if entry is None and whatsapp_number in self._evicted_dirty:
+                    # Evicted but not yet written back - bring it back in
+                    entry = self._evicted_dirty.pop(whatsapp_number)
+                    self._entries[whatsapp_number] = entry
+                    self._bytes += entry.size
+                    self._evict()
+                if entry is not None and (entry.dirty or not self._is_idle(entry)):
+                    self._entries.move_to_end(whatsapp_number)
+                    self.hits += 1
+                    return entry.session.model_copy(deep=True)
+                self.misses += 1
+
+        session = db_handler.get_customer_session(db, whatsapp_number, commit=False)
+        if self.enabled:
+            self._remember(whatsapp_number, session.model_copy(deep=True), dirty=False)
+        return session
+
+    def save(self, db: Session, whatsapp_number: str, session: CustomerSession, durable: bool = False):
+        """
+        Store a customer's updated session
+
+        With write-behind active the session is only marked dirty. When
+        `durable` is set (e.g. the turn also created an order) or write-behind
+        is off, the session is written in the caller's transaction instead.
+        Either way the cache is updated when the caller commits `db` (a
+        SessionLocal session); a rollback discards the save.
+        """
+        session.last_interaction = datetime.now().isoformat()
+        durable = durable or not self.write_behind
+        if durable:
+            db_handler.update_customer_session(db, whatsapp_number, session, commit=False)
+        if self.enabled:
+            db.info.setdefault(_STAGED, []).append(
+                (self, whatsapp_number, session.model_copy(deep=True), not durable)
+            )
+
+    def _apply(self, whatsapp_number: str, session: CustomerSession, dirty: bool):
+        """Cache a save whose transaction committed"""
+        self._remember(whatsapp_number, session, dirty)
+        if dirty and self.dirty_count() >= self.flush_batch:
+            self._wakeup.set()
+
+    def invalidate(self, whatsapp_number: str):
+        """Drop a cached session (e.g. after a failed transaction)"""
+        with self._lock:
+            entry = self._entries.pop(whatsapp_number, None)
+            if entry is not None:
+                self._bytes -= entry.size
+                if entry.dirty:
+                    self._evicted_dirty[whatsapp_number] = entry
+
+    def _remember(self, whatsapp_number: str, session: CustomerSession, dirty: bool):
+        size = len(session.model_dump_json()) + len(whatsapp_number)
+        with self._lock:
+            self._version += 1
+            previous = self._entries.pop(whatsapp_number, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            # The new entry supersedes any evicted copy still waiting to be written
+            self._evicted_dirty.pop(whatsapp_number, None)
+            self._entries[whatsapp_number] = _Entry(session, size, dirty, self._version)
+            self._bytes += size
+            self._evict()
+
+    def _evict(self):
+        """Evict least recently used sessions over the count / byte budget"""
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            whatsapp_number, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self.evictions += 1
+            if entry.dirty:
+                # Keep it reachable until it has been written back
+                self._evicted_dirty[whatsapp_number] = entry
+                self._wakeup.set()
+
+    def _is_idle(self, entry: _Entry) -> bool:
+        try:
+            last_interaction = datetime.fromisoformat(entry.session.last_interaction)
+        except ValueError:
+            return True
+        return (datetime.now() - last_interaction).total_seconds() > self.idle_ttl
+
+    def dirty_count(self) -> int:
+        with self._lock:
+            return len(self._evicted_dirty) + sum(1 for entry in self._entries.values() if entry.dirty)
+
+    # ---------- write-back ----------
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                self._expire_idle()
+            except Exception:
+                logger.exception("Session write-back failed", extra={"event": "session_store.flush_failed"})
+
+    def flush(self) -> int:
+        """Write every dirty session back to the database in batches"""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [
+                        (number, entry) for number, entry in
+                        list(self._evicted_dirty.items()) + list(self._entries.items())
+                        if entry.dirty
+                    ][:self.flush_batch]
+                if not batch:
+                    return written
+
+                db = SessionLocal()
+                try:
+                    for whatsapp_number, entry in batch:
+                        db_handler.update_customer_session(db, whatsapp_number, entry.session, commit=False)
+                    db.commit()
+                except Exception:
+                    db.rollback()
+                    self.flush_errors += 1
+                    raise
+                finally:
+                    db.close()
+
+                with self._lock:
+                    for whatsapp_number, entry in batch:
+                        # Only mark clean if nothing newer was saved meanwhile
+                        current = self._entries.get(whatsapp_number) or self._evicted_dirty.get(whatsapp_number)
+                        if current is entry:
+                            entry.dirty = False
+                        if self._evicted_dirty.get(whatsapp_number) is entry:
+                            del self._evicted_dirty[whatsapp_number]
+                written += len(batch)
+                self.flushed += len(batch)
+                self.flush_batches += 1
+
+    def _expire_idle(self):
+        """Drop clean sessions idle past the TTL from memory"""
+        with self._lock:
+            expired = [
+                number for number, entry in self._entries.items()
+                if not entry.dirty and self._is_idle(entry)
+            ]
+            for whatsapp_number in expired:
+                entry = self._entries.pop(whatsapp_number)
+                self._bytes -= entry.size
+            self.expirations += len(expired)
+
+    def stats(self) -> dict:
+        """Cache and write-back counters"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "write_behind": self.write_behind,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "dirty": self.dirty_count(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "flushed": self.flushed,
+                "flush_batches": self.flush_batches,
+                "flush_errors": self.flush_errors,
+            }
+
+@event.listens_for(SessionLocal, "after_commit")
+def _apply_staged(db: Session):
+    for store, whatsapp_number, session, dirty in db.info.pop(_STAGED, ()):
+        store._apply(whatsapp_number, session, dirty)
+
+@event.listens_for(SessionLocal, "after_transaction_end")
+def _discard_staged(db: Session, transaction):
+    if transaction.parent is None:
+        db.info.pop(_STAGED, None)
+
+# Shared store used by the conversation handler
+session_store = SessionStore()
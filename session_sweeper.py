@@ -0,0 +1,166 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+import db_handler
+from database import SessionLocal
+from message_dedup import MESSAGE_DEDUP_TTL
+
+# Sweeper configuration
+SESSION_EXPIRE_AFTER = float(os.getenv('SESSION_EXPIRE_AFTER', str(7 * 24 * 3600)))  # Idle seconds
+SESSION_SWEEP_INTERVAL = float(os.getenv('SESSION_SWEEP_INTERVAL', '300'))
+SESSION_SWEEP_BATCH = int(os.getenv('SESSION_SWEEP_BATCH', '200'))
+SESSION_SWEEP_PAUSE = float(os.getenv('SESSION_SWEEP_PAUSE', '0.05'))  # Between batches
+
+logger = logging.getLogger(__name__)
+
+class SessionSweeper:
+    """
+    Background expiry of idle customer sessions
+
+    Every `interval` seconds, sessions idle for longer than `expire_after`
+    are removed in batches of `batch_size`, each batch in its own short
+    transaction with a pause in between, so the sweep never holds the
+    SQLite write lock for long. Order histories are kept in
+    archived_sessions. Processed MessageSids older than `dedup_ttl` are
+    pruned the same way.
+
+    `expire_after` should stay well above the session store's idle TTL;
+    a customer who comes back later simply starts a fresh session.
+    """
+
+    def __init__(self, expire_after: float = SESSION_EXPIRE_AFTER, interval: float = SESSION_SWEEP_INTERVAL,
+                 batch_size: int = SESSION_SWEEP_BATCH, pause: float = SESSION_SWEEP_PAUSE,
+                 dedup_ttl: float = MESSAGE_DEDUP_TTL):
+        self.expire_after = expire_after
+        self.dedup_ttl = dedup_ttl
+        self.interval = interval
+        self.batch_size = max(1, batch_size)
+        self.pause = pause
+
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Metrics
+        self.runs = 0
+        self.expired = 0
+        self.archived = 0
+        self.messages_pruned = 0
+        self.errors = 0
+        self.last_run: Optional[str] = None
+        self.last_duration_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        """Start sweeping in a background thread"""
+        if self.running or self.interval <= 0:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="session-sweeper", daemon=True)
+        self._thread.start()
+        logger.info("Session sweeper started", extra={
+            "event": "session_sweeper.started", "expire_after": self.expire_after, "interval": self.interval
+        })
+
+    def stop(self):
+        """Stop the sweeper, interrupting a sweep between batches"""
+        if not self.running:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception:
+                self.errors += 1
+                logger.exception("Session sweep failed", extra={"event": "session_sweeper.failed"})
+
+    def cutoff(self) -> datetime:
+        return datetime.now() - timedelta(seconds=self.expire_after)
+
+    def sweep(self) -> int:
+        """Expire every stale session, one batch at a time"""
+        started_at = time.perf_counter()
+        idle_before = self.cutoff()
+        total = 0
+        while not self._stopping.is_set():
+            db = SessionLocal()
+            try:
+                expired, archived = db_handler.archive_stale_sessions(db, idle_before, self.batch_size)
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+            total += expired
+            self.expired += expired
+            self.archived += archived
+            if expired < self.batch_size:
+                break
+            # Let queued writers in before the next batch
+            time.sleep(self.pause)
+
+        pruned = self.prune_processed_messages()
+
+        self.runs += 1
+        self.last_run = datetime.now().isoformat()
+        self.last_duration_ms = round((time.perf_counter() - started_at) * 1000, 2)
+        if total or pruned:
+            logger.info("Expired idle customer sessions", extra={
+                "event": "session_sweeper.expired", "expired": total,
+                "messages_pruned": pruned, "duration_ms": self.last_duration_ms
+            })
+        return total
+
+    def prune_processed_messages(self) -> int:
+        """Forget processed MessageSids past the dedup TTL, one batch at a time"""
+        processed_before = datetime.now() - timedelta(seconds=self.dedup_ttl)
+        total = 0
+        while not self._stopping.is_set():
+            db = SessionLocal()
+            try:
+                pruned = db_handler.prune_processed_messages(db, processed_before, self.batch_size)
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+            total += pruned
+            self.messages_pruned += pruned
+            if pruned < self.batch_size:
+                break
+            time.sleep(self.pause)
+        return total
+
+    def stats(self) -> dict:
+        """Session counts and sweep counters"""
+        db = SessionLocal()
+        try:
+            counts = db_handler.get_session_counts(db, self.cutoff())
+        finally:
+            db.close()
+        return {
+            "sessions": counts,
+            "running": self.running,
+            "expire_after": self.expire_after,
+            "runs": self.runs,
+            "expired_total": self.expired,
+            "archived_total": self.archived,
+            "messages_pruned_total": self.messages_pruned,
+            "errors": self.errors,
+            "last_run": self.last_run,
+            "last_duration_ms": self.last_duration_ms,
+        }
+
+# Shared sweeper started with the API
+session_sweeper = SessionSweeper()
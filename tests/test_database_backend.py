@@ -0,0 +1,81 @@
+"""
+Backend-sensitive database code: change revisions and the schema upgrade
+
+Run against each supported backend by setting DATABASE_URL (see conftest).
+"""
+import uuid
+
+from sqlalchemy import Boolean, Column, Integer, MetaData, String, Table, select
+
+import database
+import db_handler
+from models import Order, OrderItem
+
+def new_order(phone_number):
+    return Order(
+        id=0, customer_whatsapp=phone_number, status="pending", total_price=100.0, created_at="",
+        items=[OrderItem(menu_item_id=1, quantity=1)]
+    )
+
+def revision_of(db, order_id):
+    db.expire_all()
+    return db.get(database.OrderDB, order_id).revision
+
+def test_each_transaction_gets_a_higher_revision(db, phone_number):
+    before = db_handler.get_orders_revision(db)
+    first = db_handler.add_order(db, new_order(phone_number))
+    second = db_handler.add_order(db, new_order(phone_number))
+
+    assert before < revision_of(db, first.id) < revision_of(db, second.id)
+
+def test_one_revision_per_transaction(db, phone_number):
+    first = db_handler.add_order(db, new_order(phone_number), commit=False)
+    second = db_handler.add_order(db, new_order(phone_number), commit=False)
+    db.commit()
+
+    assert revision_of(db, first.id) == revision_of(db, second.id)
+
+def test_revision_without_update_returning(db, phone_number, monkeypatch):
+    # Backends without UPDATE ... RETURNING read the bumped counter back
+    monkeypatch.setattr(database.engine.dialect, "update_returning", False)
+    before = db_handler.get_orders_revision(db)
+    order = db_handler.add_order(db, new_order(phone_number))
+
+    assert revision_of(db, order.id) > before
+
+def test_bulk_insert_and_status_update_are_stamped(db, phone_number):
+    created = db_handler.add_orders_bulk(db, [new_order(phone_number) for _ in range(3)])
+    db.commit()
+    revisions = {revision_of(db, order.id) for order in created}
+    assert len(revisions) == 1
+
+    db_handler.update_order_status(db, created[0].id, "preparing")
+    assert revision_of(db, created[0].id) > revisions.pop()
+    assert db_handler.get_orders_revision(db) >= revision_of(db, created[0].id)
+
+def test_add_missing_columns_upgrades_an_existing_table():
+    name = f"upgrade_probe_{uuid.uuid4().hex[:8]}"
+    old = MetaData()
+    Table(name, old, Column("id", Integer, primary_key=True))
+    new = MetaData()
+    probe = Table(
+        name, new,
+        Column("id", Integer, primary_key=True),
+        Column("count", Integer, default=7),
+        Column("flag", Boolean, default=True),
+        Column("label", String(40), default="chef's special: 100%"),
+    )
+
+    old.create_all(database.engine)
+    try:
+        with database.engine.begin() as conn:
+            conn.execute(old.tables[name].insert().values(id=1))
+
+        database._add_missing_columns(new)
+        database._add_missing_columns(new)  # Already upgraded: no-op
+
+        with database.engine.connect() as conn:
+            row = conn.execute(select(probe)).one()
+        assert (row.count, row.flag, row.label) == (7, True, "chef's special: 100%")
+    finally:
+        new.drop_all(database.engine)
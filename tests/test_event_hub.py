@@ -0,0 +1,100 @@
+"""EventHub fan-out, slow-consumer eviction and Last-Event-ID replay"""
+import asyncio
+
+from event_hub import EventHub, format_sse
+
+def drain(subscriber):
+    events = []
+    while not subscriber.queue.empty():
+        events.append(subscriber.queue.get_nowait())
+    return events
+
+def run(scenario, **options):
+    async def main():
+        hub = EventHub(**options)
+        hub.start()
+        try:
+            return await scenario(hub)
+        finally:
+            hub.close()
+    return asyncio.run(main())
+
+def test_every_subscriber_gets_events_in_order():
+    async def scenario(hub):
+        first, second = hub.subscribe(), hub.subscribe()
+        for number in range(3):
+            hub.publish("order.created", {"id": number})
+        return drain(first), drain(second)
+
+    first, second = run(scenario)
+
+    assert first == second
+    assert [(event_type, payload) for _, event_type, payload in first] == \
+        [("order.created", f'{{"id": {number}}}') for number in range(3)]
+    assert [event_id for event_id, _, _ in first] == sorted({event_id for event_id, _, _ in first})
+
+def test_publish_from_another_thread_is_delivered():
+    async def scenario(hub):
+        subscriber = hub.subscribe()
+        await asyncio.get_running_loop().run_in_executor(None, hub.publish, "order.cancelled", {"id": 7})
+        return await asyncio.wait_for(subscriber.queue.get(), 1)
+
+    assert run(scenario)[1:] == ("order.cancelled", '{"id": 7}')
+
+def test_slow_consumer_is_evicted_without_affecting_others():
+    async def scenario(hub):
+        slow, fast = hub.subscribe(), hub.subscribe()
+        received = []
+        for number in range(5):
+            hub.publish("order.created", {"id": number})
+            received += drain(fast)
+        return (slow.closed, fast.closed), received, hub.stats()
+
+    closed, received, stats = run(scenario, buffer_size=2)
+
+    assert closed == (True, False)
+    assert len(received) == 5
+    assert (stats["evicted"], stats["subscribers"]) == (1, 1)
+
+def test_reconnect_replays_missed_events():
+    async def scenario(hub):
+        for number in range(4):
+            hub.publish("order.created", {"id": number})
+        last_seen = hub.stats()["last_event_id"] - 2
+        return last_seen, drain(hub.subscribe(last_event_id=last_seen))
+
+    last_seen, replayed = run(scenario)
+
+    assert [event_id for event_id, _, _ in replayed] == [last_seen + 1, last_seen + 2]
+    assert [payload for _, _, payload in replayed] == ['{"id": 2}', '{"id": 3}']
+
+def test_reconnect_from_before_the_history_gets_a_reset():
+    async def scenario(hub):
+        hub.publish("order.created", {"id": 0})
+        first_id = hub.stats()["last_event_id"]
+        for number in range(1, 5):
+            hub.publish("order.created", {"id": number})
+        return hub.stats()["last_event_id"], drain(hub.subscribe(last_event_id=first_id))
+
+    last_id, replayed = run(scenario, history_size=2)
+
+    assert replayed == [(last_id, "reset", "{}")]
+
+def test_reconnect_too_far_behind_for_the_buffer_gets_a_reset():
+    async def scenario(hub):
+        start_id = hub.stats()["last_event_id"]
+        for number in range(3):
+            hub.publish("order.created", {"id": number})
+        return drain(hub.subscribe(last_event_id=start_id))
+
+    replayed = run(scenario, buffer_size=3)
+
+    assert [event_type for _, event_type, _ in replayed] == ["reset"]
+
+def test_publish_before_start_is_ignored():
+    hub = EventHub()
+    hub.publish("order.created", {"id": 1})
+    assert hub.stats()["published"] == 0
+
+def test_format_sse():
+    assert format_sse((5, "order.created", '{"id": 1}')) == 'id: 5\nevent: order.created\ndata: {"id": 1}\n\n'
@@ -0,0 +1,90 @@
+"""LogStore persistence, compaction, crash recovery and cross-process writes"""
+import json
+import multiprocessing
+import os
+
+import pytest
+
+from json_handler import LogStore
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / "orders.json"), str(tmp_path / "orders.jsonl")
+
+def store(paths, **options):
+    return LogStore(*paths, key_field="id", index_field="customer", fsync=False, **options)
+
+def log_lines(paths):
+    with open(paths[1]) as f:
+        return f.read().splitlines()
+
+def test_writes_are_appended_and_replayed_by_a_new_store(paths):
+    writer = store(paths)
+    writer.put(1, {"id": 1, "customer": "a"})
+    writer.put(2, {"id": 2, "customer": "b"})
+    writer.put(1, {"id": 1, "customer": "b"})
+
+    assert len(log_lines(paths)) == 3
+    reader = store(paths)
+    assert reader.get(1) == {"id": 1, "customer": "b"}
+    assert [record["id"] for record in reader.find("b")] == [2, 1]
+    assert reader.find("a") == []
+
+def test_log_is_compacted_into_the_snapshot(paths):
+    writer = store(paths, compact_min=3)
+    for key in range(1, 4):
+        writer.put(key, {"id": key, "customer": "a"})
+
+    assert log_lines(paths) == []
+    with open(paths[0]) as f:
+        assert [record["id"] for record in json.load(f)] == [1, 2, 3]
+
+    writer.put(4, {"id": 4, "customer": "a"})
+    assert [record["id"] for record in store(paths).values()] == [1, 2, 3, 4]
+
+def test_torn_last_line_is_ignored_and_overwritten(paths):
+    store(paths).put(1, {"id": 1, "customer": "a"})
+    with open(paths[1], "a") as f:
+        f.write('{"key": 2, "value": {"id": 2')  # Writer crashed mid-line
+
+    recovered = store(paths)
+    assert [record["id"] for record in recovered.values()] == [1]
+
+    recovered.put(3, {"id": 3, "customer": "a"})
+    assert [json.loads(line)["key"] for line in log_lines(paths)] == [1, 3]
+    assert [record["id"] for record in store(paths).values()] == [1, 3]
+
+def test_store_catches_up_with_another_writer(paths):
+    first, second = store(paths), store(paths)
+    first.put(1, {"id": 1, "customer": "a"})
+    second.put(2, {"id": 2, "customer": "a"})
+    first.compact()
+
+    assert [record["id"] for record in second.values()] == [1, 2]
+    second.put(3, {"id": 3, "customer": "a"})
+    assert [record["id"] for record in first.values()] == [1, 2, 3]
+
+def test_ensure_only_fills_an_empty_store(paths):
+    store(paths).ensure({1: {"id": 1, "customer": "default"}})
+    store(paths).ensure({9: {"id": 9, "customer": "default"}})
+
+    assert [record["id"] for record in store(paths).values()] == [1]
+
+def _add_records(paths, count):
+    writer = store(paths, compact_min=7)
+    for _ in range(count):
+        # Read-modify-write under the store lock, like json_handler.add_order
+        writer.update(lambda records: [(max(records, default=0) + 1, {"id": max(records, default=0) + 1,
+                                                                       "customer": os.getpid()})])
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_concurrent_processes_never_lose_or_reuse_a_key(paths):
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_add_records, args=(paths, 50)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert [worker.exitcode for worker in workers] == [0] * 4
+    assert sorted(record["id"] for record in store(paths).values()) == list(range(1, 201))
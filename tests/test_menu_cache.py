@@ -0,0 +1,41 @@
+"""The menu snapshot keeps the newest revision of every item, wherever it was written"""
+import database
+import db_handler
+import menu_cache
+from models import MenuItem
+
+def test_out_of_order_publish_is_skipped():
+    db = database.SessionLocal()
+    try:
+        item = db_handler.add_menu_item(db, MenuItem(
+            id=0, name="Paneer Tikka", description="", price=199.0, is_available=True
+        ))
+        stale = item.model_copy(update={"price": 149.0})
+        revision = menu_cache.get_menu_snapshot().version
+
+        db_handler.update_menu_item(db, item.id, {"price": 249.0})
+        # The earlier writer publishes late
+        menu_cache.publish_item(stale, revision)
+
+        snapshot = menu_cache.get_menu_snapshot()
+        assert snapshot.by_id[item.id].price == 249.0
+        assert snapshot.version > revision
+    finally:
+        db.close()
+
+def test_change_from_another_worker_is_picked_up(monkeypatch):
+    monkeypatch.setattr(menu_cache, "MENU_REFRESH_INTERVAL", 0.01)
+    db = database.SessionLocal()
+    try:
+        item = db_handler.add_menu_item(db, MenuItem(
+            id=0, name="Veg Momos", description="", price=120.0, is_available=True
+        ))
+        # Another worker's commit: the database changes, this process publishes nothing
+        row = db.get(database.MenuItemDB, item.id)
+        row.price = 140.0
+        db.commit()
+        monkeypatch.setattr(menu_cache, "_checked_at", 0.0)
+
+        assert menu_cache.get_menu_snapshot().by_id[item.id].price == 140.0
+    finally:
+        db.close()
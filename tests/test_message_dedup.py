@@ -0,0 +1,98 @@
+"""Twilio retries are handled once: in memory at the webhook, in the database across restarts"""
+import threading
+import time
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+import conversation_handler
+import main
+from message_dedup import MessageDeduplicator
+
+@pytest.fixture
+def message_sid():
+    return f"SM{uuid.uuid4().hex}"
+
+def test_second_claim_is_a_duplicate(message_sid):
+    dedup = MessageDeduplicator()
+
+    assert dedup.claim(message_sid)
+    assert not dedup.claim(message_sid)
+    assert (dedup.stats()["claimed"], dedup.stats()["duplicates"]) == (1, 1)
+
+def test_messages_without_a_sid_are_always_accepted():
+    dedup = MessageDeduplicator()
+    assert dedup.claim(None) and dedup.claim(None) and dedup.claim("")
+
+def test_released_claim_can_be_claimed_again(message_sid):
+    dedup = MessageDeduplicator()
+    dedup.claim(message_sid)
+    dedup.release(message_sid)
+
+    assert dedup.claim(message_sid)
+
+def test_old_and_excess_claims_are_forgotten():
+    by_age = MessageDeduplicator(ttl=0.01)
+    by_age.claim("SM1")
+    time.sleep(0.02)
+    by_age.claim("SM2")
+
+    by_count = MessageDeduplicator(max_entries=2)
+    for sid in ("SM1", "SM2", "SM3"):
+        by_count.claim(sid)
+
+    assert by_age.claim("SM1") and by_count.claim("SM1")
+    assert not by_count.claim("SM3")
+
+def test_counters_are_exact_under_concurrent_workers():
+    dedup = MessageDeduplicator()
+
+    def worker(worker_id):
+        for i in range(1000):
+            dedup.claim(f"SM{i}")
+            dedup.record_persisted_duplicate()
+
+    threads = [threading.Thread(target=worker, args=(worker_id,)) for worker_id in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = dedup.stats()
+    assert (stats["claimed"], stats["duplicates"], stats["duplicates_persisted"]) == (1000, 7000, 8000)
+
+def test_webhook_queues_a_retried_message_once(monkeypatch, phone_number, message_sid):
+    queued = []
+    monkeypatch.setattr(main, "message_dedup", MessageDeduplicator())
+    monkeypatch.setattr(main.inbound_queue, "enqueue", lambda *message: queued.append(message) or True)
+    form = {"From": f"whatsapp:{phone_number}", "Body": "HI", "MessageSid": message_sid}
+
+    client = TestClient(main.app)
+    first = client.post("/webhook/whatsapp", data=form)
+    retry = client.post("/webhook/whatsapp", data=form)
+
+    assert (first.json()["status"], retry.json()["status"]) == ("success", "duplicate")
+    assert queued == [(phone_number, "HI", message_sid)]
+
+def test_message_rejected_as_busy_is_accepted_on_retry(monkeypatch, phone_number, message_sid):
+    accept = iter([False, True])
+    monkeypatch.setattr(main, "message_dedup", MessageDeduplicator())
+    monkeypatch.setattr(main.inbound_queue, "enqueue", lambda *message: next(accept))
+    form = {"From": f"whatsapp:{phone_number}", "Body": "HI", "MessageSid": message_sid}
+    client = TestClient(main.app)
+
+    assert client.post("/webhook/whatsapp", data=form).status_code == 503
+    assert client.post("/webhook/whatsapp", data=form).json()["status"] == "success"
+
+def test_message_handled_before_a_restart_is_skipped(monkeypatch, phone_number, message_sid, outbox):
+    conversation_handler.handle_incoming_message(phone_number, "HI", message_sid)
+    assert len(outbox) == 1
+
+    # A new process: nothing in memory, only the processed_messages table
+    restarted = MessageDeduplicator()
+    monkeypatch.setattr(conversation_handler, "message_dedup", restarted)
+    conversation_handler.handle_incoming_message(phone_number, "HI", message_sid)
+
+    assert len(outbox) == 1
+    assert restarted.stats()["duplicates_persisted"] == 1
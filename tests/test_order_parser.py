@@ -0,0 +1,69 @@
+"""Order message grammar, fuzzy name matching and limits"""
+import json
+import os
+
+import pytest
+
+import menu_cache
+import order_parser
+from models import MenuItem
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks", "corpus", "order_messages.jsonl")
+
+def snapshot(names, version=1):
+    return menu_cache._build_snapshot(version, [
+        MenuItem(id=item_id, name=name, description="", price=100.0, is_available=True)
+        for item_id, name in enumerate(names, start=1)
+    ])
+
+# The sample menu from database.initialize_sample_data (which the corpus is
+# written against), plus a name containing "and"
+MENU = snapshot(["Margherita Pizza", "Pepperoni Pizza", "Coke", "Garlic Bread", "Mac and Cheese"])
+
+def parse(message, menu=MENU):
+    parsed = order_parser.parse_order(message, menu)
+    if parsed.error:
+        return parsed.error
+    return [(item.menu_item_id, item.quantity) for item in parsed.items]
+
+def load_corpus():
+    with open(CORPUS, encoding="utf-8") as corpus:
+        return [json.loads(line) for line in corpus if line.strip()]
+
+@pytest.mark.parametrize("case", load_corpus(), ids=lambda case: repr(case["message"]))
+def test_corpus(case):
+    expected = case["error"] if "error" in case else [tuple(line) for line in case["items"]]
+    assert parse(case["message"]) == expected
+
+@pytest.mark.parametrize("message, expected", [
+    ("1x2 3x1; #4*2", [(1, 2), (3, 1), (4, 2)]),
+    ("mac and cheese x2", [(5, 2)]),
+    ("2 coke and 1 garlic bread", [(3, 2), (4, 1)]),
+    ("1 mac & cheese", [(5, 1)]),
+    ("GARLIC BREADS", [(4, 1)]),
+    ("pepperonni", [(2, 1)]),
+])
+def test_grammar(message, expected):
+    assert parse(message) == expected
+
+@pytest.mark.parametrize("message", ["margherita 1x2", "1x2 pizza", "coke 3x1 please", "1x2 and then"])
+def test_item_numbers_mixed_with_text_are_rejected(message):
+    assert parse(message) == "invalid_order"
+
+def test_name_shared_by_several_items_is_not_matched():
+    assert parse("pizza") == "item_not_found"
+
+def test_limits():
+    assert parse(f"1x{order_parser.ORDER_MAX_QUANTITY}") == [(1, order_parser.ORDER_MAX_QUANTITY)]
+    assert parse(f"1x{order_parser.ORDER_MAX_QUANTITY}, 1x1") == "invalid_quantity"
+    many = ", ".join(f"{item_id}x1" for item_id in range(1, order_parser.ORDER_MAX_LINES + 2))
+    assert parse(many) == "invalid_order"
+    assert parse("1x1 " * order_parser.ORDER_MAX_MESSAGE_LENGTH) == "invalid_order"
+
+def test_index_is_rebuilt_only_for_a_new_menu_version():
+    first = order_parser.get_menu_index(MENU)
+    assert order_parser.get_menu_index(MENU) is first
+
+    renamed = snapshot(["Margherita Pizza", "Pepperoni Pizza", "Lemonade"], version=2)
+    assert order_parser.get_menu_index(renamed) is not first
+    assert parse("lemonade", renamed) == [(3, 1)]
@@ -0,0 +1,61 @@
+"""Order listings load items eagerly: a constant number of queries however many orders"""
+import math
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+import database
+import db_handler
+from models import Order, OrderItem
+
+# Orders per items query: selectinload chunks its IN list at this size
+SELECTIN_BATCH = 500
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(database.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(database.engine, "before_cursor_execute", before_cursor_execute)
+
+def add_orders(db, phone_number, count):
+    for _ in range(count):
+        db_handler.add_order(db, Order(
+            id=0, customer_whatsapp=phone_number, status="pending", total_price=648.0, created_at="",
+            items=[OrderItem(menu_item_id=1, quantity=2), OrderItem(menu_item_id=3, quantity=1)]
+        ))
+
+def queries_for(listing, db, phone_number):
+    """Queries the listing ran, less the extra items queries for each further SELECTIN_BATCH orders"""
+    db.expire_all()
+    with count_queries() as statements:
+        orders = listing(db, phone_number)
+    assert all(order.items for order in orders)
+    # read_orders lists every order, which on a reused database can be many
+    return len(statements) - (max(1, math.ceil(len(orders) / SELECTIN_BATCH)) - 1)
+
+LISTINGS = {
+    "read_orders": lambda db, phone: db_handler.read_orders(db),
+    "list_orders": lambda db, phone: db_handler.list_orders(db, customer_whatsapp=phone)[0],
+    "get_customer_orders": db_handler.get_customer_orders,
+    "get_customer_active_orders": db_handler.get_customer_active_orders,
+}
+
+@pytest.mark.parametrize("name", list(LISTINGS))
+def test_listing_query_count_does_not_grow_with_orders(db, phone_number, name):
+    listing = LISTINGS[name]
+
+    add_orders(db, phone_number, 1)
+    single = queries_for(listing, db, phone_number)
+
+    add_orders(db, phone_number, 24)
+    many = queries_for(listing, db, phone_number)
+
+    assert single == many == 2
@@ -0,0 +1,72 @@
+"""Bulk status changes update only orders that may move and report every ID"""
+import pytest
+from fastapi.testclient import TestClient
+
+import db_handler
+import main
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(main.app)
+
+def test_only_orders_that_may_move_are_updated(db, create_order):
+    pending, preparing, delivered = create_order("pending"), create_order("preparing"), create_order("delivered")
+
+    updated = db_handler.update_orders_status(db, [pending.id, preparing.id, delivered.id, 10 ** 9], "preparing")
+    db.commit()
+
+    assert [(order.id, order.status, order.version) for order in updated] == [(pending.id, "preparing", 2)]
+    assert [item.quantity for item in updated[0].items] == [2]
+    assert db_handler.get_order_statuses(db, [preparing.id, delivered.id]) == \
+        {preparing.id: "preparing", delivered.id: "delivered"}
+
+def test_from_status_narrows_the_sources(db, create_order):
+    pending, preparing = create_order("pending"), create_order("preparing")
+
+    updated = db_handler.update_orders_status(db, [pending.id, preparing.id], "cancelled", ["preparing"])
+    db.commit()
+
+    assert [order.id for order in updated] == [preparing.id]
+    assert db_handler.get_order(db, pending.id).status == "pending"
+
+def test_unknown_status_is_rejected(db, create_order):
+    with pytest.raises(db_handler.InvalidTransitionError):
+        db_handler.update_orders_status(db, [create_order().id], "eaten")
+
+def test_endpoint_reports_updated_skipped_and_not_found(client, create_order, phone_number, outbox):
+    first, second, delivered = create_order(), create_order(), create_order("delivered")
+    missing = 10 ** 9
+
+    response = client.patch("/orders/bulk", json={
+        "order_ids": [first.id, delivered.id, missing, second.id, first.id], "status": "preparing"
+    })
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "updated": 2,
+        "skipped": 1,
+        "not_found": 1,
+        "results": [
+            {"order_id": first.id, "status": "updated"},
+            {"order_id": delivered.id, "status": "skipped", "current_status": "delivered"},
+            {"order_id": missing, "status": "not_found"},
+            {"order_id": second.id, "status": "updated"},
+        ],
+    }
+    # One notification per updated order, none for the others
+    assert [to_number for to_number, _ in outbox] == [phone_number, phone_number]
+
+@pytest.mark.parametrize("body", [
+    {"order_ids": [1], "status": "eaten"},
+    {"order_ids": [1], "status": "preparing", "from_status": ["eaten"]},
+])
+def test_endpoint_rejects_unknown_statuses(client, body, outbox):
+    assert client.patch("/orders/bulk", json=body).status_code == 400
+    assert outbox == []
+
+def test_endpoint_limits_ids_per_request(client, monkeypatch, outbox):
+    monkeypatch.setattr(main, "ORDERS_BULK_STATUS_MAX_IDS", 2)
+
+    response = client.patch("/orders/bulk", json={"order_ids": [1, 2, 3], "status": "preparing"})
+
+    assert response.status_code == 400
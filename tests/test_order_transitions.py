@@ -0,0 +1,97 @@
+"""Status changes follow ORDER_TRANSITIONS and never overwrite a concurrent change"""
+import itertools
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, update
+
+import db_handler
+import main
+from database import OrderDB
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(main.app)
+
+@pytest.mark.parametrize("current, status", list(itertools.product(db_handler.ORDER_STATUSES, repeat=2)))
+def test_transition_table_is_enforced(current, status):
+    if status in db_handler.ORDER_TRANSITIONS[current]:
+        db_handler.check_transition(current, status)
+    else:
+        with pytest.raises(db_handler.InvalidTransitionError):
+            db_handler.check_transition(current, status)
+
+def test_each_change_bumps_the_version(db, create_order):
+    order = create_order()
+
+    versions = [db_handler.update_order_status(db, order.id, status).version
+                for status in ("preparing", "out-for-delivery", "delivered")]
+
+    assert versions == [2, 3, 4]
+    assert db_handler.get_order(db, order.id).status == "delivered"
+
+def test_invalid_transition_changes_nothing(db, create_order):
+    order = create_order("delivered")
+
+    with pytest.raises(db_handler.InvalidTransitionError):
+        db_handler.update_order_status(db, order.id, "preparing")
+    db.rollback()
+
+    assert (db_handler.get_order(db, order.id).status, db_handler.get_order(db, order.id).version) == ("delivered", 1)
+
+def test_missing_order_returns_none(db):
+    assert db_handler.update_order_status(db, 10 ** 9, "preparing") is None
+
+def change_before_first_update(db, order_id, status):
+    """Another writer moves the order between the status read and the compare-and-swap"""
+    fired = []
+
+    @event.listens_for(db, "do_orm_execute")
+    def concurrent_writer(orm_execute_state):
+        if orm_execute_state.is_update and orm_execute_state.bind_mapper is OrderDB.__mapper__ and not fired:
+            fired.append(True)
+            orm_execute_state.session.connection().execute(
+                update(OrderDB.__table__)
+                .where(OrderDB.id == order_id)
+                .values(status=status, version=OrderDB.version + 1)
+            )
+
+def test_lost_race_is_retried_against_the_new_status(db, create_order):
+    order = create_order()
+    change_before_first_update(db, order.id, "preparing")
+
+    cancelled = db_handler.update_order_status(db, order.id, "cancelled")
+
+    # preparing -> cancelled is allowed, applied on top of the winner's version
+    assert (cancelled.status, cancelled.version) == ("cancelled", 3)
+
+def test_lost_race_rechecks_the_transition(db, create_order):
+    order = create_order("out-for-delivery")
+    change_before_first_update(db, order.id, "delivered")
+
+    with pytest.raises(db_handler.InvalidTransitionError):
+        db_handler.update_order_status(db, order.id, "cancelled")
+
+def test_lost_race_with_expected_version_is_a_conflict(db, create_order):
+    order = create_order()
+    change_before_first_update(db, order.id, "preparing")
+
+    with pytest.raises(db_handler.ConcurrentUpdateError):
+        db_handler.update_order_status(db, order.id, "cancelled", expected_version=order.version)
+
+def test_endpoint_answers_409_for_a_stale_version(client, create_order, outbox):
+    order = create_order()
+    assert client.patch(f"/orders/{order.id}", json={"status": "preparing"}).json()["version"] == 2
+
+    response = client.patch(f"/orders/{order.id}", json={"status": "cancelled", "version": 1})
+
+    assert response.status_code == 409
+    assert client.get(f"/orders/{order.id}").json()["status"] == "preparing"
+    assert len(outbox) == 1
+
+def test_endpoint_answers_400_for_an_invalid_transition(client, create_order, outbox):
+    order = create_order("cancelled")
+
+    assert client.patch(f"/orders/{order.id}", json={"status": "preparing"}).status_code == 400
+    assert client.delete(f"/orders/{order.id}").status_code == 400
+    assert outbox == []
@@ -0,0 +1,78 @@
+"""POST /orders/bulk reports every row and never stores an invalid one"""
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import db_handler
+import database
+import main
+import order_parser
+from models import MenuItem
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(main.app)
+
+@pytest.fixture(scope="module")
+def item_id():
+    db = database.SessionLocal()
+    try:
+        return db_handler.add_menu_item(db, MenuItem(
+            id=0, name="Aloo Paratha", description="", price=80.0, is_available=True
+        )).id
+    finally:
+        db.close()
+
+def rows(phone_number, item_id):
+    return [
+        {"customer_whatsapp": phone_number, "items": [{"menu_item_id": item_id, "quantity": 2}]},
+        {"customer_whatsapp": phone_number, "items": [{"menu_item_id": item_id, "quantity": 0}]},
+        {"customer_whatsapp": phone_number, "items": [{"menu_item_id": item_id, "quantity": -3}]},
+        {"customer_whatsapp": phone_number,
+         "items": [{"menu_item_id": item_id, "quantity": order_parser.ORDER_MAX_QUANTITY + 1}]},
+        {"customer_whatsapp": phone_number, "items": [{"menu_item_id": 10 ** 9, "quantity": 1}]},
+    ]
+
+def post(client, body, ndjson):
+    if ndjson:
+        return client.post("/orders/bulk", content="\n".join(json.dumps(row) for row in body),
+                           headers={"Content-Type": "application/x-ndjson"})
+    return client.post("/orders/bulk", json=body)
+
+@pytest.mark.parametrize("ndjson", [False, True], ids=["json", "ndjson"])
+def test_rows_are_reported_one_by_one(client, item_id, phone_number, outbox, ndjson):
+    response = post(client, rows(phone_number, item_id), ndjson)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["received"], body["created"], body["failed"], body["truncated"]) == (5, 1, 4, False)
+    assert [result["status"] for result in body["results"]] == ["created", "failed", "failed", "failed", "failed"]
+    assert all("Quantity" in result["error"] for result in body["results"][1:4])
+    assert "does not exist" in body["results"][4]["error"]
+
+    db = database.SessionLocal()
+    try:
+        orders = db_handler.get_customer_orders(db, phone_number)
+    finally:
+        db.close()
+    assert [(order.total_price, [item.quantity for item in order.items]) for order in orders] == [(160.0, [2])]
+    assert [to_number for to_number, _ in outbox] == [phone_number]
+
+def test_json_array_over_the_limit_is_rejected(client, item_id, phone_number, outbox, monkeypatch):
+    monkeypatch.setattr(main, "ORDERS_BULK_MAX_ROWS", 2)
+
+    response = post(client, rows(phone_number, item_id)[:1] * 3, ndjson=False)
+
+    assert response.status_code == 413
+    assert outbox == []
+
+def test_ndjson_stream_stops_at_the_limit(client, item_id, phone_number, outbox, monkeypatch):
+    monkeypatch.setattr(main, "ORDERS_BULK_MAX_ROWS", 2)
+
+    response = post(client, rows(phone_number, item_id)[:1] * 3, ndjson=True)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["received"], body["created"], body["truncated"]) == (2, 2, True)
+    assert [result["index"] for result in body["results"]] == [0, 1]
@@ -0,0 +1,120 @@
+"""OutboundSender ordering, batching and retries against a scripted Twilio"""
+import asyncio
+import random
+from concurrent.futures import Future
+from typing import List
+
+import pytest
+from aiohttp import web
+
+from outbound_sender import BATCH_SEPARATOR, MAX_BODY_LENGTH, DeliveryError, OutboundSender
+
+class ScriptedTwilio:
+    """Messages API answering with `statuses` in turn (201 once they run out)"""
+
+    def __init__(self, statuses=(), max_delay: float = 0.0):
+        self.statuses = list(statuses)
+        self.max_delay = max_delay
+        self.received: List[dict] = []
+
+    async def create_message(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        await asyncio.sleep(random.uniform(0, self.max_delay))
+        status = self.statuses.pop(0) if self.statuses else 201
+        if status != 201:
+            return web.json_response({"message": "scripted"}, status=status, headers={"Retry-After": "0"})
+        self.received.append({"to": form["To"], "body": form["Body"]})
+        return web.json_response({"sid": f"SM{len(self.received)}"}, status=201)
+
+async def run_sender(twilio: ScriptedTwilio, scenario, **options):
+    """Start the fake and a sender pointed at it, then run `scenario(sender)`"""
+    app = web.Application()
+    app.router.add_post("/2010-04-01/Accounts/{account_sid}/Messages.json", twilio.create_message)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    sender = OutboundSender("ACtest", "token", "whatsapp:+10000000000", api_base=f"http://127.0.0.1:{port}", **options)
+    sender.backoff_base = 0.001
+    await sender.start()
+    try:
+        return await scenario(sender)
+    finally:
+        await sender.stop()
+        await runner.cleanup()
+
+async def results(futures: List[Future]):
+    return await asyncio.gather(*(asyncio.wrap_future(future) for future in futures), return_exceptions=True)
+
+def test_each_recipient_gets_messages_in_submission_order():
+    twilio = ScriptedTwilio(max_delay=0.005)
+    # Too long to batch, so every message is its own request
+    bodies = {number: [f"{number} #{i} " + "x" * (MAX_BODY_LENGTH // 2) for i in range(8)]
+              for number in ("whatsapp:+1", "whatsapp:+2", "whatsapp:+3")}
+
+    async def scenario(sender):
+        futures = [sender.submit(number, body) for i in range(8) for number, body in
+                   ((number, messages[i]) for number, messages in bodies.items())]
+        return await results(futures)
+
+    sids = asyncio.run(run_sender(twilio, scenario, concurrency=4))
+
+    assert all(isinstance(sid, str) for sid in sids)
+    for number, expected in bodies.items():
+        assert [message["body"] for message in twilio.received if message["to"] == number] == expected
+
+def test_queued_messages_to_one_recipient_are_batched():
+    twilio = ScriptedTwilio()
+
+    async def scenario(sender):
+        # Submitted from the loop before the lane task first runs
+        futures = [sender.submit("whatsapp:+1", body) for body in ("one", "two", "three")]
+        sids = await results(futures)
+        return sids, sender.stats()
+
+    sids, stats = asyncio.run(run_sender(twilio, scenario))
+
+    assert twilio.received == [{"to": "whatsapp:+1", "body": BATCH_SEPARATOR.join(["one", "two", "three"])}]
+    assert sids == ["SM1"] * 3
+    assert (stats["sent"], stats["batched"]) == (3, 2)
+
+@pytest.mark.parametrize("statuses", [[429], [503, 500], [429, 502, 504]])
+def test_throttling_and_server_errors_are_retried(statuses):
+    twilio = ScriptedTwilio(statuses)
+
+    async def scenario(sender):
+        sid, = await results([sender.submit("whatsapp:+1", "hello")])
+        return sid, sender.stats()
+
+    sid, stats = asyncio.run(run_sender(twilio, scenario, max_retries=3))
+
+    assert sid == "SM1"
+    assert (stats["retries"], stats["sent"], stats["failed"]) == (len(statuses), 1, 0)
+
+@pytest.mark.parametrize("statuses, retries", [([400], 0), ([503] * 3, 2)], ids=["client-error", "retries-exhausted"])
+def test_undeliverable_message_fails_its_future(statuses, retries):
+    twilio = ScriptedTwilio(statuses)
+
+    async def scenario(sender):
+        error, = await results([sender.submit("whatsapp:+1", "hello")])
+        return error, sender.stats()
+
+    error, stats = asyncio.run(run_sender(twilio, scenario, max_retries=2))
+
+    assert isinstance(error, DeliveryError) and error.status == statuses[-1]
+    assert (stats["retries"], stats["failed"]) == (retries, 1)
+    assert twilio.received == []
+
+def test_a_failed_message_does_not_block_the_next_one():
+    twilio = ScriptedTwilio([400])
+
+    async def scenario(sender):
+        first = sender.submit("whatsapp:+1", "a" * MAX_BODY_LENGTH)
+        second = sender.submit("whatsapp:+1", "hello again")
+        return await results([first, second])
+
+    error, sid = asyncio.run(run_sender(twilio, scenario))
+
+    assert isinstance(error, DeliveryError)
+    assert sid == "SM1" and twilio.received == [{"to": "whatsapp:+1", "body": "hello again"}]
@@ -0,0 +1,80 @@
+"""Session store saves only reach the cache when the turn's transaction commits"""
+import os
+
+import pytest
+
+import database
+from models import OrderItem
+from session_store import SessionStore
+
+@pytest.fixture
+def store():
+    store = SessionStore(enabled=True, flush_interval=3600)
+    store.start()
+    yield store
+    store.stop()
+
+def turn(store, phone_number, state, cart, durable=False, commit=True):
+    """Load, change and save a session the way ConversationTurn does"""
+    db = database.SessionLocal()
+    try:
+        session = store.load(db, phone_number)
+        session.state = state
+        session.cart = cart
+        store.save(db, phone_number, session, durable=durable)
+        if not commit:
+            raise RuntimeError("commit failed")
+        db.commit()
+    except RuntimeError:
+        db.rollback()
+        store.invalidate(phone_number)
+    finally:
+        db.close()
+
+def current(store, phone_number):
+    db = database.SessionLocal()
+    try:
+        return store.load(db, phone_number)
+    finally:
+        db.close()
+
+def test_committed_save_is_cached(store, phone_number):
+    turn(store, phone_number, "confirming_order", [OrderItem(menu_item_id=1, quantity=2)])
+
+    session = current(store, phone_number)
+    assert session.state == "confirming_order"
+    assert store.dirty_count() == 1
+
+@pytest.mark.parametrize("durable", [True, False])
+def test_failed_turn_keeps_the_previous_dirty_session(store, phone_number, durable):
+    cart = [OrderItem(menu_item_id=1, quantity=2)]
+    turn(store, phone_number, "confirming_order", cart)
+    turn(store, phone_number, "main_menu", [], durable=durable, commit=False)
+
+    session = current(store, phone_number)
+    assert (session.state, session.cart) == ("confirming_order", cart)
+
+def test_failed_write_behind_save_is_never_flushed(store, phone_number):
+    turn(store, phone_number, "viewing_menu", [])
+    store.flush()
+    turn(store, phone_number, "placing_order", [], commit=False)
+
+    assert store.flush() == 0
+    assert current(SessionStore(enabled=False), phone_number).state == "viewing_menu"
+
+def test_stores_sharing_a_database_see_each_others_durable_writes(phone_number):
+    """Two workers' stores with the cache off, as with a shared database by default"""
+    worker_a, worker_b = SessionStore(enabled=False), SessionStore(enabled=False)
+    cart = [OrderItem(menu_item_id=3, quantity=1)]
+
+    turn(worker_a, phone_number, "confirming_order", cart)
+    assert (current(worker_b, phone_number).state, current(worker_b, phone_number).cart) == \
+        ("confirming_order", cart)
+
+    turn(worker_b, phone_number, "main_menu", [])
+    assert (current(worker_a, phone_number).state, current(worker_a, phone_number).cart) == ("main_menu", [])
+
+def test_session_cache_defaults_off_unless_single_process():
+    import session_store
+    if "SESSION_CACHE" not in os.environ:
+        assert session_store.SESSION_CACHE == database.SINGLE_PROCESS
@@ -0,0 +1,38 @@
+"""Session expiry only counts (and archives) the sessions it actually removed"""
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, update
+
+import db_handler
+from database import ArchivedSessionDB, CustomerSessionDB
+
+def add_session(db, whatsapp_number, order_history):
+    db.add(CustomerSessionDB(
+        whatsapp_number=whatsapp_number,
+        last_interaction=datetime.now() - timedelta(days=3650),
+        order_history=json.dumps(order_history)
+    ))
+    db.commit()
+
+def test_session_touched_after_select_is_not_expired_or_archived(db, phone_number):
+    idle, touched = f"{phone_number}-idle", f"{phone_number}-touched"
+    add_session(db, idle, [1])
+    add_session(db, touched, [2])
+
+    @event.listens_for(db, "do_orm_execute")
+    def customer_writes_in(orm_execute_state):
+        # The customer sends a message between the sweeper's SELECT and DELETE
+        if orm_execute_state.is_delete:
+            orm_execute_state.session.connection().execute(
+                update(CustomerSessionDB.__table__)
+                .where(CustomerSessionDB.whatsapp_number == touched)
+                .values(last_interaction=datetime.now())
+            )
+
+    expired, archived = db_handler.archive_stale_sessions(db, datetime.now() - timedelta(days=3649), limit=1000)
+
+    assert (expired, archived) == (1, 1)
+    assert db.get(ArchivedSessionDB, idle) is not None
+    assert db.get(ArchivedSessionDB, touched) is None
+    assert db.query(CustomerSessionDB).filter(CustomerSessionDB.whatsapp_number == touched).count() == 1
@@ -0,0 +1,411 @@
+"""
+Opt-in conversation tracing
+
+With TRACING=on every inbound WhatsApp turn records a span tree (session
+load, state handler, parse / validate / total, DB commit, outbound sends)
+that is exported in the background to a JSONL file (TRACE_EXPORTER=file)
+or an OpenTelemetry collector over OTLP/HTTP JSON (TRACE_EXPORTER=otlp).
+Recent turns are also aggregated in process into a per-state latency
+report, and `python tracing.py traces.jsonl` builds the same report from
+an exported file.
+
+When tracing is off, or no turn is being traced, `span()` returns a shared
+no-op context manager, so instrumented code pays one ContextVar lookup.
+"""
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import urllib.request
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from typing import Callable, Deque, Dict, Iterable, List, Optional
+import app_logging
+
+# Tracing configuration
+TRACING = os.getenv('TRACING', 'off').lower() == 'on'
+TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', 'file')  # file, otlp or none
+TRACE_FILE = os.getenv('TRACE_FILE', 'traces.jsonl')
+TRACE_OTLP_ENDPOINT = os.getenv('TRACE_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces')
+TRACE_SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'food-ordering-api')
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '1.0'))
+TRACE_QUEUE_SIZE = int(os.getenv('TRACE_QUEUE_SIZE', '10000'))
+TRACE_FLUSH_INTERVAL = float(os.getenv('TRACE_FLUSH_INTERVAL', '2'))
+TRACE_REPORT_WINDOW = int(os.getenv('TRACE_REPORT_WINDOW', '5000'))  # Turns kept for the report
+
+EXPORT_BATCH = 512
+
+logger = logging.getLogger(__name__)
+
+class Span:
+    """One timed operation in a trace"""
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "root", "start_ns", "end_ns",
+                 "attributes", "error", "children")
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, attributes: Optional[dict] = None):
+        self.name = name
+        self.span_id = f"{random.getrandbits(64):016x}"
+        if parent is None:
+            self.trace_id = f"{random.getrandbits(128):032x}"
+            self.parent_id = None
+            self.root = self
+        else:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+            self.root = parent.root
+        self.attributes = attributes or {}
+        self.error: Optional[str] = None
+        self.children: List[tuple] = []  # (name, duration_ms) of finished descendants, on roots only
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+# Span the current code runs under (None outside a traced turn)
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+class _SpanScope:
+    """Context manager making a span current for the duration of a block"""
+    __slots__ = ("span", "_token")
+
+    def __init__(self, span: Span):
+        self.span = span
+
+    def __enter__(self) -> Span:
+        self._token = current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        current_span.reset(self._token)
+        if exc_type is not None:
+            self.span.error = f"{exc_type.__name__}: {exc}"
+        tracer.finish(self.span)
+        return False
+
+class _NoopScope:
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP = _NoopScope()
+
+def trace(name: str, **attributes):
+    """Start a new trace (a root span) if tracing is on and the turn is sampled"""
+    if not tracer.enabled or random.random() >= tracer.sample_rate:
+        return _NOOP
+    attributes.setdefault("correlation_id", app_logging.get_correlation_id())
+    return _SpanScope(Span(name, None, attributes))
+
+def span(name: str, **attributes):
+    """Child span of the current one; a no-op outside a traced turn"""
+    parent = current_span.get()
+    if parent is None:
+        return _NOOP
+    return _SpanScope(Span(name, parent, attributes))
+
+def set_attributes(**attributes):
+    """Annotate the current span, if any"""
+    current = current_span.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+def traced(name: str) -> Callable:
+    """Decorator recording each call of a function as a child span"""
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if current_span.get() is None:
+                return function(*args, **kwargs)
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def follow_future(name: str, future, **attributes):
+    """
+    Child span covering a concurrent.futures.Future until it resolves
+
+    Used for fire-and-forget work (queued outbound sends) that completes
+    after the turn itself has finished; the span is exported on its own.
+    """
+    parent = current_span.get()
+    if parent is None:
+        return
+    child = Span(name, parent, attributes)
+
+    def done(completed):
+        error = completed.exception()
+        if error is not None:
+            child.error = f"{type(error).__name__}: {error}"
+        tracer.finish(child)
+
+    future.add_done_callback(done)
+
+# ==================== EXPORTERS ====================
+
+class FileExporter:
+    """Append spans to a JSONL file, one span per line"""
+
+    def __init__(self, path: str = TRACE_FILE):
+        self.path = path
+
+    def export(self, spans: List[Span]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(s.to_dict(), ensure_ascii=False, default=str) + "\n" for s in spans))
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+class OtlpHttpExporter:
+    """POST spans to an OpenTelemetry collector (OTLP/HTTP with JSON encoding)"""
+
+    def __init__(self, endpoint: str = TRACE_OTLP_ENDPOINT, service_name: str = TRACE_SERVICE_NAME,
+                 timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+
+    def _span(self, s: Span) -> dict:
+        encoded = {
+            "traceId": s.trace_id,
+            "spanId": s.span_id,
+            "name": s.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in s.attributes.items() if value is not None
+            ],
+            "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+        }
+        if s.parent_id:
+            encoded["parentSpanId"] = s.parent_id
+        return encoded
+
+    def export(self, spans: List[Span]):
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": self.service_name}}
+            ]},
+            "scopeSpans": [{
+                "scope": {"name": "tracing"},
+                "spans": [self._span(s) for s in spans],
+            }],
+        }]}
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(payload, default=str).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+def make_exporter(kind: str = TRACE_EXPORTER):
+    if kind == "otlp":
+        return OtlpHttpExporter()
+    if kind == "file":
+        return FileExporter()
+    return None
+
+# ==================== TRACER ====================
+
+class Tracer:
+    """
+    Collects finished spans, exports them from a background thread and
+    keeps the last `report_window` turns for the per-state report
+    """
+
+    def __init__(self, enabled: bool = TRACING, exporter=None, sample_rate: float = TRACE_SAMPLE_RATE,
+                 flush_interval: float = TRACE_FLUSH_INTERVAL, queue_size: int = TRACE_QUEUE_SIZE,
+                 report_window: int = TRACE_REPORT_WINDOW):
+        self.enabled = enabled
+        self.exporter = exporter if exporter is not None else (make_exporter() if enabled else None)
+        self.sample_rate = sample_rate
+        self.flush_interval = flush_interval
+
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._turns: Deque[tuple] = deque(maxlen=report_window)
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Metrics
+        self.traces = 0
+        self.exported = 0
+        self.dropped = 0
+        self.export_errors = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        """Start exporting in a background thread"""
+        if not self.enabled or self.exporter is None or self.running:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+        logger.info("Tracing started", extra={
+            "event": "tracing.started", "exporter": type(self.exporter).__name__, "sample_rate": self.sample_rate
+        })
+
+    def stop(self):
+        """Stop the exporter thread after exporting queued spans"""
+        if not self.running:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def finish(self, span: Span):
+        span.end_ns = time.time_ns()
+        root = span.root
+        if span is root:
+            self.traces += 1
+            self._turns.append((span.attributes.get("state", "unknown"), span.duration_ms, span.children))
+        elif root.end_ns == 0:
+            root.children.append((span.name, span.duration_ms))
+        if self.exporter is not None:
+            try:
+                self._queue.put_nowait(span)
+            except queue.Full:
+                self.dropped += 1
+
+    def _run(self):
+        while not self._stopping.wait(self.flush_interval):
+            self._export_pending()
+        self._export_pending()
+
+    def _export_pending(self):
+        while True:
+            batch = []
+            while len(batch) < EXPORT_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            try:
+                self.exporter.export(batch)
+                self.exported += len(batch)
+            except Exception:
+                self.export_errors += 1
+                logger.exception("Trace export failed", extra={"event": "tracing.export_failed", "spans": len(batch)})
+
+    def report(self) -> List[dict]:
+        return summarize(list(self._turns))
+
+    def stats(self) -> dict:
+        """Tracer counters and the per-state report of recent turns"""
+        return {
+            "enabled": self.enabled,
+            "exporter": type(self.exporter).__name__ if self.exporter is not None else None,
+            "sample_rate": self.sample_rate,
+            "traces": self.traces,
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "export_errors": self.export_errors,
+            "states": self.report(),
+        }
+
+tracer = Tracer()
+
+# ==================== REPORT ====================
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def summarize(turns: Iterable[tuple]) -> List[dict]:
+    """
+    Per-state latency from (state, duration_ms, [(span name, duration_ms)])
+    turns, slowest state (by total time) first, with the average time each
+    kind of child span adds to a turn in that state
+    """
+    durations: Dict[str, List[float]] = defaultdict(list)
+    children: Dict[str, Dict[str, List[float]]] = defaultdict(lambda: defaultdict(list))
+    for state, duration_ms, spans in turns:
+        durations[state].append(duration_ms)
+        for name, child_ms in spans:
+            children[state][name].append(child_ms)
+
+    report = []
+    for state, values in durations.items():
+        values.sort()
+        count = len(values)
+        report.append({
+            "state": state,
+            "turns": count,
+            "total_ms": round(sum(values), 2),
+            "mean_ms": round(sum(values) / count, 3),
+            "p50_ms": round(_percentile(values, 0.50), 3),
+            "p95_ms": round(_percentile(values, 0.95), 3),
+            "max_ms": round(values[-1], 3),
+            "spans": {
+                name: {"count": len(times), "mean_ms_per_turn": round(sum(times) / count, 3)}
+                for name, times in sorted(children[state].items(), key=lambda item: -sum(item[1]))
+            },
+        })
+    report.sort(key=lambda entry: -entry["total_ms"])
+    return report
+
+def turns_from_spans(spans: Iterable[dict]) -> List[tuple]:
+    """Rebuild (state, duration_ms, children) turns from exported span dicts"""
+    roots: Dict[str, dict] = {}
+    descendants: Dict[str, List[tuple]] = defaultdict(list)
+    for s in spans:
+        if s["parent_id"] is None:
+            roots[s["trace_id"]] = s
+        else:
+            descendants[s["trace_id"]].append((s["name"], s["duration_ms"]))
+    return [
+        (root["attributes"].get("state", "unknown"), root["duration_ms"], descendants[trace_id])
+        for trace_id, root in roots.items()
+    ]
+
+def print_report(report: List[dict]):
+    print(f"{'state':<20} {'turns':>7} {'total ms':>10} {'mean':>8} {'p50':>8} {'p95':>8} {'max':>8}")
+    for entry in report:
+        print(f"{entry['state']:<20} {entry['turns']:>7} {entry['total_ms']:>10.1f} {entry['mean_ms']:>8.2f} "
+              f"{entry['p50_ms']:>8.2f} {entry['p95_ms']:>8.2f} {entry['max_ms']:>8.2f}")
+        for name, child in entry["spans"].items():
+            print(f"    {name:<28} x{child['count']:<6} {child['mean_ms_per_turn']:>8.2f} ms/turn")
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else TRACE_FILE
+    with open(path, encoding="utf-8") as f:
+        print_report(summarize(turns_from_spans(json.loads(line) for line in f if line.strip())))
@@ -1,6 +1,11 @@
+import logging
 import os
+import time
 from twilio.rest import Client
 from dotenv import load_dotenv
+from outbound_sender import OutboundSender
+import metrics
+import tracing
 
 # Load environment variables
 load_dotenv()
@@ -10,9 +15,15 @@ ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
 AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
 TWILIO_WHATSAPP_NUMBER = os.getenv('TWILIO_WHATSAPP_NUMBER')
 
-# Initialize Twilio client
+logger = logging.getLogger(__name__)
+
+# Initialize Twilio client (blocking fallback when the async sender isn't running)
 client = Client(ACCOUNT_SID, AUTH_TOKEN)
 
+# Async outbound sender - started and stopped with the FastAPI app
+sender = OutboundSender(ACCOUNT_SID, AUTH_TOKEN, TWILIO_WHATSAPP_NUMBER)
+
+@tracing.traced("whatsapp.send")
 def send_whatsapp_message(to_number: str, message_body: str) -> bool:
     """
     Send a WhatsApp message to a customer
@@ -22,24 +33,38 @@ def send_whatsapp_message(to_number: str, message_body: str) -> bool:
         message_body: The message text to send
     
     Returns:
-        bool: True if message sent successfully, False otherwise
+        bool: True if message was queued or sent successfully, False otherwise
     """
     try:
         # Ensure the number has the whatsapp: prefix
         if not to_number.startswith('whatsapp:'):
             to_number = f'whatsapp:{to_number}'
         
-        message = client.messages.create(
-            from_=TWILIO_WHATSAPP_NUMBER,
-            body=message_body,
-            to=to_number
-        )
+        # Fire and forget - the sender logs the delivery result
+        if sender.running:
+            future = sender.submit(to_number, message_body)
+            tracing.set_attributes(mode="async")
+            tracing.follow_future("whatsapp.deliver", future)
+            return True
+        
+        tracing.set_attributes(mode="sync")
+        started_at = time.perf_counter()
+        try:
+            message = client.messages.create(
+                from_=TWILIO_WHATSAPP_NUMBER,
+                body=message_body,
+                to=to_number
+            )
+        except Exception:
+            metrics.whatsapp_send_duration_seconds.observe(time.perf_counter() - started_at, "sync", "failed")
+            raise
+        metrics.whatsapp_send_duration_seconds.observe(time.perf_counter() - started_at, "sync", "sent")
         
-        print(f"✅ Message sent to {to_number} - SID: {message.sid}")
+        logger.info("Message sent", extra={"event": "message.sent", "to_number": to_number, "sid": message.sid})
         return True
     
     except Exception as e:
-        print(f"❌ Error sending message to {to_number}: {str(e)}")
+        logger.error("Error sending message", extra={"event": "message.send_failed", "to_number": to_number, "error": str(e)})
         return False
 
 def send_order_confirmation(to_number: str, order_id: int, items_summary: str, total_price: float):